@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Async (playwright.async_api) versions of the CodePen capture helpers.
+
+capture_bundle.capture_bundle / race_bundle, grade_ch1_codepen.simulate_console_with_js
+and batch_grade.try_capture are written as capture_steps generators; the functions
+here are their async shells: they open contexts the asyncio way and run the same
+generators with capture_steps.drive_async, so a capture made here takes the same
+steps and feeds the chapter graders exactly the same data as the serial path. They
+are used by batch_grade_async.py to keep many pages in flight at once.
+
+Every page load takes a slot from an optional HostLimiter so concurrency against
+codepen.io / cdpn.io stays bounded no matter how many submissions run at once, and
+waits for the host's rate_limit token bucket.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import browser_pool
+import capture_bundle
+import capture_cache
+import capture_planner
+import capture_steps
+import console_guard
+import dialog_script
+import grade_ch1_codepen as ch1
+import rate_limit
+import resource_policy
+import storage_state
+
+
+class HostLimiter:
+    """Cap simultaneous page loads per host with one asyncio.Semaphore each."""
+
+    def __init__(self, per_host: int = 4) -> None:
+        self.per_host = max(1, int(per_host))
+        self._sems: Dict[str, asyncio.Semaphore] = {}
+
+    @asynccontextmanager
+    async def slot(self, url: str, stats: Optional[Dict[str, Any]] = None) -> AsyncIterator[rate_limit.Navigation]:
+        host = (urlparse(url).hostname or "").lower()
+        sem = self._sems.get(host)
+        if sem is None:
+            sem = self._sems[host] = asyncio.Semaphore(self.per_host)
+        async with sem:
+            async with rate_limit.navigation_async(url, stats) as nav:
+                yield nav
+
+
+def _slot(limiter: Optional[HostLimiter], url: str, stats: Optional[Dict[str, Any]] = None):
+    return limiter.slot(url, stats) if limiter else rate_limit.navigation_async(url, stats)
+
+
+async def open_page(
+    v: capture_bundle.Visit,
+    pool: browser_pool.AsyncBrowserPool,
+    policy: Optional[resource_policy.ResourcePolicy],
+    dialogs: Optional[dialog_script.Answers],
+    timeout: float,
+) -> Any:
+    """Async twin of capture_bundle.open_page."""
+    await resource_policy.install_async(v.context, policy, v.stats)
+    storage_state.note(v.stats, pool, v.context)
+    await dialog_script.install_async(v.context, dialogs)
+    await console_guard.install_async(v.context, timeout)
+    v.page = await v.context.new_page()
+    if "console" in v.bundle["parts"]:
+        v.page.on("console", v.on_console)
+    resource_policy.watch_page(v.page, v.stats)
+    v.detector.attach(v.page)
+    return v.page
+
+
+async def capture_bundle_async(
+    url: str,
+    pool: browser_pool.AsyncBrowserPool,
+    parts: Iterable[str] = capture_bundle.DEFAULT_PARTS,
+    timeout: float = 10.0,
+    idle: float = console_guard.DEFAULT_IDLE_SECONDS,
+    limiter: Optional[HostLimiter] = None,
+    policy: Optional[resource_policy.ResourcePolicy] = resource_policy.DEFAULT_POLICY,
+    stats: Optional[Dict[str, Any]] = None,
+    dialogs: Optional[dialog_script.Answers] = None,
+) -> Dict[str, Any]:
+    """Async twin of capture_bundle.capture_bundle: one visit, requested parts only."""
+    v = capture_bundle.Visit("visit", url, parts)
+    v.stats = stats
+    async with _slot(limiter, url, stats) as v.nav:
+        async with pool.context() as v.context:
+            await open_page(v, pool, policy, dialogs, timeout)
+            deadline = time.time() + timeout
+            await v.page.goto(url, wait_until="domcontentloaded")
+            await capture_steps.drive_async(capture_bundle.settle_steps(v, timeout, idle, deadline))
+    v.bundle["lines"] = v.lines()
+    v.bundle["truncated"] = v.raw_lines.dropped
+    return v.bundle
+
+
+async def race_bundle_async(
+    targets: List[Tuple[str, str]],
+    pool: browser_pool.AsyncBrowserPool,
+    parts: Iterable[str] = capture_bundle.DEFAULT_PARTS,
+    timeout: float = 10.0,
+    idle: float = console_guard.DEFAULT_IDLE_SECONDS,
+    limiter: Optional[HostLimiter] = None,
+    policy: Optional[resource_policy.ResourcePolicy] = resource_policy.DEFAULT_POLICY,
+    net: Optional[Dict[str, Dict[str, Any]]] = None,
+    dialogs: Optional[dialog_script.Answers] = None,
+) -> Tuple[Optional[str], Dict[str, Any]]:
+    """Async twin of capture_bundle.race_bundle."""
+    racers = [capture_bundle.Visit(mode, url, parts) for mode, url in targets]
+    end = time.time() + timeout
+
+    async with AsyncExitStack() as stack:
+        for r in racers:
+            try:
+                r.stats = resource_policy.meter(net, r.mode)
+                r.nav = await stack.enter_async_context(_slot(limiter, r.url, r.stats))
+                r.context = await stack.enter_async_context(pool.context())
+                await open_page(r, pool, policy, dialogs, timeout)
+                await r.page.goto(r.url, wait_until="commit")
+                r.alive = True
+            except Exception as e:
+                r.fail(e)
+        return await capture_steps.drive_async(capture_bundle.race_steps(racers, end, idle))
+
+
+async def simulate_console_with_js(
+    js_code: str,
+    pool: browser_pool.AsyncBrowserPool,
+    timeout: float = 5.0,
+    virtual_time: bool = False,
+    max_steps: int = ch1.DEFAULT_VIRTUAL_STEPS,
+    dialogs: Optional[dialog_script.Answers] = None,
+    flags: Optional[Dict[str, Any]] = None,
+) -> List[str]:
+    """Async twin of grade_ch1_codepen.simulate_console_with_js."""
+    lines = console_guard.ConsoleBuffer()
+    outcome: Dict[str, Any] = {"killed": None}
+    try:
+        async with pool.context() as context:
+            await capture_steps.drive_async(ch1.simulation_steps(
+                context, lines, outcome, js_code, timeout, virtual_time, max_steps, dialogs,
+            ))
+    except Exception:
+        pass
+    return ch1.simulation_lines(lines, outcome, flags)
+
+
+async def try_capture(
+    url: str,
+    timeout: float,
+    pool: browser_pool.AsyncBrowserPool,
+    idle: float = console_guard.DEFAULT_IDLE_SECONDS,
+    limiter: Optional[HostLimiter] = None,
+    cache: Optional[capture_cache.CaptureCache] = None,
+    policy: Optional[resource_policy.ResourcePolicy] = resource_policy.DEFAULT_POLICY,
+    net: Optional[Dict[str, Dict[str, Any]]] = None,
+    parts: Tuple[str, ...] = capture_bundle.DEFAULT_PARTS,
+    dbg: Optional[str] = None,
+    race: bool = False,
+    virtual_time: bool = False,
+    dialogs: Optional[dialog_script.Answers] = None,
+    simulate: bool = True,
+    planner: Optional[capture_planner.Planner] = None,
+) -> Dict[str, Any]:
+    """Async twin of batch_grade.try_capture: direct -> Debug View -> simulated (or a race)."""
+    parts = capture_bundle.normalize_parts(parts)
+
+    async def act(kind: str, *args: Any) -> Any:
+        if kind == capture_bundle.RACE:
+            return await race_bundle_async(
+                args[0], pool, parts, timeout=timeout, idle=idle, limiter=limiter, policy=policy,
+                net=net, dialogs=dialogs,
+            )
+        if kind == capture_bundle.VISIT:
+            mode, target = args
+            return await capture_bundle_async(
+                target, pool, parts, timeout=timeout, idle=idle, limiter=limiter, policy=policy,
+                stats=resource_policy.meter(net, mode), dialogs=dialogs,
+            )
+        code_js, flags = args
+        return await simulate_console_with_js(
+            code_js, pool, timeout=6.0, virtual_time=virtual_time, dialogs=dialogs, flags=flags,
+        )
+
+    return await capture_steps.drive_async(capture_bundle.try_capture_steps(
+        url, parts, cache=cache, dbg=dbg, race=race, virtual_time=virtual_time, dialogs=dialogs,
+        simulate=simulate, planner=planner,
+    ), act)
@@ -3,42 +3,60 @@
 Batch grade CodePen submissions for multiple assignments.
 
 Detects the chapter from the Canvas submission's <h1> (e.g., "Ch. 2 - ...") and
-invokes the appropriate grader. Currently supports:
+invokes the grader registered for it in grader_registry. Currently supports:
   - Ch. 1 (console skills)
   - Ch. 2 (variables, swap, increment)
+  - Ch. 3 (conditions and switch)
+  - Ch. 4 (loops)
+  - Ch. 5 (functions)
+  - Ch. 6 (objects)
+  - Ch. 7 & 8 (arrays and strings)
+  - Ch. 9 (classes and methods)
+  - Ch. 10 (functional programming)
+  - Ch. 12 (personal portfolio: console plus page DOM/HTML/CSS)
 
 Outputs CSV or JSON with a row per submission including score and context.
 
 Usage:
   scripts/.venv/bin/python scripts/batch_grade.py --dir Submissions --out grades.csv
+  scripts/.venv/bin/python scripts/batch_grade.py --dir Submissions --concurrency 6 --out grades.csv
+  scripts/.venv/bin/python scripts/batch_grade.py --dir Submissions --workers 4 --out grades.csv
 """
 
 from __future__ import annotations
 
 import argparse
-import csv
-import json
 import os
 import re
 import sys
-from typing import Any, Dict, List, Optional, Tuple
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 if SCRIPT_DIR not in sys.path:
     sys.path.insert(0, SCRIPT_DIR)
 
+import block_detector
+import browser_pool
+import capture_archive
+import capture_cache
+import capture_planner
+import console_guard
+import dialog_script
+import grader_registry
 import parse_canvas_submissions as pcs
-import grade_ch1_codepen as ch1
-import grade_ch2_codepen as ch2
-import grade_ch3_codepen as ch3
-import grade_ch4_codepen as ch4
-import grade_ch5_codepen as ch5
-import grade_ch6_codepen as ch6
-import grade_ch7_8_codepen as ch7_8
-import grade_ch9_codepen as ch9
-import grade_ch10_codepen as ch10
-import grade_ch12_codepen as ch12
+import pen_dedup
+import progress_journal
+import row_writer
+import rate_limit
+import resource_policy
+import retry_queue
+import storage_state
+
+
+# Called with (submission path, graded row) as each row finishes: journal, streaming output.
+RowHook = Callable[[str, Dict[str, Any]], None]
 
 
 def detect_chapters(assignment: Optional[str]) -> List[int]:
@@ -48,214 +66,818 @@ def detect_chapters(assignment: Optional[str]) -> List[int]:
     return nums
 
 
-def try_capture(url: str, timeout: float) -> Tuple[List[str], Optional[str], List[str], Optional[str]]:
-    """Return (console_lines, code_js, steps, error)"""
-    steps: List[str] = []
-    err: Optional[str] = None
-    lines: List[str] = []
-    code_js: Optional[str] = None
+def try_capture(
+    url: str,
+    timeout: float,
+    pool: Optional[browser_pool.BrowserPool] = None,
+    idle: float = console_guard.DEFAULT_IDLE_SECONDS,
+    cache: Optional[capture_cache.CaptureCache] = None,
+    policy: Optional[resource_policy.ResourcePolicy] = resource_policy.DEFAULT_POLICY,
+    net: Optional[Dict[str, Dict[str, Any]]] = None,
+    parts: Optional[Tuple[str, ...]] = None,
+    dbg: Optional[str] = None,
+    race: bool = False,
+    virtual_time: bool = False,
+    dialogs: Optional[dialog_script.Answers] = None,
+    simulate: bool = True,
+    planner: Optional[capture_planner.Planner] = None,
+) -> Dict[str, Any]:
+    """Capture `parts` (console+js by default) for a pen: direct -> Debug View -> simulated.
+
+    Returns a capture bundle.
+
+    Each visit collects every requested part at once; the Debug View is only loaded when
+    the direct visit left the console empty/blocked or the DOM metrics missing. With
+    `race`, direct and Debug View load side by side (capture_bundle.race_bundle) and the
+    first with non-blocked console output wins; the step 'race:<mode>' records the winner
+    and a cancelled path is only revisited if the winner left the bundle incomplete. Page loads
+    go through `policy`; when `net` is a dict, each fresh (uncached) visit records its
+    resource_policy stats under its mode ('direct', 'debug'). With `virtual_time` the
+    simulated fallback fast-forwards timers instead of sleeping (step 'simulated:vt').
+    `dialogs` (the grader's DIALOG_ANSWERS) answers prompt()/confirm() on every path and
+    is part of the cache key. `simulate=False` leaves the simulated fallback to the caller
+    (bulk_simulate_captures). A `planner` may put Debug View first (step 'plan:...') and
+    learns from every fresh direct/debug visit.
+    """
+    # The capture stack (and the ch1 grader it is built on) loads on the first capture only.
+    import capture_bundle
+    import capture_steps
+    import grade_ch1_codepen as ch1
+
+    parts = capture_bundle.normalize_parts(parts)
+
+    def act(kind: str, *args: Any) -> Any:
+        if kind == capture_bundle.RACE:
+            return capture_bundle.race_bundle(
+                args[0], parts, timeout=timeout, pool=pool, idle=idle, policy=policy, net=net, dialogs=dialogs,
+            )
+        if kind == capture_bundle.VISIT:
+            mode, target = args
+            return capture_bundle.capture_bundle(
+                target, parts, timeout=timeout, pool=pool, idle=idle, policy=policy,
+                stats=resource_policy.meter(net, mode), dialogs=dialogs,
+            )
+        code_js, flags = args
+        return ch1.simulate_console_with_js(
+            code_js, timeout=6.0, pool=pool, virtual_time=virtual_time, dialogs=dialogs, flags=flags,
+        )
+
+    return capture_steps.drive(capture_bundle.try_capture_steps(
+        url, parts, cache=cache, dbg=dbg, race=race, virtual_time=virtual_time, dialogs=dialogs,
+        simulate=simulate, planner=planner,
+    ), act)
+
+
+def capture_parts_for(chapter: Optional[int]) -> Tuple[str, ...]:
+    """Capture parts the chapter's grader declares (CAPTURE_PARTS), console+js by default."""
+    grader = grader_registry.lookup(chapter)
+    if grader is not None:
+        return grader.parts
+    import capture_bundle
+
+    return capture_bundle.DEFAULT_PARTS
+
+
+def dialog_answers_for(chapter: Optional[int]) -> Tuple[dialog_script.Answer, ...]:
+    """prompt()/confirm() answers the chapter's grader declares (DIALOG_ANSWERS), none by default."""
+    grader = grader_registry.lookup(chapter)
+    return grader.dialogs if grader is not None else ()
+
+
+def new_record(meta: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[int]]:
+    """Build the output row skeleton for a parsed submission. Returns (rec, chapter)."""
+    assign = meta.get('assignment') or ''
+    chapters = detect_chapters(assign)
+    chapter = chapters[0] if chapters else None
+    rec: Dict[str, Any] = {
+        'file': meta.get('file'),
+        'username': meta.get('username'),
+        'late': meta.get('late'),
+        'student_id': meta.get('student_id'),
+        'assignment': assign,
+        'chapter': chapter if chapter is not None else '',
+        'best_url': meta.get('best_url'),
+        'debug_url': meta.get('debug_url'),
+        'pen_url': meta.get('pen_url') or pcs.canonical_pen_url(meta.get('best_url')),
+    }
+    return rec, chapter
+
+
+def grade_chapter(
+    chapter: Optional[int],
+    lines: List[str],
+    code_js: Optional[str],
+    errors: Optional[str],
+    metrics: Optional[Dict[str, Any]] = None,
+    css_text: Optional[str] = None,
+) -> Tuple[Dict[str, Any], Optional[str]]:
+    """Score captured data with the chapter's grader. Returns (result, errors)."""
+    grader = grader_registry.lookup(chapter)
+    if grader is None:
+        errors = (errors + '; unsupported assignment') if errors else 'unsupported assignment'
+        return {'total': 0, 'possible': 25}, errors
+    return grader.grade(lines, code_js, metrics=metrics, css_text=css_text), errors
 
+
+def finish_record(rec: Dict[str, Any], result: Dict[str, Any], steps: List[str], errors: Optional[str]) -> Dict[str, Any]:
+    """Copy score, capture diagnostics and notes into the output row."""
+    # Build notes summarizing missing items, when available
     try:
-        l1, js1 = ch1.capture_console_from_codepen(url, timeout=timeout)
-        lines = l1
-        code_js = js1
-        steps.append('direct')
-    except Exception as e:
-        err = f"direct: {e}"
-
-    if (not lines) or ch1.looks_blocked(lines):
-        dbg = ch1.derive_debug_url(url)
-        if dbg:
+        # Every grader that reports checks is built on ch1, so this import is already loaded.
+        import grade_ch1_codepen as ch1
+
+        notes = ch1.summarize_notes(result.get('checks', [])) if 'checks' in result else ''
+    except Exception:
+        notes = ''
+    # Tell the student first when their output was cut off (console_guard.annotate).
+    output_note = result.get('meta', {}).get('output_note')
+    if output_note:
+        notes = f"{output_note} | {notes}" if notes else output_note
+
+    rec.update({
+        'total': result.get('total', 0),
+        'possible': result.get('possible', 25),
+        'captured_lines': result.get('meta', {}).get('captured_lines', ''),
+        'code_available': result.get('meta', {}).get('code_available', ''),
+        'attempt_steps': ';'.join(steps),
+        'errors': errors or '',
+        'notes': notes,
+    })
+    return rec
+
+
+def new_capture(meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Empty capture record for a parsed submission (also the archive document layout)."""
+    return {
+        'meta': meta,
+        'lines': [],
+        'code_js': None,
+        'metrics': None,
+        'html': None,
+        'css': None,
+        'steps': [],
+        'errors': None,
+        'truncated': 0,
+        'killed': None,
+        'net': {},
+        'started': time.time(),
+        'finished': None,
+    }
+
+
+def apply_bundle(cap: Dict[str, Any], bundle: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy a capture bundle's parts into a capture record."""
+    cap.update({
+        'lines': bundle['lines'],
+        'code_js': bundle['js'],
+        'metrics': bundle['metrics'],
+        'html': bundle['html'],
+        'css': bundle['css'],
+        'steps': bundle['steps'],
+        'errors': bundle['error'],
+        'truncated': bundle.get('truncated') or 0,
+        'killed': bundle.get('killed'),
+    })
+    return cap
+
+
+def dedup_key(meta: Dict[str, Any], chapter: Optional[int]) -> Optional[str]:
+    """Key under which submissions share one capture: the pen plus its capture parts and answers."""
+    pen = pcs.pen_key(meta.get('best_url'))
+    if not pen:
+        return None
+    grader = grader_registry.lookup(chapter)
+    tag = grader.capture_tag if grader is not None else ''
+    return f"{pen}|{tag}"
+
+
+def capture_file(
+    path: str,
+    args: argparse.Namespace,
+    pool: Optional[browser_pool.BrowserPool] = None,
+    cache: Optional[capture_cache.CaptureCache] = None,
+    dedup: Optional[pen_dedup.PenDedup] = None,
+) -> Dict[str, Any]:
+    """Parse one Canvas submission file and capture everything its grader needs.
+
+    With `dedup`, a pen already captured in this run is shared instead of loaded again.
+    """
+    meta = pcs.parse_submission_file(path)
+    _rec, chapter = new_record(meta)
+
+    def run() -> Dict[str, Any]:
+        cap = new_capture(meta)
+        url = meta.get('best_url')
+        if url:
+            policy = resource_policy.policy_for_chapter(chapter, getattr(args, 'block_resources', True))
             try:
-                l2, js2 = ch1.capture_console_from_codepen(dbg, timeout=timeout)
-                if l2:
-                    lines = l2
-                if js2:
-                    code_js = js2
-                steps.append('debug')
-            except Exception as e2:
-                err = (err + f"; debug: {e2}") if err else f"debug: {e2}"
-
-    if code_js and ((not lines) or ch1.looks_blocked(lines)):
+                bundle = try_capture(
+                    url, timeout=args.timeout, pool=pool, idle=args.idle, cache=cache, policy=policy,
+                    net=cap['net'], parts=capture_parts_for(chapter), dbg=meta.get('debug_url'),
+                    race=getattr(args, 'race', False), virtual_time=getattr(args, 'virtual_time', False),
+                    dialogs=dialog_answers_for(chapter), simulate=not getattr(args, 'bulk_simulate', False),
+                    planner=capture_planner.from_args(args),
+                )
+                apply_bundle(cap, bundle)
+            except Exception as e:
+                cap['errors'] = str(e)
+        cap['finished'] = time.time()
+        return cap
+
+    if dedup is None:
+        return run()
+    return dedup.capture(dedup_key(meta, chapter), meta, run)
+
+
+def grade_capture(cap: Dict[str, Any], retry: bool = True) -> Dict[str, Any]:
+    """Grade a capture record (fresh or read back from an archive) into an output row.
+
+    `retry=False` (archives: nothing is re-captured) skips classifying the capture's failure.
+    """
+    meta = cap.get('meta') or {}
+    rec, chapter = new_record(meta)
+    if not meta.get('best_url'):
+        rec.update({'total': 0, 'possible': 25, 'errors': 'No URL found'})
+        return rec
+    lines = list(cap.get('lines') or [])
+    steps = list(cap.get('steps') or [])
+    result, errors = grade_chapter(
+        chapter, lines, cap.get('code_js'), cap.get('errors'),
+        metrics=cap.get('metrics'), css_text=cap.get('css'),
+    )
+    rec['network'] = cap.get('net') or {}
+    rec['truncated'] = cap.get('truncated') or 0
+    rec['killed'] = cap.get('killed') or ''
+    console_guard.annotate(result, rec['killed'], rec['truncated'])
+    # Internal: read (and removed) by retry_failed / strip_internal before output.
+    rec['_retry'] = retry_reason(cap) if retry else None
+    return finish_record(rec, result, steps, errors)
+
+
+# Capture errors that are worth another try later rather than a broken URL.
+TIMEOUT_RE = re.compile(r'timeout|timed out|ERR_TIMED_OUT|ERR_CONNECTION_(?:RESET|CLOSED|REFUSED)', re.I)
+
+
+def retry_reason(cap: Dict[str, Any]) -> Optional[str]:
+    """How a capture failed (one of retry_queue.REASONS), or None when it did not."""
+    meta = cap.get('meta') or {}
+    _rec, chapter = new_record(meta)
+    if not meta.get('best_url') or grader_registry.lookup(chapter) is None:
+        return None
+    import capture_bundle
+    import grade_ch1_codepen as ch1
+
+    lines = cap.get('lines') or []
+    steps = cap.get('steps') or []
+    if cap.get('errors') and not lines and not cap.get('metrics'):
+        return 'timeout' if TIMEOUT_RE.search(cap['errors']) else 'error'
+    blocked = any(s.startswith('blocked:') for s in steps) or ch1.looks_blocked(lines)
+    # A block is only worth a retry when nothing gradeable came back: the other page or the
+    # simulated fallback delivering console lines already graded the pen.
+    if blocked and (not lines or ch1.looks_blocked(lines)):
+        return 'blocked'
+    bundle = {'parts': capture_parts_for(chapter), 'lines': lines, 'metrics': cap.get('metrics')}
+    if not capture_bundle.is_complete(bundle):
+        return 'incomplete'
+    return None
+
+
+def merge_attempt(old: Dict[str, Any], new: Dict[str, Any], attempt: int, reason: str) -> Dict[str, Any]:
+    """Keep the better-scoring row of two attempts; attempt_steps records both."""
+    keep = new if new.get('total', 0) >= old.get('total', 0) else old
+    history = [s for s in (old.get('attempt_steps'), f"retry{attempt}:{reason}", new.get('attempt_steps')) if s]
+    keep['attempt_steps'] = ';'.join(history)
+    return keep
+
+
+def retry_failed(
+    files: List[str],
+    rows: List[Dict[str, Any]],
+    args: argparse.Namespace,
+    on_row: Optional[RowHook] = None,
+    pool: Optional[browser_pool.BrowserPool] = None,
+) -> List[Dict[str, Any]]:
+    """Re-capture failed submissions after the main pass (--retries, --retry-delay, --retry-on).
+
+    Rows are index-aligned with `files`; only rows whose failure is in --retry-on are retried.
+    Retries run in rounds, one per attempt number, each through the same driver as the main
+    pass (grade_batch: --workers, --concurrency, --bulk-simulate or serial) with the timeout
+    raised by half of --timeout per attempt; the better-scoring attempt wins (--archive holds
+    the latest attempt). With a caller-supplied `pool` (--watch) rounds run serially on it
+    and it is left open.
+    """
+    retry_on = retry_reasons(args)
+    queue = retry_queue.RetryQueue(max_attempts=args.retries + 1, base_delay=args.retry_delay)
+    for i, row in enumerate(rows):
+        reason = row.pop('_retry', None)
+        if reason in retry_on:
+            queue.push(i, 1, reason)
+    if not len(queue):
+        return rows
+
+    cache = capture_cache.from_args(args) if pool is not None else None
+    while len(queue):
+        batch = queue.pop_round()
+        attempt = batch[0][1]
+        retry_args = argparse.Namespace(**vars(args))
+        retry_args.timeout = args.timeout * (1 + 0.5 * (attempt - 1))
+        paths = [files[i] for i, _n, _reason in batch]
+        if pool is not None:
+            # Duplicates of a failed pen fail together; share each round's re-capture among them.
+            dedup = pen_dedup.from_args(args)
+            new_rows = [grade_file(p, retry_args, pool=pool, cache=cache, dedup=dedup) for p in paths]
+        else:
+            new_rows = grade_batch(paths, retry_args)
+        for (i, _n, reason), row in zip(batch, new_rows):
+            again = row.pop('_retry', None)
+            kept = merge_attempt(rows[i], row, attempt, reason)
+            rows[i] = kept
+            if again in retry_on and queue.push(i, attempt, again):
+                kept['_retry'] = again
+            if on_row is not None:
+                on_row(files[i], kept)
+    print(queue.summary(), file=sys.stderr)
+    return rows
+
+
+def retry_reasons(args: argparse.Namespace) -> Tuple[str, ...]:
+    """Failure kinds this run retries (none with --retries 0 or --from-archive)."""
+    if getattr(args, 'from_archive', None) or getattr(args, 'retries', 0) <= 0:
+        return ()
+    return tuple(getattr(args, 'retry_on', None) or retry_queue.DEFAULT_RETRY_ON)
+
+
+def strip_internal(rows: List[Dict[str, Any]]) -> None:
+    for row in rows:
+        row.pop('_retry', None)
+
+
+def grade_file(
+    path: str,
+    args: argparse.Namespace,
+    pool: Optional[browser_pool.BrowserPool] = None,
+    cache: Optional[capture_cache.CaptureCache] = None,
+    dedup: Optional[pen_dedup.PenDedup] = None,
+    on_row: Optional[RowHook] = None,
+) -> Dict[str, Any]:
+    """Parse, capture and grade one Canvas submission file (serial path)."""
+    cap = capture_file(path, args, pool=pool, cache=cache, dedup=dedup)
+    if getattr(args, 'archive', None):
+        capture_archive.write_archive(args.archive, cap)
+    row = grade_capture(cap)
+    if on_row is not None:
+        on_row(path, row)
+    return row
+
+
+def add_capture_error(cap: Dict[str, Any], message: str) -> None:
+    cap['errors'] = f"{cap['errors']}; {message}" if cap.get('errors') else message
+
+
+def bulk_simulate_captures(
+    caps: List[Dict[str, Any]],
+    args: argparse.Namespace,
+    pool: Optional[browser_pool.BrowserPool] = None,
+    cache: Optional[capture_cache.CaptureCache] = None,
+) -> int:
+    """Run the simulated fallback for every capture that needs it in one page (--bulk-simulate).
+
+    Captures whose console is missing or blocked get their JS simulated by
+    bulk_simulate.simulate_many (one worker per submission, tagged by file name) and a
+    'simulated:bulk' step, as try_capture would have done pen by pen. Cached simulations
+    are reused. Returns the number of scripts actually run.
+    """
+    import bulk_simulate
+    import capture_bundle
+    import grade_ch1_codepen as ch1
+
+    virtual_time = getattr(args, 'virtual_time', False)
+    step = 'simulated:bulk:vt' if virtual_time else 'simulated:bulk'
+    pending: Dict[str, Tuple[Dict[str, Any], str]] = {}
+    answers: Dict[str, dialog_script.Answers] = {}
+    for i, cap in enumerate(caps):
+        meta = cap.get('meta') or {}
+        _rec, chapter = new_record(meta)
+        if not meta.get('best_url') or not capture_bundle.needs_simulation(
+            capture_parts_for(chapter), cap.get('lines'), cap.get('code_js'),
+        ):
+            continue
+        dialogs = dialog_answers_for(chapter)
+        extra = capture_bundle.simulation_tag(cap['code_js'], virtual_time, dialogs, engine='bulk')
+        hit = capture_cache.get_console(cache, meta['best_url'], 'simulated', extra)
+        if hit is not None:
+            cap['lines'] = hit[0]
+            cap['steps'].append(step)
+            continue
+        sub_id = meta.get('file') or str(i)
+        pending[sub_id] = (cap, extra)
+        answers[sub_id] = dialogs
+
+    results = bulk_simulate.simulate_many(
+        [(sub_id, cap['code_js']) for sub_id, (cap, _extra) in pending.items()],
+        pool=pool, timeout=6.0, parallel=getattr(args, 'bulk_parallel', None) or bulk_simulate.DEFAULT_PARALLEL,
+        virtual_time=virtual_time, dialogs=answers,
+    )
+    for sub_id, (cap, extra) in pending.items():
+        res = results.get(sub_id) or {'lines': [], 'truncated': 0, 'killed': None, 'error': 'not simulated'}
+        lines = res['lines']
+        if lines:
+            cap['lines'] = lines
+            cap['truncated'] = res['truncated']
+            if not ch1.looks_blocked(lines):
+                capture_cache.put_console(cache, cap['meta']['best_url'], 'simulated', lines, cap['code_js'], extra)
+        cap['steps'].append(step)
+        if res['killed']:
+            cap['killed'] = cap.get('killed') or res['killed']
+            if res['killed'] == 'timeout':
+                add_capture_error(cap, 'simulate: stopped by the 6 s watchdog')
+        if res['error']:
+            add_capture_error(cap, f"simulate: {res['error']}")
+    return len(pending)
+
+
+def grade_files_bulk(
+    files: List[str],
+    args: argparse.Namespace,
+    on_row: Optional[RowHook] = None,
+) -> List[Dict[str, Any]]:
+    """--bulk-simulate: capture every file, simulate all blocked pens together, then grade."""
+    cache = capture_cache.from_args(args)
+    pool = browser_pool.get_pool(max_uses=args.recycle_after, state_store=storage_state.from_args(args))
+    dedup = pen_dedup.from_args(args)
+    if args.concurrency > 1:
+        import batch_grade_async
+        caps = batch_grade_async.capture_files(files, args, cache=cache, dedup=dedup)
+    else:
+        caps = [capture_file(p, args, pool=pool, cache=cache, dedup=dedup) for p in files]
+    ran = bulk_simulate_captures(caps, args, pool=pool, cache=cache)
+    browser_pool.close_pool()
+    print(f"bulk simulate: {ran} script(s) run in one page", file=sys.stderr)
+    if cache:
+        print(cache.summary(), file=sys.stderr)
+    if dedup:
+        print(dedup.summary(), file=sys.stderr)
+
+    rows = []
+    for path, cap in zip(files, caps):
+        if getattr(args, 'archive', None):
+            capture_archive.write_archive(args.archive, cap)
+        rows.append(grade_capture(cap))
+        if on_row is not None:
+            on_row(path, rows[-1])
+    return rows
+
+
+def grade_batch(
+    files: List[str],
+    args: argparse.Namespace,
+    on_row: Optional[RowHook] = None,
+) -> List[Dict[str, Any]]:
+    """Grade `files` with the driver the flags select: --bulk-simulate, --workers, --concurrency or serial."""
+    if getattr(args, 'bulk_simulate', False):
+        return grade_files_bulk(files, args, on_row=on_row)
+    if args.workers > 1 and len(files) > 1:
+        return grade_files_parallel(files, args, on_row=on_row)
+    if args.concurrency > 1:
+        import batch_grade_async
+        return batch_grade_async.grade_files(files, args, on_row=on_row)
+    # One warm browser for the whole batch; each capture gets its own context.
+    pool = browser_pool.get_pool(max_uses=args.recycle_after, state_store=storage_state.from_args(args))
+    cache = capture_cache.from_args(args)
+    dedup = pen_dedup.from_args(args)
+    rows = [grade_file(p, args, pool=pool, cache=cache, dedup=dedup, on_row=on_row) for p in files]
+    browser_pool.close_pool()
+    if cache:
+        print(cache.summary(), file=sys.stderr)
+    if dedup:
+        print(dedup.summary(), file=sys.stderr)
+    return rows
+
+
+def grade_archives(root: str, pattern: str = '*') -> List[Dict[str, Any]]:
+    """Regrade every archived capture under `root`; never starts a browser or loads the capture code."""
+    return [grade_capture(cap, retry=False) for cap in capture_archive.iter_archives(root, pattern)]
+
+
+# Arguments for the current --workers process (set by _init_worker).
+_worker_args: Optional[argparse.Namespace] = None
+
+
+def _init_worker(args: argparse.Namespace) -> None:
+    global _worker_args
+    _worker_args = args
+    block_detector.add_signatures(getattr(args, 'block_signature', None))
+    # Each worker process gets an equal share of the per-host rates.
+    rate_limit.configure_from_args(args, share=args.workers)
+    # Pool workers skip atexit, so close this process's browser via a multiprocessing finalizer.
+    import multiprocessing.util
+    multiprocessing.util.Finalize(None, _close_worker, exitpriority=10)
+
+
+def _close_worker() -> None:
+    browser_pool.close_pool()
+    if 'batch_grade_async' in sys.modules:
+        sys.modules['batch_grade_async'].close_worker()
+
+
+def _grade_chunk(chunk: List[str]) -> List[Dict[str, Any]]:
+    args = _worker_args
+    assert args is not None
+    if args.concurrency > 1:
+        import batch_grade_async
+        return batch_grade_async.grade_chunk_in_worker(chunk, args)
+    pool = browser_pool.get_pool(max_uses=args.recycle_after, state_store=storage_state.from_args(args))
+    cache = capture_cache.from_args(args)
+    dedup = pen_dedup.from_args(args)
+    return [grade_file(p, args, pool=pool, cache=cache, dedup=dedup) for p in chunk]
+
+
+def chunk_indices(files: List[str], size: int, dedup: bool) -> List[List[int]]:
+    """Split file indices into chunks of about `size`; with `dedup`, one pen's files share a chunk."""
+    if not dedup:
+        return [list(range(i, min(i + size, len(files)))) for i in range(0, len(files), size)]
+    groups: Dict[str, List[int]] = {}
+    for i, path in enumerate(files):
         try:
-            sim = ch1.simulate_console_with_js(code_js, timeout=6.0)
-            if sim:
-                lines = sim
-            steps.append('simulated')
-        except Exception as e3:
-            err = (err + f"; simulate: {e3}") if err else f"simulate: {e3}"
+            meta = pcs.parse_submission_file(path)
+            key = dedup_key(meta, new_record(meta)[1]) or f'#{i}'
+        except Exception:
+            key = f'#{i}'
+        groups.setdefault(key, []).append(i)
+    chunks: List[List[int]] = [[]]
+    for group in groups.values():
+        if chunks[-1] and len(chunks[-1]) + len(group) > size:
+            chunks.append([])
+        chunks[-1].extend(group)
+    return [c for c in chunks if c]
+
+
+def grade_files_parallel(
+    files: List[str],
+    args: argparse.Namespace,
+    on_row: Optional[RowHook] = None,
+) -> List[Dict[str, Any]]:
+    """Shard files across a process pool; each worker owns its own browser.
+
+    Files are handed out in chunks of --concurrency (1 for serial workers), with every
+    submission of one pen in the same chunk under --dedup. Rows are put back in input
+    order, so the merged rows match a serial run.
+    """
+    size = max(1, args.concurrency)
+    index_chunks = chunk_indices(files, size, getattr(args, 'dedup', False))
+    chunks = [[files[i] for i in chunk] for chunk in index_chunks]
+    rows: List[Dict[str, Any]] = [{} for _ in files]
+    import multiprocessing
+    # spawn: Playwright's driver threads do not survive fork().
+    ctx = multiprocessing.get_context('spawn')
+    mp = ctx.Pool(processes=args.workers, initializer=_init_worker, initargs=(args,))
+    try:
+        for indices, chunk_rows in zip(index_chunks, mp.imap(_grade_chunk, chunks)):
+            for i, row in zip(indices, chunk_rows):
+                rows[i] = row
+                if on_row is not None:
+                    on_row(files[i], row)
+        mp.close()
+    except BaseException:
+        mp.terminate()
+        raise
+    finally:
+        mp.join()
+    return rows
+
+
+OUTPUT_FIELDS = [
+    'file','username','late','student_id','assignment','chapter','best_url','debug_url','pen_url',
+    'total','possible','captured_lines','code_available','attempt_steps','errors','notes','network',
+    'truncated','killed'
+]
 
-    return lines, code_js, steps, err
+
+def grade_new_files(
+    paths: List[str],
+    args: argparse.Namespace,
+    writer: row_writer.RowWriter,
+    journal: Optional[progress_journal.Journal],
+    pool: browser_pool.BrowserPool,
+    cache: Optional[capture_cache.CaptureCache],
+) -> List[Dict[str, Any]]:
+    """Grade one batch of --watch arrivals serially on the warm pool and append their rows."""
+    retry_on = retry_reasons(args)
+    stream = row_writer.OrderedStream(writer, len(paths), retry_on=retry_on)
+    position = {p: i for i, p in enumerate(paths)}
+
+    def on_row(path: str, row: Dict[str, Any]) -> None:
+        if journal is not None:
+            journal.record(path, row, pending=row.get('_retry') in retry_on)
+        stream.put(position[path], row)
+
+    rows = [grade_file(p, args, pool=pool, cache=cache, on_row=on_row) for p in paths]
+    if retry_on:
+        rows = retry_failed(paths, rows, args, on_row=on_row, pool=pool)
+    strip_internal(rows)
+    stream.finish(rows)
+    return rows
+
+
+def content_hash(path: str) -> Optional[str]:
+    try:
+        return progress_journal.file_hash(path)
+    except OSError:
+        return None
+
+
+def watch_submissions(
+    args: argparse.Namespace,
+    writer: row_writer.RowWriter,
+    journal: Optional[progress_journal.Journal],
+    handled: List[str],
+) -> None:
+    """--watch: grade submission files as they are added or changed, until Ctrl-C."""
+    import submission_watch
+
+    interval = args.watch_interval or submission_watch.DEFAULT_INTERVAL_S
+    watcher = submission_watch.Watcher(args.dir, args.glob, interval=interval)
+    watcher.mark(handled)
+    # Content hashes of graded files, to skip touched but unchanged ones when there is no journal.
+    hashes = {} if journal is not None else {p: content_hash(p) for p in handled}
+    pool = browser_pool.get_pool(max_uses=args.recycle_after, state_store=storage_state.from_args(args))
+    cache = capture_cache.from_args(args)
+    print(f"watching {os.path.join(args.dir, args.glob)} ({watcher.mode}); Ctrl-C to stop", file=sys.stderr)
+    try:
+        while True:
+            paths = watcher.changes()
+            if journal is not None:
+                # Touched but byte-identical files already have their row.
+                same = journal.completed(paths)
+                paths = [p for i, p in enumerate(paths) if i not in same]
+            else:
+                fresh = {p: content_hash(p) for p in paths}
+                paths = [p for p in paths if fresh[p] is None or hashes.get(p) != fresh[p]]
+                hashes.update(fresh)
+            if not paths:
+                continue
+            started = time.time()
+            rows = grade_new_files(paths, args, writer, journal, pool, cache)
+            print(f"watch: graded {len(rows)} submission(s) in {time.time() - started:.1f} s", file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        browser_pool.close_pool()
+
+
+def report_savings(rows: List[Dict[str, Any]], args: argparse.Namespace) -> None:
+    """--measure-savings: measured load time / bytes saved by the resource policy on sample pens."""
+    samples: List[Tuple[str, Optional[resource_policy.ResourcePolicy]]] = []
+    seen = set()
+    for row in rows:
+        url = row.get('best_url')
+        if not url or url in seen or len(samples) >= args.measure_savings:
+            continue
+        seen.add(url)
+        chapter = row.get('chapter') if isinstance(row.get('chapter'), int) else None
+        samples.append((url, resource_policy.policy_for_chapter(chapter)))
+    if not samples:
+        return
+    pool = browser_pool.get_pool(state_store=storage_state.from_args(args))
+    try:
+        results = resource_policy.measure_savings(pool, samples, timeout=args.timeout)
+    finally:
+        browser_pool.close_pool()
+    print(resource_policy.format_savings(results), file=sys.stderr)
+
+
+def csv_row(rec: Dict[str, Any], fieldnames: List[str]) -> Dict[str, Any]:
+    row = {k: rec.get(k, '') for k in fieldnames}
+    if 'network' in row:
+        row['network'] = resource_policy.format_stats(rec.get('network'))
+    return row
 
 
 def main(argv=None) -> int:
     ap = argparse.ArgumentParser(description='Batch grade CodePen submissions across assignments')
     ap.add_argument('--dir', default='Submissions', help='Directory with Canvas HTML link files')
     ap.add_argument('--glob', default='*.html', help='Glob pattern')
-    ap.add_argument('--timeout', type=float, default=14.0)
-    ap.add_argument('--format', choices=['csv','json'], default='csv')
+    ap.add_argument('--timeout', type=float, default=14.0, help='Max seconds to wait for console output')
+    ap.add_argument('--format', choices=['csv','json','jsonl'], default='csv',
+                    help='Output format; every format is written row by row as submissions finish')
     ap.add_argument('--out', default='-', help='Output file or - for stdout')
+    ap.add_argument('--idle', type=float, default=console_guard.DEFAULT_IDLE_SECONDS,
+                    help='Stop capturing after this many quiet console seconds once loaded (0 = full timeout)')
+    ap.add_argument('--recycle-after', type=int, default=browser_pool.DEFAULT_MAX_USES,
+                    help='Relaunch the shared Chromium after this many page contexts')
+    ap.add_argument('--concurrency', type=int, default=1,
+                    help='Grade this many submissions at once with the asyncio engine (1 = serial)')
+    ap.add_argument('--per-host', type=int, default=4,
+                    help='With --concurrency, max simultaneous page loads per host (codepen.io, cdpn.io), '
+                         'split among --workers processes')
+    ap.add_argument('--workers', type=int, default=1,
+                    help='Shard submissions across this many processes, each with its own browser')
+    ap.add_argument('--block-signature', action='append', default=[], metavar='TEXT',
+                    help='Extra text that marks a capture as blocked (repeatable; adds to block_detector.DEFAULT_SIGNATURES)')
+    ap.add_argument('--race', action='store_true',
+                    help='Load the direct and Debug View pages at once; keep the first with usable console output')
+    ap.add_argument('--virtual-time', action='store_true',
+                    help='Simulated fallback: fire setTimeout/setInterval on a virtual clock instead of waiting in real time')
+    ap.add_argument('--bulk-simulate', action='store_true',
+                    help='Defer JS simulation of blocked pens and run them all in one page, one worker each')
+    ap.add_argument('--bulk-parallel', type=int,
+                    help='With --bulk-simulate, simulation workers running at once (default: bulk_simulate.DEFAULT_PARALLEL)')
+    ap.add_argument('--block-resources', action=argparse.BooleanOptionalAction, default=True,
+                    help='Abort image/font/media/tracker requests during captures (ch12 keeps images and fonts)')
+    ap.add_argument('--measure-savings', type=int, default=0, metavar='N',
+                    help='After grading, load N sample pens with and without --block-resources and report the time and bytes saved')
+    ap.add_argument('--archive', metavar='DIR',
+                    help='Also write a compressed capture archive per submission to DIR')
+    ap.add_argument('--from-archive', metavar='DIR',
+                    help='Regrade archived captures from DIR (matching --glob) without a browser')
+    ap.add_argument('--retries', type=int, default=retry_queue.DEFAULT_RETRIES,
+                    help='Retry failed captures up to this many times after the main pass (0 = off)')
+    ap.add_argument('--retry-delay', type=float, default=retry_queue.DEFAULT_DELAY_S,
+                    help='Seconds before the first retry; doubles with each further attempt')
+    ap.add_argument('--retry-on', type=retry_queue.parse_reasons, default=retry_queue.DEFAULT_RETRY_ON,
+                    metavar='REASONS',
+                    help=f"Comma-separated failures to retry, from {','.join(retry_queue.REASONS)} "
+                         f"(default: {','.join(retry_queue.DEFAULT_RETRY_ON)})")
+    capture_cache.add_cache_args(ap)
+    capture_planner.add_planner_args(ap)
+    rate_limit.add_throttle_args(ap)
+    storage_state.add_state_args(ap)
+    pen_dedup.add_dedup_args(ap)
+    progress_journal.add_journal_args(ap)
+    ap.add_argument('--watch', action='store_true',
+                    help='After grading --dir, keep running and grade new or changed submission files as they arrive')
+    ap.add_argument('--watch-interval', type=float,
+                    help='With --watch, seconds between directory scans when inotify_simple is not installed '
+                         '(default: submission_watch.DEFAULT_INTERVAL_S)')
     args = ap.parse_args(argv)
+    if args.watch and (args.from_archive or args.format == 'json'):
+        ap.error('--watch appends rows: use --format csv or jsonl, without --from-archive')
+    block_detector.add_signatures(args.block_signature)
+    throttle = rate_limit.configure_from_args(args)
 
     import glob as _glob
     files = sorted(_glob.glob(os.path.join(args.dir, args.glob)))
-    rows: List[Dict[str, Any]] = []
+    rows: List[Dict[str, Any]]
 
-    for p in files:
-        meta = pcs.parse_submission_file(p)
-        assign = meta.get('assignment') or ''
-        chapters = detect_chapters(assign)
-        chapter = chapters[0] if chapters else None
-        url = meta.get('best_url')
-        dbg = meta.get('debug_url')
-
-        rec: Dict[str, Any] = {
-            'file': meta.get('file'),
-            'username': meta.get('username'),
-            'late': meta.get('late'),
-            'student_id': meta.get('student_id'),
-            'assignment': assign,
-            'chapter': chapter if chapter is not None else '',
-            'best_url': url,
-            'debug_url': dbg,
-        }
-
-        if not url:
-            rec.update({'total': 0, 'possible': 25, 'errors': 'No URL found'})
-            rows.append(rec)
-            continue
+    journal = None if args.from_archive else progress_journal.from_args(args)
+    if args.resume and journal is None:
+        ap.error('--resume needs a journal: pass --journal FILE or --out FILE')
+    done = journal.completed(files) if journal is not None and args.resume else {}
+    todo = [p for i, p in enumerate(files) if i not in done]
 
-        lines: List[str] = []
-        code_js: Optional[str] = None
-        steps: List[str] = []
-        errors: Optional[str] = None
-        try:
-            lines, code_js, steps, errors = try_capture(url, timeout=args.timeout)
-        except Exception as e:
-            errors = str(e)
-
-        # Grade per chapter
-        result: Dict[str, Any]
-        if chapter == 1:
-            if lines:
-                result = ch1.grade_ch1(lines, code_js, assume_comments_ok=False)
-            else:
-                result = {'total': 0, 'possible': 25, 'meta': {'captured_lines': 0, 'code_available': bool(code_js)}}
-        elif chapter == 2:
-            if lines:
-                result = ch2.grade_ch2(lines, code_js)
-            else:
-                result = {'total': 0, 'possible': 25, 'meta': {'captured_lines': 0, 'code_available': bool(code_js)}}
-        elif chapter == 3:
-            if lines:
-                result = ch3.grade_ch3(lines, code_js)
-            else:
-                result = {'total': 0, 'possible': 25, 'meta': {'captured_lines': 0, 'code_available': bool(code_js)}}
-        elif chapter == 4:
-            if lines:
-                result = ch4.grade_ch4(lines, code_js)
-            else:
-                result = {'total': 0, 'possible': 25, 'meta': {'captured_lines': 0, 'code_available': bool(code_js)}}
-        elif chapter == 5:
-            if lines:
-                result = ch5.grade_ch5(lines, code_js)
-            else:
-                result = {'total': 0, 'possible': 25, 'meta': {'captured_lines': 0, 'code_available': bool(code_js)}}
-        elif chapter == 6:
-            if lines:
-                result = ch6.grade_ch6(lines, code_js)
-            else:
-                result = {'total': 0, 'possible': 25, 'meta': {'captured_lines': 0, 'code_available': bool(code_js)}}
-        elif chapter in (7, 8):
-            if lines:
-                result = ch7_8.grade_ch7_8(lines, code_js)
-            else:
-                result = {'total': 0, 'possible': 25, 'meta': {'captured_lines': 0, 'code_available': bool(code_js)}}
-        elif chapter == 9:
-            if lines:
-                result = ch9.grade_ch9(lines, code_js)
-            else:
-                result = {'total': 0, 'possible': 25, 'meta': {'captured_lines': 0, 'code_available': bool(code_js)}}
-        elif chapter == 10:
-            if lines:
-                result = ch10.grade_ch10(lines, code_js)
-            else:
-                result = {'total': 0, 'possible': 25, 'meta': {'captured_lines': 0, 'code_available': bool(code_js)}}
-        elif chapter == 12:
-            css_text = None
-            metrics = None
-            try:
-                snap_metrics, html_text, css_text_candidate, steps2, err2 = ch12.capture_dom_snapshot(url, timeout=args.timeout)
-                if steps2:
-                    steps.extend(steps2)
-                if err2:
-                    errors = (errors + f"; {err2}") if errors else err2
-                if snap_metrics:
-                    metrics = snap_metrics
-                if css_text_candidate:
-                    css_text = css_text_candidate
-                if not metrics and dbg:
-                    snap_metrics, html_text, css_text_candidate, steps3, err3 = ch12.capture_dom_snapshot(dbg, timeout=args.timeout)
-                    if steps3:
-                        steps.extend(steps3)
-                    if err3:
-                        errors = (errors + f"; {err3}") if errors else err3
-                    if snap_metrics:
-                        metrics = snap_metrics
-                    if css_text_candidate:
-                        css_text = css_text_candidate
-            except Exception as e:
-                errors = (errors + f"; ch12 snapshot: {e}") if errors else f"ch12 snapshot: {e}"
-            if metrics:
-                result = ch12.grade_ch12(metrics, css_text, code_js, lines)
-            else:
-                result = {'total': 0, 'possible': 25, 'meta': {'captured_lines': len(lines), 'code_available': bool(code_js), 'errors': 'ch12 metrics unavailable'}}
+    retry_on = retry_reasons(args)
+    writer = row_writer.open_writer(args.format, args.out, OUTPUT_FIELDS, csv_row)
+    stream = row_writer.OrderedStream(writer, len(files), retry_on=retry_on)
+    for i, row in done.items():
+        stream.put(i, row)
+    position = {p: i for i, p in enumerate(files)}
+
+    def on_row(path: str, row: Dict[str, Any]) -> None:
+        if journal is not None:
+            journal.record(path, row, pending=row.get('_retry') in retry_on)
+        stream.put(position[path], row)
+
+    try:
+        if args.from_archive:
+            rows = grade_archives(args.from_archive, args.glob)
         else:
-            result = {'total': 0, 'possible': 25}
-            errors = (errors + '; unsupported assignment') if errors else 'unsupported assignment'
+            rows = grade_batch(todo, args, on_row=on_row)
+        if done:
+            fresh = iter(rows)
+            rows = [done[i] if i in done else next(fresh) for i in range(len(files))]
+        if retry_on:
+            rows = retry_failed(files, rows, args, on_row=on_row)
+        strip_internal(rows)
+    except BaseException:
+        # Close the JSON array / flush what was written so the partial output stays readable.
+        stream.close()
+        raise
+    stream.finish(rows)
+    if stream.replaced:
+        print(f"output: {stream.replaced} retried row(s) appended after their first attempt; the last row per file wins",
+              file=sys.stderr)
+    if not args.watch:
+        writer.close()
+    if journal is not None:
+        journal.compact(files, rows)
+        print(journal.summary(), file=sys.stderr)
+
+    if any(r.get('network') for r in rows):
+        print(resource_policy.summarize(r.get('network') for r in rows), file=sys.stderr)
+        challenges = storage_state.summarize(r.get('network') for r in rows)
+        if challenges:
+            print(challenges, file=sys.stderr)
+    if args.measure_savings > 0 and args.block_resources and not args.from_archive:
+        report_savings(rows, args)
+    if throttle is not None and not args.from_archive and not (args.workers > 1 and len(todo) > 1):
+        print(throttle.summary(), file=sys.stderr)
 
-        # Build notes summarizing missing items, when available
+    if args.watch:
         try:
-            notes = ch1.summarize_notes(result.get('checks', [])) if 'checks' in result else ''
-        except Exception:
-            notes = ''
-
-        rec.update({
-            'total': result.get('total', 0),
-            'possible': result.get('possible', 25),
-            'captured_lines': result.get('meta', {}).get('captured_lines', ''),
-            'code_available': result.get('meta', {}).get('code_available', ''),
-            'attempt_steps': ';'.join(steps),
-            'errors': errors or '',
-            'notes': notes,
-        })
-        rows.append(rec)
-
-    # Output
-    if args.format == 'json':
-        data = json.dumps(rows, indent=2)
-        if args.out == '-':
-            print(data)
-        else:
-            with open(args.out, 'w', encoding='utf-8') as f:
-                f.write(data)
-        return 0
-
-    fieldnames = [
-        'file','username','late','student_id','assignment','chapter','best_url','debug_url',
-        'total','possible','captured_lines','code_available','attempt_steps','errors','notes'
-    ]
-    if args.out == '-':
-        w = csv.DictWriter(sys.stdout, fieldnames=fieldnames)
-        w.writeheader()
-        for r in rows:
-            w.writerow({k: r.get(k, '') for k in fieldnames})
-    else:
-        with open(args.out, 'w', newline='', encoding='utf-8') as f:
-            w = csv.DictWriter(f, fieldnames=fieldnames)
-            w.writeheader()
-            for r in rows:
-                w.writerow({k: r.get(k, '') for k in fieldnames})
+            watch_submissions(args, writer, journal, files)
+        finally:
+            writer.close()
     return 0
 
 
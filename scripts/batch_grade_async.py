@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Concurrent batch grading engine for batch_grade.py (--concurrency K).
+
+Runs up to K submissions at once on a single asyncio event loop using
+playwright.async_api, with a separate cap on simultaneous page loads per host
+(--per-host). Parsing, chapter detection, grading and row assembly are shared
+with the serial path in batch_grade.py, and results are gathered in input order,
+so the rows are the same as a serial run, in the same order.
+
+Usage:
+  scripts/.venv/bin/python scripts/batch_grade.py --dir Submissions --concurrency 6 --out grades.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import async_capture
+import batch_grade
+import browser_pool
+import capture_archive
+import capture_cache
+import capture_planner
+import parse_canvas_submissions as pcs
+import pen_dedup
+import resource_policy
+import storage_state
+
+
+async def capture_file_async(
+    path: str,
+    args: argparse.Namespace,
+    pool: browser_pool.AsyncBrowserPool,
+    limiter: Optional[async_capture.HostLimiter] = None,
+    cache: Optional[capture_cache.CaptureCache] = None,
+    dedup: Optional[pen_dedup.PenDedup] = None,
+) -> Dict[str, Any]:
+    """Async twin of batch_grade.capture_file."""
+    meta = pcs.parse_submission_file(path)
+    _rec, chapter = batch_grade.new_record(meta)
+
+    async def run() -> Dict[str, Any]:
+        cap = batch_grade.new_capture(meta)
+        url = meta.get('best_url')
+        if url:
+            policy = resource_policy.policy_for_chapter(chapter, getattr(args, 'block_resources', True))
+            try:
+                bundle = await async_capture.try_capture(
+                    url, timeout=args.timeout, pool=pool, idle=args.idle, limiter=limiter, cache=cache,
+                    policy=policy, net=cap['net'], parts=batch_grade.capture_parts_for(chapter),
+                    dbg=meta.get('debug_url'), race=getattr(args, 'race', False),
+                    virtual_time=getattr(args, 'virtual_time', False),
+                    dialogs=batch_grade.dialog_answers_for(chapter),
+                    simulate=not getattr(args, 'bulk_simulate', False),
+                    planner=capture_planner.from_args(args),
+                )
+                batch_grade.apply_bundle(cap, bundle)
+            except Exception as e:
+                cap['errors'] = str(e)
+        cap['finished'] = time.time()
+        return cap
+
+    if dedup is None:
+        return await run()
+    return await dedup.capture_async(batch_grade.dedup_key(meta, chapter), meta, run)
+
+
+async def grade_file_async(
+    path: str,
+    args: argparse.Namespace,
+    pool: browser_pool.AsyncBrowserPool,
+    limiter: Optional[async_capture.HostLimiter] = None,
+    cache: Optional[capture_cache.CaptureCache] = None,
+    dedup: Optional[pen_dedup.PenDedup] = None,
+    on_row: Optional[batch_grade.RowHook] = None,
+) -> Dict[str, Any]:
+    """Async twin of batch_grade.grade_file."""
+    cap = await capture_file_async(path, args, pool, limiter=limiter, cache=cache, dedup=dedup)
+    if getattr(args, 'archive', None):
+        capture_archive.write_archive(args.archive, cap)
+    row = batch_grade.grade_capture(cap)
+    if on_row is not None:
+        on_row(path, row)
+    return row
+
+
+async def grade_files_async(
+    files: List[str],
+    args: argparse.Namespace,
+    pool: Optional[browser_pool.AsyncBrowserPool] = None,
+    limiter: Optional[async_capture.HostLimiter] = None,
+    cache: Optional[capture_cache.CaptureCache] = None,
+    dedup: Optional[pen_dedup.PenDedup] = None,
+    on_row: Optional[batch_grade.RowHook] = None,
+) -> List[Dict[str, Any]]:
+    """Grade `files` K at a time. A caller-supplied pool is left open for reuse."""
+    own_pool = pool is None
+    if pool is None:
+        pool = browser_pool.AsyncBrowserPool(max_uses=args.recycle_after, state_store=storage_state.from_args(args))
+    if limiter is None:
+        limiter = async_capture.HostLimiter(per_host=args.per_host)
+    sem = asyncio.Semaphore(max(1, args.concurrency))
+
+    async def run_one(path: str) -> Dict[str, Any]:
+        async with sem:
+            return await grade_file_async(path, args, pool, limiter, cache, dedup, on_row)
+
+    try:
+        # gather() returns results in submission order regardless of completion order.
+        return list(await asyncio.gather(*(run_one(p) for p in files)))
+    finally:
+        if own_pool:
+            await pool.close()
+
+
+async def capture_files_async(
+    files: List[str],
+    args: argparse.Namespace,
+    cache: Optional[capture_cache.CaptureCache] = None,
+    dedup: Optional[pen_dedup.PenDedup] = None,
+) -> List[Dict[str, Any]]:
+    """Capture `files` K at a time without grading (the capture stage of --bulk-simulate)."""
+    pool = browser_pool.AsyncBrowserPool(max_uses=args.recycle_after, state_store=storage_state.from_args(args))
+    limiter = async_capture.HostLimiter(per_host=args.per_host)
+    sem = asyncio.Semaphore(max(1, args.concurrency))
+
+    async def run_one(path: str) -> Dict[str, Any]:
+        async with sem:
+            return await capture_file_async(path, args, pool, limiter, cache, dedup)
+
+    try:
+        return list(await asyncio.gather(*(run_one(p) for p in files)))
+    finally:
+        await pool.close()
+
+
+def capture_files(
+    files: List[str],
+    args: argparse.Namespace,
+    cache: Optional[capture_cache.CaptureCache] = None,
+    dedup: Optional[pen_dedup.PenDedup] = None,
+) -> List[Dict[str, Any]]:
+    """Blocking wrapper around capture_files_async."""
+    return asyncio.run(capture_files_async(files, args, cache=cache, dedup=dedup))
+
+
+def grade_files(
+    files: List[str],
+    args: argparse.Namespace,
+    on_row: Optional[batch_grade.RowHook] = None,
+) -> List[Dict[str, Any]]:
+    """Blocking entry point used by batch_grade.main."""
+    cache = capture_cache.from_args(args)
+    dedup = pen_dedup.from_args(args)
+    rows = asyncio.run(grade_files_async(files, args, cache=cache, dedup=dedup, on_row=on_row))
+    if cache:
+        print(cache.summary(), file=sys.stderr)
+    if dedup:
+        print(dedup.summary(), file=sys.stderr)
+    return rows
+
+
+# Per-process state for `batch_grade.py --workers N --concurrency K`: each worker keeps one
+# event loop and one warm async browser across all the chunks it is handed.
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+_worker_pool: Optional[browser_pool.AsyncBrowserPool] = None
+_worker_limiter: Optional[async_capture.HostLimiter] = None
+_worker_cache: Optional[capture_cache.CaptureCache] = None
+
+
+def grade_chunk_in_worker(files: List[str], args: argparse.Namespace) -> List[Dict[str, Any]]:
+    global _worker_loop, _worker_pool, _worker_limiter, _worker_cache
+    if _worker_loop is None:
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+        _worker_pool = browser_pool.AsyncBrowserPool(max_uses=args.recycle_after, state_store=storage_state.from_args(args))
+        # This process's share of --per-host, as rate_limit.configure_from_args divides it.
+        _worker_limiter = async_capture.HostLimiter(per_host=max(1, args.per_host // max(1, args.workers)))
+        _worker_cache = capture_cache.from_args(args)
+    # Duplicate pens are grouped into one chunk by batch_grade.grade_files_parallel.
+    return _worker_loop.run_until_complete(
+        grade_files_async(files, args, pool=_worker_pool, limiter=_worker_limiter, cache=_worker_cache,
+                          dedup=pen_dedup.from_args(args))
+    )
+
+
+def close_worker() -> None:
+    global _worker_loop, _worker_pool
+    if _worker_loop is None:
+        return
+    try:
+        if _worker_pool is not None:
+            _worker_loop.run_until_complete(_worker_pool.close())
+    finally:
+        _worker_loop.close()
+        _worker_loop = None
+        _worker_pool = None
@@ -31,6 +31,7 @@ if SCRIPT_DIR not in sys.path:
     sys.path.insert(0, SCRIPT_DIR)
 
 try:
+    import browser_pool
     import parse_canvas_submissions as pcs
     import grade_ch1_codepen as grader
 except Exception as e:
@@ -38,7 +39,13 @@ except Exception as e:
     sys.exit(2)
 
 
-def try_grade_url(url: str, timeout: float = 12.0, assume_comments_ok: bool = False) -> Dict[str, Any]:
+def try_grade_url(
+    url: str,
+    timeout: float = 12.0,
+    assume_comments_ok: bool = False,
+    pool: Optional[browser_pool.BrowserPool] = None,
+    idle: float = grader.DEFAULT_IDLE_SECONDS,
+) -> Dict[str, Any]:
     console_lines: List[str] = []
     code_js: Optional[str] = None
     steps: List[str] = []
@@ -54,7 +61,7 @@ def try_grade_url(url: str, timeout: float = 12.0, assume_comments_ok: bool = Fa
 
     # First attempt: direct URL
     try:
-        lines, js = grader.capture_console_from_codepen(url, timeout=timeout)
+        lines, js = grader.capture_console_from_codepen(url, timeout=timeout, pool=pool, idle=idle)
         attach_result("direct", lines, js)
     except Exception as e:
         err = f"direct: {e}"
@@ -64,7 +71,7 @@ def try_grade_url(url: str, timeout: float = 12.0, assume_comments_ok: bool = Fa
         dbg = grader.derive_debug_url(url)
         if dbg:
             try:
-                lines, js = grader.capture_console_from_codepen(dbg, timeout=timeout)
+                lines, js = grader.capture_console_from_codepen(dbg, timeout=timeout, pool=pool, idle=idle)
                 attach_result("debug", lines, js)
             except Exception as e:
                 err = (err + f"; debug: {e}") if err else f"debug: {e}"
@@ -72,7 +79,7 @@ def try_grade_url(url: str, timeout: float = 12.0, assume_comments_ok: bool = Fa
     # If still not useful, try simulation with extracted JS
     if (not console_lines) and code_js:
         try:
-            lines = grader.simulate_console_with_js(code_js, timeout=6.0)
+            lines = grader.simulate_console_with_js(code_js, timeout=6.0, pool=pool)
             attach_result("simulated", lines, code_js)
         except Exception as e:
             err = (err + f"; simulate: {e}") if err else f"simulate: {e}"
@@ -100,10 +107,14 @@ def main(argv=None) -> int:
     ap = argparse.ArgumentParser(description="Batch grade Ch. 1 CodePen submissions from Canvas HTML link files")
     ap.add_argument('--dir', default='Submissions', help='Directory with Canvas HTML link files')
     ap.add_argument('--glob', default='*.html', help='Glob pattern')
-    ap.add_argument('--timeout', type=float, default=14.0, help='Seconds to wait for console output')
+    ap.add_argument('--timeout', type=float, default=14.0, help='Max seconds to wait for console output')
     ap.add_argument('--assume-comments-ok', action='store_true', help='Award comment points if JS cannot be fetched')
     ap.add_argument('--format', choices=['csv','json'], default='csv')
     ap.add_argument('--out', default='-', help='Output path or - for stdout')
+    ap.add_argument('--idle', type=float, default=grader.DEFAULT_IDLE_SECONDS,
+                    help='Stop capturing after this many quiet console seconds once loaded (0 = full timeout)')
+    ap.add_argument('--recycle-after', type=int, default=browser_pool.DEFAULT_MAX_USES,
+                    help='Relaunch the shared Chromium after this many page contexts')
     args = ap.parse_args(argv)
 
     # Collect submissions
@@ -114,6 +125,8 @@ def main(argv=None) -> int:
         return 0
 
     rows: List[Dict[str, Any]] = []
+    # One warm browser for the whole run; each capture gets its own context.
+    pool = browser_pool.get_pool(max_uses=args.recycle_after)
     for p in paths:
         meta = pcs.parse_submission_file(p)
         url = meta.get('best_url')
@@ -133,7 +146,7 @@ def main(argv=None) -> int:
             rows.append(rec)
             continue
         try:
-            result = try_grade_url(url, timeout=args.timeout, assume_comments_ok=args.assume_comments_ok)
+            result = try_grade_url(url, timeout=args.timeout, assume_comments_ok=args.assume_comments_ok, pool=pool, idle=args.idle)
             rec.update({
                 'total': result.get('total', 0),
                 'possible': result.get('possible', 25),
@@ -147,6 +160,8 @@ def main(argv=None) -> int:
             rec.update({'total': 0, 'possible': 25, 'errors': str(e)})
         rows.append(rec)
 
+    browser_pool.close_pool()
+
     if args.format == 'json':
         data = json.dumps(rows, indent=2)
         if args.out == '-':
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the grading CLIs' offline paths (`python -X importtime`).
+
+Runs each case in a fresh interpreter -- `--help` of every CLI, offline
+grading (`--from-logs`, ch12 `--html`), `batch_grade.py --from-archive` (an empty
+archive and one holding a single ch5 capture) and parse_canvas_submissions -- and
+reads the import log from stderr:
+
+- total: summed cumulative time of the top-level imports, median of --repeat
+  runs, checked against the case's budget (BUDGET_MS, scaled by --budget-scale);
+- forbidden: modules the case must not import at all -- Playwright, asyncio
+  and multiprocessing everywhere; every grader module except the chapters the
+  case grades (and ch1, which every grader imports for its shared helpers); and
+  in batch_grade's offline cases the capture code (CAPTURE_MODULES) too.
+
+Prints a table and exits 1 if any case imports a forbidden module or runs
+over budget, so a slow or eager import shows up as a failing run.
+
+Usage:
+  python scripts/bench_startup.py
+  python scripts/bench_startup.py --repeat 7 --json
+  python scripts/bench_startup.py --budget-scale 2    # slow machine / CI
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Milliseconds of import time (under -X importtime, which itself adds overhead).
+BUDGET_MS = {"parse": 60.0, "grader": 90.0, "batch": 130.0}
+
+ALWAYS_FORBIDDEN = ("playwright", "asyncio", "multiprocessing")
+# batch_grade loads these on its first capture; --help and --from-archive never capture.
+CAPTURE_MODULES = ("capture_bundle", "capture_steps", "async_capture", "batch_grade_async", "bulk_simulate",
+                   "submission_watch")
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)")
+
+
+def grader_modules() -> List[str]:
+    return sorted(os.path.splitext(os.path.basename(p))[0] for p in glob.glob(os.path.join(SCRIPT_DIR, "grade_ch*_codepen.py")))
+
+
+def parse_importtime(stderr: str) -> Tuple[float, Set[str]]:
+    """(total ms of top-level imports, every imported module name) from -X importtime output."""
+    total_us = 0
+    names: Set[str] = set()
+    for line in stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if not m:
+            continue
+        names.add(m.group(4))
+        if len(m.group(3)) == 1:
+            total_us += int(m.group(2))
+    return total_us / 1000.0, names
+
+
+def run_case(module: str, argv: List[str]) -> Tuple[float, Set[str], int]:
+    """Import `module` and call its main(argv) in a fresh interpreter."""
+    code = (
+        "import sys; sys.path.insert(0, %r)\n"
+        "import %s as m\n"
+        "try:\n    rc = m.main(%r) or 0\nexcept SystemExit as e:\n    rc = e.code or 0\n"
+        "sys.exit(rc)\n" % (SCRIPT_DIR, module, argv)
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, cwd=SCRIPT_DIR,
+    )
+    total, names = parse_importtime(proc.stderr)
+    return total, names, proc.returncode
+
+
+def write_archive(root: str, chapter: int, lines: List[str]) -> None:
+    """One archived capture for a `chapter` submission, as `batch_grade.py --archive` writes it."""
+    import capture_archive
+
+    meta = {"file": f"ch{chapter}.html", "username": "student", "assignment": f"Ch. {chapter} - Bench",
+            "best_url": "https://codepen.io/student/pen/bench"}
+    capture_archive.write_archive(root, {"meta": meta, "lines": lines, "code_js": "console.log('Hello')",
+                                         "steps": ["direct"], "errors": None})
+
+
+def build_cases(tmp: str) -> List[Dict[str, Any]]:
+    logs = os.path.join(tmp, "console.log")
+    with open(logs, "w", encoding="utf-8") as f:
+        f.write("Hello\n42\nLine A\n")
+    page = os.path.join(tmp, "page.html")
+    with open(page, "w", encoding="utf-8") as f:
+        f.write("<header><h1>Portfolio</h1></header><main><section id='about'><p>Hi</p></section></main>\n")
+    archive = os.path.join(tmp, "archive")
+    os.makedirs(archive, exist_ok=True)
+    ch5_archive = os.path.join(tmp, "archive-ch5")
+    write_archive(ch5_archive, 5, ["Hello", "42", "Line A"])
+
+    graders = grader_modules()
+    cases: List[Dict[str, Any]] = [
+        {"name": "parse_canvas_submissions --help", "module": "parse_canvas_submissions", "argv": ["--help"],
+         "kind": "parse", "forbidden": graders},
+        {"name": "parse_canvas_submissions --dir", "module": "parse_canvas_submissions",
+         "argv": ["--dir", archive, "--out", os.devnull], "kind": "parse", "forbidden": graders},
+    ]
+    for module in graders:
+        # Every chapter CLI shares helpers from ch1; no other grader may be pulled in.
+        others = [g for g in graders if g not in (module, "grade_ch1_codepen")]
+        offline = ["--html", page] if module == "grade_ch12_codepen" else ["--from-logs", logs]
+        cases.append({"name": f"{module} --help", "module": module, "argv": ["--help"],
+                      "kind": "grader", "forbidden": others})
+        cases.append({"name": f"{module} {offline[0]}", "module": module, "argv": offline + ["--out", "json"],
+                      "kind": "grader", "forbidden": others})
+    offline = graders + list(CAPTURE_MODULES)
+    cases.append({"name": "batch_grade --help", "module": "batch_grade", "argv": ["--help"],
+                  "kind": "batch", "forbidden": offline})
+    cases.append({"name": "batch_grade --from-archive (empty)", "module": "batch_grade",
+                  "argv": ["--from-archive", archive, "--out", os.devnull], "kind": "batch", "forbidden": offline})
+    # Grading ch5 loads grade_ch5_codepen and its ch1 helpers (which import capture_steps), nothing else.
+    ch5_needs = ("grade_ch5_codepen", "grade_ch1_codepen", "capture_steps")
+    cases.append({"name": "batch_grade --from-archive (ch5)", "module": "batch_grade",
+                  "argv": ["--from-archive", ch5_archive, "--out", os.devnull], "kind": "batch",
+                  "forbidden": [m for m in offline if m not in ch5_needs]})
+    return cases
+
+
+def bench(cases: List[Dict[str, Any]], repeat: int, scale: float) -> List[Dict[str, Any]]:
+    results = []
+    for case in cases:
+        times: List[float] = []
+        imported: Set[str] = set()
+        rc = 0
+        for _ in range(max(1, repeat)):
+            total, names, code = run_case(case["module"], case["argv"])
+            times.append(total)
+            imported |= names
+            rc = rc or code
+        forbidden = set(ALWAYS_FORBIDDEN) | set(case["forbidden"])
+        bad = sorted({n.split(".")[0] for n in imported} & forbidden)
+        budget = BUDGET_MS[case["kind"]] * scale
+        median = statistics.median(times)
+        results.append({
+            "name": case["name"], "ms": round(median, 1), "budget_ms": budget,
+            "forbidden": bad, "exit": rc, "ok": not bad and median <= budget and rc == 0,
+        })
+    return results
+
+
+def format_table(results: List[Dict[str, Any]]) -> str:
+    width = max(len(r["name"]) for r in results)
+    out = [f"{'case':<{width}}  {'ms':>7}  {'budget':>7}  result"]
+    for r in results:
+        status = "ok"
+        if r["forbidden"]:
+            status = "imports " + ", ".join(r["forbidden"])
+        elif r["exit"]:
+            status = f"exit {r['exit']}"
+        elif not r["ok"]:
+            status = "over budget"
+        out.append(f"{r['name']:<{width}}  {r['ms']:>7.1f}  {r['budget_ms']:>7.0f}  {status}")
+    return "\n".join(out)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description='Import-time benchmark for the grading CLIs (offline paths)')
+    ap.add_argument('--repeat', type=int, default=3, help='Runs per case; the median is compared to the budget')
+    ap.add_argument('--budget-scale', type=float, default=1.0, help='Multiply every budget (e.g. 2 on slow machines)')
+    ap.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = bench(build_cases(tmp), args.repeat, args.budget_scale)
+    print(json.dumps(results, indent=2) if args.json else format_table(results))
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
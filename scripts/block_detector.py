@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Streaming detection of Cloudflare / COEP blocks during a CodePen capture.
+
+grade_ch1_codepen.looks_blocked inspects console output after a capture has
+finished. The same signals (a Cloudflare challenge, a 401/403 document, a
+net::ERR_BLOCKED_BY_RESPONSE frame) normally appear within the first second of
+navigation, so a BlockDetector listens to the page's console, response and
+requestfailed events and trips as soon as one shows up. The capture helpers
+then stop waiting and move on to the next fallback (Debug View, simulation).
+
+Signatures are case-insensitive substrings. Extra ones can be added at
+startup (batch_grade.py --block-signature TEXT) and apply to looks_blocked too.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any, Iterable, List, Optional, Tuple
+
+
+DEFAULT_SIGNATURES: Tuple[str, ...] = (
+    "cloudflare",
+    "private access token",
+    "status of 401",
+    "status of 403",
+    "net::err_blocked_by_response",
+    "not same origin",
+)
+
+# HTTP statuses that mean a document (page or result iframe) was refused.
+BLOCK_STATUSES = (401, 403)
+
+_extra_signatures: List[str] = []
+
+
+def add_signatures(extra: Optional[Iterable[str]]) -> None:
+    """Register additional block signatures for this process."""
+    for sig in extra or ():
+        sig = sig.strip().lower()
+        if sig and sig not in DEFAULT_SIGNATURES and sig not in _extra_signatures:
+            _extra_signatures.append(sig)
+
+
+def signatures() -> Tuple[str, ...]:
+    return DEFAULT_SIGNATURES + tuple(_extra_signatures)
+
+
+def match(text: str) -> Optional[str]:
+    """The first signature found in `text`, or None."""
+    text = (text or "").lower()
+    for sig in signatures():
+        if sig in text:
+            return sig
+    return None
+
+
+class BlockDetector:
+    """Trips on the first block signal seen on a page; records when and why."""
+
+    def __init__(self) -> None:
+        self.started = time.time()
+        self.reason: Optional[str] = None
+        self.tripped_at: Optional[float] = None
+
+    @property
+    def tripped(self) -> bool:
+        return self.reason is not None
+
+    def trip(self, reason: str) -> None:
+        if self.reason is None:
+            self.reason = reason
+            self.tripped_at = time.time()
+
+    def on_console(self, msg: Any) -> None:
+        try:
+            text = msg.text() if callable(msg.text) else msg.text
+        except Exception:
+            text = str(msg)
+        sig = match(text)
+        if sig:
+            self.trip(sig)
+
+    def on_response(self, response: Any) -> None:
+        try:
+            if response.request.resource_type != "document":
+                return
+            if response.status in BLOCK_STATUSES:
+                self.trip(f"status of {response.status}")
+            elif (response.headers.get("cf-mitigated") or "").lower() == "challenge":
+                self.trip("cloudflare")
+        except Exception:
+            pass
+
+    def on_request_failed(self, request: Any) -> None:
+        try:
+            failure = request.failure
+            sig = match(failure if isinstance(failure, str) else str(failure or ""))
+        except Exception:
+            return
+        if sig:
+            self.trip(sig)
+
+    def attach(self, page: Any) -> "BlockDetector":
+        """Listen on a page (sync or async API); call right before navigating."""
+        self.started = time.time()
+        page.on("console", self.on_console)
+        page.on("response", self.on_response)
+        page.on("requestfailed", self.on_request_failed)
+        return self
+
+    def seconds_saved(self, deadline: float) -> float:
+        """Time left before `deadline` (the capture's timeout ceiling) when the block was seen."""
+        if self.tripped_at is None:
+            return 0.0
+        return max(0.0, deadline - self.tripped_at)
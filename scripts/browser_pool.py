@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Shared headless Chromium pool for CodePen captures.
+
+Launching Chromium is the most expensive part of a capture, so instead of
+starting a fresh browser for every URL the capture helpers borrow an isolated
+BrowserContext from a BrowserPool. The pool launches Chromium lazily on first
+use and recycles it after a configurable number of contexts or as soon as a
+page/browser crash is observed.
+
+Sync Playwright objects are bound to the thread that created them, so each
+worker (thread or process) owns its own pool. `get_pool()` returns the pool for
+the calling thread; batch drivers may also create an explicit pool and pass it
+to the capture functions via `pool=`.
+
+AsyncBrowserPool is the playwright.async_api counterpart used by the concurrent
+batch engine: many contexts can be open at once on the same browser, and a
+recycled browser is closed only after its last context is released.
+
+Either pool can carry a storage_state.StateStore: its contexts then start
+from the stored cookies/localStorage and save theirs back when they close.
+
+Usage:
+  import browser_pool
+  with browser_pool.get_pool().context() as context:
+      page = context.new_page()
+      ...
+"""
+
+from __future__ import annotations
+
+import atexit
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+
+DEFAULT_MAX_USES = 50
+
+# Error fragments Playwright reports when the browser process died underneath us.
+CRASH_SIGNALS = [
+    "target crashed",
+    "target closed",
+    "target page, context or browser has been closed",
+    "browser has been closed",
+    "browser has disconnected",
+    "connection closed",
+]
+
+
+def try_import_playwright():
+    try:
+        from playwright.sync_api import sync_playwright  # type: ignore
+        return sync_playwright
+    except Exception:
+        return None
+
+
+def try_import_async_playwright():
+    try:
+        from playwright.async_api import async_playwright  # type: ignore
+        return async_playwright
+    except Exception:
+        return None
+
+
+def looks_like_crash(exc: BaseException) -> bool:
+    text = str(exc).lower()
+    return any(s in text for s in CRASH_SIGNALS)
+
+
+class BrowserPool:
+    """Launch Chromium once per worker and hand out isolated BrowserContexts."""
+
+    def __init__(self, max_uses: int = DEFAULT_MAX_USES, headless: bool = True, state_store: Any = None) -> None:
+        self.max_uses = max(1, int(max_uses))
+        self.headless = headless
+        self.state_store = state_store
+        # id(context) -> the label state_store gave the state it was seeded with
+        self.state_labels: Dict[int, str] = {}
+        self.launches = 0
+        self.contexts_served = 0
+        self._playwright_cm: Any = None
+        self._playwright: Any = None
+        self._browser: Any = None
+        self._uses = 0
+        self._crashed = False
+
+    def _start_playwright(self) -> Any:
+        if self._playwright is None:
+            sync_playwright = try_import_playwright()
+            if not sync_playwright:
+                raise RuntimeError(
+                    "Playwright not available. Install with: pip install playwright && python -m playwright install chromium"
+                )
+            self._playwright_cm = sync_playwright()
+            self._playwright = self._playwright_cm.start()
+        return self._playwright
+
+    def _mark_crashed(self, *_: Any) -> None:
+        self._crashed = True
+
+    def browser(self) -> Any:
+        """Return a live browser, (re)launching it when needed."""
+        needs_recycle = (
+            self._browser is None
+            or self._crashed
+            or self._uses >= self.max_uses
+            or not self._browser.is_connected()
+        )
+        if needs_recycle:
+            self._close_browser()
+            pw = self._start_playwright()
+            self._browser = pw.chromium.launch(headless=self.headless)
+            self._browser.on("disconnected", self._mark_crashed)
+            self.launches += 1
+            self._uses = 0
+            self._crashed = False
+        return self._browser
+
+    @contextmanager
+    def context(self, **context_kwargs: Any) -> Iterator[Any]:
+        """Yield a fresh BrowserContext; it is always closed on exit."""
+        browser = self.browser()
+        self._uses += 1
+        self.contexts_served += 1
+        store = self.state_store if "storage_state" not in context_kwargs else None
+        if store is not None:
+            context_kwargs["storage_state"] = store.load()
+        ctx = browser.new_context(**context_kwargs)
+        if store is not None:
+            self.state_labels[id(ctx)] = store.label(context_kwargs["storage_state"])
+        ctx.on("page", lambda page: page.on("crash", self._mark_crashed))
+        try:
+            yield ctx
+        except Exception as exc:
+            if looks_like_crash(exc):
+                self._crashed = True
+            raise
+        finally:
+            if store is not None and not self._crashed:
+                try:
+                    store.save(ctx.storage_state())
+                except Exception:
+                    pass
+            self.state_labels.pop(id(ctx), None)
+            try:
+                ctx.close()
+            except Exception:
+                self._crashed = True
+
+    def _close_browser(self) -> None:
+        if self._browser is not None:
+            try:
+                self._browser.close()
+            except Exception:
+                pass
+        self._browser = None
+
+    def close(self) -> None:
+        self._close_browser()
+        if self._playwright_cm is not None:
+            try:
+                self._playwright_cm.__exit__(None, None, None)
+            except Exception:
+                pass
+        self._playwright_cm = None
+        self._playwright = None
+
+
+class AsyncBrowserPool:
+    """asyncio counterpart of BrowserPool: one browser shared by many concurrent contexts."""
+
+    def __init__(self, max_uses: int = DEFAULT_MAX_USES, headless: bool = True, state_store: Any = None) -> None:
+        self.max_uses = max(1, int(max_uses))
+        self.headless = headless
+        self.state_store = state_store
+        # id(context) -> the label state_store gave the state it was seeded with
+        self.state_labels: Dict[int, str] = {}
+        self.launches = 0
+        self.contexts_served = 0
+        self._playwright_cm: Any = None
+        self._playwright: Any = None
+        self._current: Optional[Dict[str, Any]] = None
+        # asyncio costs ~40 ms to import; only the async engine pays for it.
+        import asyncio
+        self._lock = asyncio.Lock()
+
+    async def _acquire_browser(self) -> Dict[str, Any]:
+        async with self._lock:
+            cur = self._current
+            needs_recycle = (
+                cur is None
+                or cur["crashed"]
+                or cur["uses"] >= self.max_uses
+                or not cur["browser"].is_connected()
+            )
+            if needs_recycle:
+                if cur is not None:
+                    cur["retired"] = True
+                    if cur["active"] == 0:
+                        await self._close_entry(cur)
+                if self._playwright is None:
+                    async_playwright = try_import_async_playwright()
+                    if not async_playwright:
+                        raise RuntimeError(
+                            "Playwright not available. Install with: pip install playwright && python -m playwright install chromium"
+                        )
+                    self._playwright_cm = async_playwright()
+                    self._playwright = await self._playwright_cm.start()
+                browser = await self._playwright.chromium.launch(headless=self.headless)
+                entry: Dict[str, Any] = {"browser": browser, "uses": 0, "active": 0, "crashed": False, "retired": False}
+                browser.on("disconnected", lambda *_: entry.update(crashed=True))
+                self._current = entry
+                self.launches += 1
+            entry = self._current
+            entry["uses"] += 1
+            entry["active"] += 1
+            self.contexts_served += 1
+            return entry
+
+    @asynccontextmanager
+    async def context(self, **context_kwargs: Any) -> AsyncIterator[Any]:
+        """Yield a fresh BrowserContext; it is always closed on exit."""
+        entry = await self._acquire_browser()
+        ctx = None
+        store = self.state_store if "storage_state" not in context_kwargs else None
+        if store is not None:
+            context_kwargs["storage_state"] = store.load()
+        try:
+            ctx = await entry["browser"].new_context(**context_kwargs)
+            if store is not None:
+                self.state_labels[id(ctx)] = store.label(context_kwargs["storage_state"])
+            ctx.on("page", lambda page: page.on("crash", lambda *_: entry.update(crashed=True)))
+            yield ctx
+        except Exception as exc:
+            if looks_like_crash(exc):
+                entry["crashed"] = True
+            raise
+        finally:
+            if ctx is not None and store is not None and not entry["crashed"]:
+                try:
+                    store.save(await ctx.storage_state())
+                except Exception:
+                    pass
+            if ctx is not None:
+                self.state_labels.pop(id(ctx), None)
+                try:
+                    await ctx.close()
+                except Exception:
+                    entry["crashed"] = True
+            entry["active"] -= 1
+            if entry["active"] == 0 and (entry["retired"] or entry["crashed"]) and entry is not self._current:
+                await self._close_entry(entry)
+
+    async def _close_entry(self, entry: Dict[str, Any]) -> None:
+        try:
+            await entry["browser"].close()
+        except Exception:
+            pass
+
+    async def close(self) -> None:
+        if self._current is not None:
+            await self._close_entry(self._current)
+            self._current = None
+        if self._playwright_cm is not None:
+            try:
+                await self._playwright_cm.__aexit__(None, None, None)
+            except Exception:
+                pass
+        self._playwright_cm = None
+        self._playwright = None
+
+
+_local = threading.local()
+_all_pools: List[BrowserPool] = []
+_all_lock = threading.Lock()
+
+
+def get_pool(max_uses: Optional[int] = None, state_store: Any = None) -> BrowserPool:
+    """Return the calling thread's shared pool, creating it on first use."""
+    pool: Optional[BrowserPool] = getattr(_local, "pool", None)
+    if pool is None:
+        pool = BrowserPool(max_uses=max_uses or DEFAULT_MAX_USES, state_store=state_store)
+        _local.pool = pool
+        with _all_lock:
+            _all_pools.append(pool)
+    else:
+        if max_uses:
+            pool.max_uses = max(1, int(max_uses))
+        if state_store is not None:
+            pool.state_store = state_store
+    return pool
+
+
+def close_pool() -> None:
+    """Close the calling thread's shared pool (if any)."""
+    pool: Optional[BrowserPool] = getattr(_local, "pool", None)
+    if pool is not None:
+        pool.close()
+        _local.pool = None
+        with _all_lock:
+            if pool in _all_pools:
+                _all_pools.remove(pool)
+
+
+@atexit.register
+def _close_all_pools() -> None:
+    with _all_lock:
+        pools = list(_all_pools)
+        _all_pools.clear()
+    for pool in pools:
+        pool.close()
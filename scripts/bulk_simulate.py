@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Bulk JS simulation: many submissions' code in one page, one Web Worker each.
+
+The per-pen fallback (grade_ch1_codepen.simulate_console_with_js) opens a
+context and a page to evaluate a single script. simulate_many instead loads
+one page on a routed placeholder origin (BULK_ORIGIN, never on the network;
+every other request is aborted) and runs each script in its own dedicated
+Worker, `parallel` at a time:
+
+- isolation: every script has a fresh worker global scope, so top-level
+  `let`/`const` names and overwritten globals cannot collide;
+- tagging: the worker's console methods post each line together with the
+  submission id, and the page collects lines per id;
+- watchdog: a worker still running after `timeout` seconds (an infinite
+  loop, or an interval that is never cleared) is terminated from the page,
+  which a single-page simulation cannot do for a busy main thread;
+- bounded output: each job keeps console_guard's head + tail lines and is
+  terminated once it has posted FLOOD_LINES messages.
+
+A worker reports completion once the script has run and no timers it started
+are pending, so short scripts finish in milliseconds. With `virtual_time` the
+worker runs grade_ch1_codepen.VIRTUAL_TIME_RUN_JS instead. prompt()/confirm()
+are answered from per-submission dialog_script answers.
+
+A worker global is not a window. The per-pen simulation runs on about:blank,
+where Playwright auto-dismisses dialogs and `document` is a real empty page, so
+each worker first installs the same defaults: alert() returns undefined,
+prompt() null, confirm() false, and `document` is a stub whose lookups find
+nothing (getElementById/querySelector return null, querySelectorAll []).
+Code that uses any other window-only API (localStorage,
+requestAnimationFrame, innerWidth, ...) fails with "X is not defined" where X
+exists on a window; such submissions are simulated again pen by pen
+(simulate_console_with_js) and their bulk result is discarded.
+
+Console arguments are formatted in the worker: strings as-is, objects as
+JSON. That matches Chromium's console text for the plain values the graders
+look for, but object previews can differ from a per-pen simulation.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import browser_pool
+import console_guard
+import dialog_script
+import grade_ch1_codepen as ch1
+
+
+BULK_ORIGIN = "http://bulk-simulate.invalid/"
+WORKER_URL = BULK_ORIGIN + "worker.js"
+
+# Workers running at once in the page.
+DEFAULT_PARALLEL = 8
+# Scripts per page; each chunk gets a fresh context so a crash only loses one chunk.
+DEFAULT_CHUNK = 100
+
+_PAGE_HTML = "<!doctype html><title>bulk simulate</title>"
+
+# Worker script. Each worker handles a single job message:
+# {id, code, dialogs, virtual, args}.
+_WORKER_JS = """
+var window = self;
+let jobId = null;
+// about:blank defaults: Playwright dismisses dialogs; the document is empty.
+self.alert = () => undefined;
+self.prompt = () => null;
+self.confirm = () => false;
+const stubElement = (tag) => ({
+    tagName: String(tag || "div").toUpperCase(), style: {}, dataset: {}, children: [], textContent: "", innerHTML: "",
+    classList: { add() {}, remove() {}, toggle() { return false; }, contains() { return false; } },
+    appendChild(child) { this.children.push(child); return child; },
+    append(...nodes) { this.children.push(...nodes); },
+    setAttribute() {}, getAttribute() { return null; }, addEventListener() {}, removeEventListener() {},
+    querySelector() { return null; }, querySelectorAll() { return []; },
+});
+self.document = {
+    title: "", readyState: "complete", body: stubElement("body"), head: stubElement("head"),
+    documentElement: stubElement("html"),
+    getElementById: () => null, querySelector: () => null, querySelectorAll: () => [],
+    getElementsByTagName: () => [], getElementsByClassName: () => [],
+    createElement: stubElement, createTextNode: (text) => ({ textContent: String(text) }),
+    addEventListener() {}, removeEventListener() {}, write() {}, writeln() {},
+};
+const format = (v) => {
+    if (typeof v === "string") return v;
+    if (v === null || typeof v !== "object") return String(v);
+    try {
+        return JSON.stringify(v);
+    } catch (e) {
+        return String(v);
+    }
+};
+for (const level of ["log", "info", "warn", "error", "debug"]) {
+    console[level] = (...args) => postMessage({ id: jobId, line: args.map(format).join(" ") });
+}
+const runVirtual = %(virtual_js)s;
+const settle = () => new Promise((resolve) => {
+    const ch = new MessageChannel();
+    ch.port1.onmessage = () => {
+        ch.port1.close();
+        resolve();
+    };
+    ch.port2.postMessage(null);
+});
+
+const runRealTime = async (code) => {
+    const active = new Set();
+    const realSet = { timeout: self.setTimeout.bind(self), interval: self.setInterval.bind(self) };
+    const realClear = { timeout: self.clearTimeout.bind(self), interval: self.clearInterval.bind(self) };
+    let finished = false;
+    const checkDone = async () => {
+        await settle();
+        if (!finished && active.size === 0) {
+            finished = true;
+            postMessage({ id: jobId, done: true });
+        }
+    };
+    const wrap = (kind) => (fn, ms, ...args) => {
+        const id = realSet[kind](() => {
+            if (kind === "timeout") active.delete(id);
+            try {
+                if (typeof fn === "function") fn(...args);
+                else (0, eval)(String(fn));
+            } finally {
+                checkDone();
+            }
+        }, ms);
+        active.add(id);
+        return id;
+    };
+    const unwrap = (kind) => (id) => {
+        active.delete(id);
+        realClear[kind](id);
+        checkDone();
+    };
+    self.setTimeout = wrap("timeout");
+    self.setInterval = wrap("interval");
+    self.clearTimeout = unwrap("timeout");
+    self.clearInterval = unwrap("interval");
+    try {
+        (0, eval)(code);
+    } catch (e) {
+        console.error(String(e && e.message ? e.message : e));
+    }
+    checkDone();
+};
+
+self.onmessage = async (event) => {
+    const job = event.data;
+    self.onmessage = null;
+    jobId = job.id;
+    if (job.dialogs) (0, eval)(job.dialogs);
+    if (job.virtual) {
+        const r = await runVirtual(job.args);
+        postMessage({ id: jobId, done: true, steps: r.steps, pending: r.pending });
+    } else {
+        runRealTime(job.code);
+    }
+};
+"""
+
+# Page-side driver: runs the jobs `parallel` at a time and returns
+# {id: {lines, truncated, killed, error, missing}}; `killed` is 'timeout' / 'flood' or null,
+# `missing` a window global the worker lacked ("X is not defined" for an X this page has).
+_RUN_JOBS_JS = """
+async ({ jobs, workerUrl, timeoutMs, parallel, headLines, tailLines, floodLines, maxLineChars }) => {
+    const results = {};
+    let next = 0;
+    const windowOnly = (text) => {
+        const m = /\\b([A-Za-z_$][\\w$]*) is not defined/.exec(String(text || ""));
+        return m && m[1] in self ? m[1] : null;
+    };
+    const runOne = (job) => new Promise((resolve) => {
+        const out = { lines: [], truncated: 0, killed: null, error: null, missing: null };
+        results[job.id] = out;
+        const tail = [];
+        let seen = 0;
+        const worker = new Worker(workerUrl);
+        let watchdog = null;
+        let finished = false;
+        const finish = (killed) => {
+            if (finished) return;
+            finished = true;
+            clearTimeout(watchdog);
+            worker.terminate();
+            out.killed = killed || null;
+            out.lines.push(...tail);
+            resolve();
+        };
+        watchdog = setTimeout(() => finish("timeout"), job.watchdogMs || timeoutMs);
+        worker.onmessage = (e) => {
+            const m = e.data || {};
+            if (m.id !== job.id || finished) return;
+            if (m.done) return finish(null);
+            if (typeof m.line !== "string") return;
+            out.missing = out.missing || windowOnly(m.line);
+            const line = m.line.length > maxLineChars ? m.line.slice(0, maxLineChars) : m.line;
+            if (out.lines.length < headLines) out.lines.push(line);
+            else {
+                tail.push(line);
+                if (tail.length > tailLines) {
+                    tail.shift();
+                    out.truncated++;
+                }
+            }
+            if (++seen >= floodLines) finish("flood");
+        };
+        worker.onerror = (e) => {
+            e.preventDefault();
+            if (!out.error) out.error = String(e.message || "worker error");
+            out.missing = out.missing || windowOnly(e.message);
+        };
+        worker.postMessage(job);
+    });
+    const lane = async () => {
+        while (next < jobs.length) await runOne(jobs[next++]);
+    };
+    await Promise.all(Array.from({ length: Math.max(1, Math.min(parallel, jobs.length)) }, lane));
+    return results;
+}
+"""
+
+
+def worker_js() -> str:
+    return _WORKER_JS % {"virtual_js": ch1.VIRTUAL_TIME_RUN_JS.strip()}
+
+
+def new_job(
+    sub_id: str,
+    code_js: str,
+    timeout: float,
+    virtual_time: bool = False,
+    dialogs: Optional[dialog_script.Answers] = None,
+    max_steps: int = ch1.DEFAULT_VIRTUAL_STEPS,
+) -> Dict[str, Any]:
+    job: Dict[str, Any] = {
+        "id": sub_id,
+        "code": code_js,
+        "dialogs": dialog_script.install_js(dialogs) if dialogs else "",
+        "virtual": virtual_time,
+        "watchdogMs": int(timeout * 1000),
+    }
+    if virtual_time:
+        job["args"] = ch1.virtual_time_args(code_js, timeout, max_steps)
+        job["watchdogMs"] += int(ch1.VIRTUAL_GRACE_S * 1000)
+    return job
+
+
+def _serve(route: Any) -> None:
+    url = route.request.url
+    if url == WORKER_URL:
+        route.fulfill(status=200, content_type="text/javascript", body=worker_js())
+    elif url.startswith(BULK_ORIGIN):
+        route.fulfill(status=200, content_type="text/html", body=_PAGE_HTML)
+    else:
+        route.abort()
+
+
+def _run_chunk(pool: browser_pool.BrowserPool, jobs: List[Dict[str, Any]], timeout: float, parallel: int) -> Dict[str, Any]:
+    with pool.context() as context:
+        context.route("**/*", _serve)
+        page = context.new_page()
+        page.goto(BULK_ORIGIN)
+        return page.evaluate(
+            _RUN_JOBS_JS,
+            {
+                "jobs": jobs,
+                "workerUrl": WORKER_URL,
+                "timeoutMs": int(timeout * 1000),
+                "parallel": parallel,
+                "headLines": console_guard.HEAD_LINES,
+                "tailLines": console_guard.TAIL_LINES,
+                "floodLines": console_guard.FLOOD_LINES,
+                "maxLineChars": console_guard.MAX_LINE_CHARS,
+            },
+        )
+
+
+def simulate_many(
+    items: Iterable[Tuple[str, str]],
+    pool: Optional[browser_pool.BrowserPool] = None,
+    timeout: float = 6.0,
+    parallel: int = DEFAULT_PARALLEL,
+    virtual_time: bool = False,
+    dialogs: Optional[Dict[str, dialog_script.Answers]] = None,
+    chunk: int = DEFAULT_CHUNK,
+) -> Dict[str, Dict[str, Any]]:
+    """Simulate every (submission_id, code_js) pair in one browser.
+
+    Returns {submission_id: {"lines": [...], "truncated": int, "killed": str|None,
+    "error": str|None}} with lines normalized like simulate_console_with_js; `killed`
+    is 'timeout' or 'flood' when the page terminated the worker. `dialogs` maps submission ids to
+    their grader's DIALOG_ANSWERS. A chunk whose page fails reports the error for each
+    of its submissions. Scripts that needed a window-only global are re-run with
+    simulate_console_with_js and also carry "rerun": <that global>. Without Playwright
+    the result is empty.
+    """
+    items = [(str(i), code) for i, code in items if code]
+    if not items or not ch1.try_import_playwright():
+        return {}
+    dialogs = dialogs or {}
+    pool = pool or browser_pool.get_pool()
+    results: Dict[str, Dict[str, Any]] = {}
+    for start in range(0, len(items), max(1, chunk)):
+        jobs = [
+            new_job(sub_id, code, timeout, virtual_time=virtual_time, dialogs=dialogs.get(sub_id))
+            for sub_id, code in items[start:start + max(1, chunk)]
+        ]
+        try:
+            raw = _run_chunk(pool, jobs, timeout, parallel)
+        except Exception as e:
+            raw = {job["id"]: {"lines": [], "error": str(e)} for job in jobs}
+        for job in jobs:
+            res = raw.get(job["id"]) or {"lines": [], "error": "no result"}
+            lines = [ch1.normalize_line(l) for l in res.get("lines") or []]
+            results[job["id"]] = {
+                "lines": [l for l in lines if l],
+                "truncated": int(res.get("truncated") or 0),
+                "killed": res.get("killed") or None,
+                "error": res.get("error"),
+            }
+            if res.get("missing"):
+                results[job["id"]] = simulate_one(
+                    job["code"], pool, timeout, virtual_time, dialogs.get(job["id"]), res["missing"],
+                )
+    return results
+
+
+def simulate_one(
+    code_js: str,
+    pool: browser_pool.BrowserPool,
+    timeout: float,
+    virtual_time: bool,
+    dialogs: Optional[dialog_script.Answers],
+    missing: str,
+) -> Dict[str, Any]:
+    """Per-pen simulation for a script the worker could not run (it needed window global `missing`)."""
+    flags: Dict[str, Any] = {}
+    lines = ch1.simulate_console_with_js(
+        code_js, timeout=timeout, pool=pool, virtual_time=virtual_time, dialogs=dialogs, flags=flags,
+    )
+    return {
+        "lines": lines,
+        "truncated": int(flags.get("truncated") or 0),
+        "killed": flags.get("killed") or None,
+        "error": None,
+        "rerun": missing,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Simulate several JS files in one browser and print their console lines")
+    ap.add_argument("files", nargs="+", help="JS files (the file name is the submission id)")
+    ap.add_argument("--timeout", type=float, default=6.0, help="Watchdog seconds per script")
+    ap.add_argument("--parallel", type=int, default=DEFAULT_PARALLEL, help="Workers running at once")
+    ap.add_argument("--virtual-time", action="store_true", help="Fast-forward timers on a virtual clock")
+    args = ap.parse_args(argv)
+
+    items = [(path, ch1.load_code_from_file(path)) for path in args.files]
+    try:
+        results = simulate_many(items, timeout=args.timeout, parallel=args.parallel, virtual_time=args.virtual_time)
+    finally:
+        browser_pool.close_pool()
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Per-submission capture archives for offline regrading.
+
+`batch_grade.py --archive DIR` writes one gzip-compressed JSON document per
+Canvas submission holding everything the graders consume: the parsed
+submission metadata, console lines, extracted JS, ch12 DOM metrics/HTML/CSS,
+attempt steps, capture errors and start/finish timestamps.
+
+`batch_grade.py --from-archive DIR` reads those documents back and feeds them
+through the same grading code without importing Playwright or touching the
+network, so a rubric change can be re-scored across a whole term in well under
+a second.
+
+Archive files are named after the submission file (`<file>.json.gz`) and
+written through a temp file + os.replace, so a crashed or parallel run never
+leaves a truncated archive behind.
+"""
+
+from __future__ import annotations
+
+import glob
+import gzip
+import json
+import os
+import tempfile
+from typing import Any, Dict, Iterator, List
+
+
+ARCHIVE_VERSION = 1
+ARCHIVE_SUFFIX = ".json.gz"
+
+
+def archive_path(root: str, capture: Dict[str, Any]) -> str:
+    name = os.path.basename(capture.get("meta", {}).get("file") or "submission")
+    return os.path.join(root, name + ARCHIVE_SUFFIX)
+
+
+def write_archive(root: str, capture: Dict[str, Any]) -> str:
+    """Atomically write one capture record under `root`; returns its path."""
+    os.makedirs(root, exist_ok=True)
+    path = archive_path(root, capture)
+    doc = dict(capture, version=ARCHIVE_VERSION)
+    fd, tmp = tempfile.mkstemp(dir=root, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as gz:
+                gz.write(json.dumps(doc).encode("utf-8"))
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+def read_archive(path: str) -> Dict[str, Any]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        doc = json.load(f)
+    if doc.get("version") != ARCHIVE_VERSION:
+        raise ValueError(f"{path}: unsupported archive version {doc.get('version')!r}")
+    return doc
+
+
+def archive_files(root: str, pattern: str = "*") -> List[str]:
+    """Archive paths under `root` whose submission file name matches `pattern`, sorted."""
+    return sorted(glob.glob(os.path.join(root, pattern + ARCHIVE_SUFFIX)))
+
+
+def iter_archives(root: str, pattern: str = "*") -> Iterator[Dict[str, Any]]:
+    for path in archive_files(root, pattern):
+        yield read_archive(path)
@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+Single-visit CodePen capture returning a structured bundle.
+
+One page load can serve every grader input: console output, the pen's JS
+(via the five extraction strategies in grade_ch1_codepen), the ch12 DOM
+metrics, the page's outerHTML and its stylesheet text. Callers declare which
+parts they need and work for the others is skipped, e.g. the console-only
+chapters never run the DOM/CSS scripts and a DOM-only capture does not wait
+for the console to go quiet.
+
+Parts: console, js, dom, html, css. Each chapter grader module declares the
+parts it needs as CAPTURE_PARTS.
+
+race_bundle loads several candidate URLs for the same pen (direct and Debug
+View) side by side in sibling contexts and keeps whichever first shows
+non-blocked console output, closing the others.
+
+The page work itself lives in capture_steps generators (settle_steps, race_steps,
+page_part_steps and try_capture_steps for batch_grade.try_capture); capture_bundle
+and race_bundle here run them with the sync API, async_capture with the async one.
+
+Bundle layout (also what batch_grade stores in the capture cache):
+  {"parts": [...], "lines": [...], "js": str|None, "metrics": dict|None,
+   "html": str|None, "css": str|None, "steps": [...], "error": str|None,
+   "blocked": str|None, "truncated": int, "killed": str|None}
+
+Console output goes through a console_guard.ConsoleBuffer; "truncated" is the
+number of lines it dropped and "killed" why a runaway page was terminated.
+"""
+
+from __future__ import annotations
+
+import time
+from contextlib import ExitStack
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import block_detector
+import browser_pool
+import capture_cache
+import capture_planner
+import capture_steps
+import console_guard
+import dialog_script
+import grade_ch1_codepen as ch1
+import rate_limit
+import resource_policy
+import storage_state
+
+
+PARTS = ("console", "js", "dom", "html", "css")
+DEFAULT_PARTS = ("console", "js")
+
+# Settle time after clicking Run when nothing waits on the console (old ch12 snapshot: 500 + 400 ms).
+DOM_SETTLE_MS = 900
+
+
+def normalize_parts(parts: Optional[Iterable[str]]) -> Tuple[str, ...]:
+    """Validate `parts` and return them in canonical order."""
+    wanted = set(parts or DEFAULT_PARTS)
+    unknown = wanted - set(PARTS)
+    if unknown:
+        raise ValueError(f"unknown capture parts: {', '.join(sorted(unknown))}")
+    return tuple(p for p in PARTS if p in wanted)
+
+
+def parts_tag(parts: Iterable[str]) -> str:
+    """Cache discriminator for a part set ('' for the default console+js set)."""
+    parts = normalize_parts(parts)
+    return "" if parts == DEFAULT_PARTS else "+".join(parts)
+
+
+def new_bundle(parts: Iterable[str]) -> Dict[str, Any]:
+    return {
+        "parts": list(normalize_parts(parts)),
+        "lines": [],
+        "js": None,
+        "metrics": None,
+        "html": None,
+        "css": None,
+        "steps": [],
+        "error": None,
+        "blocked": None,
+        "truncated": 0,
+        "killed": None,
+    }
+
+
+def add_error(bundle: Dict[str, Any], message: str) -> None:
+    bundle["error"] = (bundle["error"] + f"; {message}") if bundle.get("error") else message
+
+
+def is_complete(bundle: Dict[str, Any]) -> bool:
+    """True when the bundle needs no fallback visit: usable console and/or DOM metrics."""
+    parts = bundle.get("parts") or DEFAULT_PARTS
+    if bundle.get("blocked"):
+        return False
+    if "console" in parts:
+        lines = bundle.get("lines") or []
+        if not lines or ch1.looks_blocked(lines):
+            return False
+    if "dom" in parts and not bundle.get("metrics"):
+        return False
+    return True
+
+
+def needs_simulation(parts: Iterable[str], lines: Optional[List[str]], js: Optional[str]) -> bool:
+    """True when the console part is wanted but empty/blocked and the pen's JS is known."""
+    return "console" in parts and bool(js) and (not lines or ch1.looks_blocked(lines))
+
+
+def simulation_tag(
+    js: Optional[str],
+    virtual_time: bool = False,
+    dialogs: Optional[dialog_script.Answers] = None,
+    engine: str = "",
+) -> str:
+    """Cache discriminator for a simulated capture: code digest, clock mode, engine, answers."""
+    tag = capture_cache.text_digest(js) + (":vt" if virtual_time else "") + (f":{engine}" if engine else "")
+    return dialog_script.with_answers(tag, dialogs)
+
+
+def merge_bundle(into: Dict[str, Any], other: Dict[str, Any]) -> Dict[str, Any]:
+    """Fold a fallback capture into `into`: new console/JS win, DOM parts fill gaps."""
+    if other.get("lines") or other.get("blocked"):
+        into["blocked"] = other.get("blocked")
+    if other.get("lines"):
+        into["lines"] = list(other["lines"])
+        into["truncated"] = other.get("truncated") or 0
+    into["killed"] = into.get("killed") or other.get("killed")
+    if other.get("js"):
+        into["js"] = other["js"]
+    took_dom = not into.get("metrics") and bool(other.get("metrics"))
+    if took_dom:
+        into["metrics"] = other["metrics"]
+    for key in ("html", "css"):
+        if other.get(key) and (took_dom or not into.get(key)):
+            into[key] = other[key]
+    into["steps"].extend(other.get("steps") or [])
+    if other.get("error"):
+        add_error(into, other["error"])
+    return into
+
+
+def page_parts(bundle: Dict[str, Any]) -> List[str]:
+    """Parts still worth evaluating on the page: only the JS once a block was detected."""
+    if bundle.get("blocked"):
+        return [p for p in bundle["parts"] if p == "js"]
+    return list(bundle["parts"])
+
+
+def note_block(
+    bundle: Dict[str, Any],
+    detector: block_detector.BlockDetector,
+    deadline: float,
+    stats: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Record an early abort on the bundle ('blocked:<signature>' step) and its page-load stats."""
+    if not detector.tripped:
+        return
+    bundle["blocked"] = detector.reason
+    bundle["steps"].append(f"blocked:{detector.reason}")
+    if stats is not None:
+        stats["aborted"] = detector.reason
+        stats["saved_s"] = round(detector.seconds_saved(deadline), 1)
+
+
+def page_part_steps(page: Any, bundle: Dict[str, Any]):
+    """capture_steps generator: evaluate the requested js/dom/html/css parts on a loaded page."""
+    parts = page_parts(bundle)
+    if "js" in parts:
+        bundle["js"] = yield from ch1.pen_js_steps(page)
+    if set(parts) & {"dom", "html", "css"}:
+        import grade_ch12_codepen as ch12  # page scripts; console-only captures never load the ch12 grader
+    if "dom" in parts:
+        try:
+            bundle["metrics"] = yield ("eval", page, ch12.DOM_METRICS_JS)
+            bundle["steps"].append("dom")
+        except Exception as e:
+            add_error(bundle, f"metrics: {e}")
+    if "html" in parts:
+        try:
+            bundle["html"] = yield ("eval", page, ch12.OUTER_HTML_JS)
+        except Exception:
+            pass
+    if "css" in parts:
+        try:
+            bundle["css"] = yield ("eval", page, ch12.STYLESHEET_TEXT_JS)
+        except Exception:
+            pass
+
+
+def collect_page_parts(page: Any, bundle: Dict[str, Any]) -> None:
+    """Evaluate the requested js/dom/html/css parts on a loaded page."""
+    capture_steps.drive(page_part_steps(page, bundle))
+
+
+class Visit:
+    """One page load of a capture: its URL, console buffer, block detector and bundle.
+
+    capture_bundle makes one; race_bundle makes one per candidate URL (a racer).
+    """
+
+    def __init__(self, mode: str, url: str, parts: Iterable[str]) -> None:
+        self.mode = mode
+        self.url = url
+        self.bundle = new_bundle(parts)
+        self.raw_lines = console_guard.ConsoleBuffer()
+        self.activity: Dict[str, float] = {"last": time.time()}
+        self.on_console = console_guard.recorder(self.raw_lines, self.activity)
+        self.context: Any = None
+        self.page: Any = None
+        self.clicked = False
+        self.alive = False
+        self.detector = block_detector.BlockDetector()
+        self.stats: Optional[Dict[str, Any]] = None
+        self.nav: Optional[rate_limit.Navigation] = None
+
+    def lines(self) -> List[str]:
+        return [ch1.normalize_line(l) for l in self.raw_lines.lines() if ch1.normalize_line(l)]
+
+    def has_good_output(self) -> bool:
+        lines = self.lines()
+        return bool(lines) and not ch1.looks_blocked(lines)
+
+    def fail(self, exc: BaseException) -> None:
+        self.alive = False
+        add_error(self.bundle, f"{self.mode}: {exc}")
+
+    def racing(self) -> bool:
+        """Still a candidate: loaded and not (yet) showing a block signal."""
+        return self.alive and not self.detector.tripped
+
+    def stopped(self) -> bool:
+        """End this page's console wait: block signal, console flood or page-side watchdog."""
+        return self.detector.tripped or self.raw_lines.stopped
+
+    def report_block(self) -> None:
+        """Tell the rate limiter whether this page load was blocked (before its slot is released)."""
+        if self.nav is not None:
+            self.nav.blocked = self.detector.tripped
+
+    def finish(self, deadline: float) -> Dict[str, Any]:
+        self.bundle["lines"] = self.lines()
+        self.bundle["truncated"] = self.raw_lines.dropped
+        if not self.bundle.get("blocked"):
+            note_block(self.bundle, self.detector, deadline, self.stats)
+        return self.bundle
+
+
+def open_page(
+    v: Visit,
+    pool: browser_pool.BrowserPool,
+    policy: Optional[resource_policy.ResourcePolicy],
+    dialogs: Optional[dialog_script.Answers],
+    timeout: float,
+) -> Any:
+    """Prepare `v.context` (request policy, stored state, dialogs, watchdog) and open `v.page`."""
+    resource_policy.install(v.context, policy, v.stats)
+    storage_state.note(v.stats, pool, v.context)
+    dialog_script.install(v.context, dialogs)
+    console_guard.install(v.context, timeout)
+    v.page = v.context.new_page()
+    if "console" in v.bundle["parts"]:
+        v.page.on("console", v.on_console)
+    resource_policy.watch_page(v.page, v.stats)
+    v.detector.attach(v.page)
+    return v.page
+
+
+def settle_steps(v: Visit, timeout: float, idle: float, deadline: float):
+    """capture_steps generator: after a visit's page has started loading, run the pen,
+    wait for its console (or the DOM settle time) and collect the remaining parts."""
+    if not v.detector.tripped:
+        yield from ch1.run_button_steps(v.page)
+        if "console" in v.bundle["parts"]:
+            yield from ch1.idle_steps(v.page, v.activity, timeout, idle, stop=v.stopped)
+        else:
+            yield ("sleep", v.page, DOM_SETTLE_MS)
+    note_block(v.bundle, v.detector, deadline, v.stats)
+    v.report_block()
+    v.bundle["killed"] = yield from console_guard.runaway_steps(v.context, v.page, v.raw_lines)
+    yield from page_part_steps(v.page, v.bundle)
+
+
+def capture_bundle(
+    url: str,
+    parts: Iterable[str] = DEFAULT_PARTS,
+    timeout: float = 10.0,
+    pool: Optional[browser_pool.BrowserPool] = None,
+    idle: float = console_guard.DEFAULT_IDLE_SECONDS,
+    policy: Optional[resource_policy.ResourcePolicy] = resource_policy.DEFAULT_POLICY,
+    stats: Optional[Dict[str, Any]] = None,
+    dialogs: Optional[dialog_script.Answers] = None,
+) -> Dict[str, Any]:
+    """Visit `url` once and return a bundle with the requested parts.
+
+    Navigation failures raise (like capture_console_from_codepen); failures of
+    individual parts are recorded in bundle["error"]. A block signal (block_detector)
+    ends the wait at once and sets bundle["blocked"] so the caller falls back.
+    """
+    v = Visit("visit", url, parts)
+    v.stats = stats
+    pool = pool or browser_pool.get_pool()
+    with rate_limit.navigation(url, stats) as v.nav, pool.context() as v.context:
+        open_page(v, pool, policy, dialogs, timeout)
+        deadline = time.time() + timeout
+        v.page.goto(url, wait_until="domcontentloaded")
+        capture_steps.drive(settle_steps(v, timeout, idle, deadline))
+    v.bundle["lines"] = v.lines()
+    v.bundle["truncated"] = v.raw_lines.dropped
+    return v.bundle
+
+
+def race_result(racers: List[Visit], winner: Optional[Visit], deadline: float) -> Tuple[Optional[str], Dict[str, Any]]:
+    """(winning mode, bundle); without a winner, every racer's output is merged in preference order."""
+    if winner is not None:
+        bundle = winner.finish(deadline)
+        for r in racers:
+            if r is not winner and r.bundle.get("error"):
+                add_error(bundle, r.bundle["error"])
+        return winner.mode, bundle
+    merged = new_bundle(racers[0].bundle["parts"] if racers else DEFAULT_PARTS)
+    for r in racers:
+        merge_bundle(merged, r.finish(deadline))
+    return None, merged
+
+
+def race_steps(racers: List[Visit], end: float, idle: float):
+    """capture_steps generator behind race_bundle (and its async twin), once every racer's
+    page has started loading. Returns (winning mode or None, bundle)."""
+    winner: Optional[Visit] = None
+    while winner is None and time.time() < end:
+        live = [r for r in racers if r.racing()]
+        if not live:
+            break
+        yield ("sleep", live[0].page, ch1.POLL_INTERVAL_MS)  # sync API: pumps events for every page
+        for r in live:
+            if not r.clicked and (yield ("check", r.page, ch1.DOM_READY_JS, ch1.POLL_INTERVAL_MS, False)):
+                yield from ch1.run_button_steps(r.page)
+                r.clicked = True
+        winner = next((r for r in live if r.racing() and r.has_good_output()), None)
+
+    for r in racers:
+        if r is winner or not r.alive:
+            continue
+        if winner is not None:
+            r.alive = False
+            try:
+                yield ("close", r.context)
+            except Exception:
+                pass
+        else:
+            note_block(r.bundle, r.detector, end, r.stats)
+            try:
+                r.bundle["killed"] = yield from console_guard.runaway_steps(r.context, r.page, r.raw_lines)
+                yield from page_part_steps(r.page, r.bundle)
+            except Exception as e:
+                r.fail(e)
+
+    if winner is not None:
+        try:
+            yield from ch1.idle_steps(winner.page, winner.activity, max(0.0, end - time.time()), idle, stop=winner.stopped)
+            note_block(winner.bundle, winner.detector, end, winner.stats)
+            winner.bundle["killed"] = yield from console_guard.runaway_steps(winner.context, winner.page, winner.raw_lines)
+            yield from page_part_steps(winner.page, winner.bundle)
+        except Exception as e:
+            add_error(winner.bundle, f"{winner.mode}: {e}")
+    for r in racers:
+        r.report_block()
+    return race_result(racers, winner, end)
+
+
+def race_bundle(
+    targets: List[Tuple[str, str]],
+    parts: Iterable[str] = DEFAULT_PARTS,
+    timeout: float = 10.0,
+    pool: Optional[browser_pool.BrowserPool] = None,
+    idle: float = console_guard.DEFAULT_IDLE_SECONDS,
+    policy: Optional[resource_policy.ResourcePolicy] = resource_policy.DEFAULT_POLICY,
+    net: Optional[Dict[str, Dict[str, Any]]] = None,
+    dialogs: Optional[dialog_script.Answers] = None,
+) -> Tuple[Optional[str], Dict[str, Any]]:
+    """Load every (mode, url) in `targets` at once; the first with non-blocked console output wins.
+
+    Losing pages are closed as soon as a winner is known; the winner then runs to console
+    idle and collects its remaining parts. Ties go to the earlier target. A racer that
+    shows a block signal drops out; once every racer is blocked or failed the race ends
+    early. Returns (winning mode or None, bundle). Without a winner the racers' outputs
+    are merged in target order.
+    """
+    racers = [Visit(mode, url, parts) for mode, url in targets]
+    pool = pool or browser_pool.get_pool()
+    end = time.time() + timeout
+
+    with ExitStack() as stack:
+        for r in racers:
+            try:
+                r.stats = resource_policy.meter(net, r.mode)
+                r.nav = stack.enter_context(rate_limit.navigation(r.url, r.stats))
+                r.context = stack.enter_context(pool.context())
+                open_page(r, pool, policy, dialogs, timeout)
+                # "commit" returns as soon as navigation starts, so the racers load side by side.
+                r.page.goto(r.url, wait_until="commit")
+                r.alive = True
+            except Exception as e:
+                r.fail(e)
+        return capture_steps.drive(race_steps(racers, end, idle))
+
+
+# Actions try_capture_steps() yields; batch_grade.try_capture and async_capture.try_capture
+# perform them with their own engine and send back the result.
+RACE = "race"          # (RACE, targets) -> (winning mode or None, bundle), see race_bundle
+VISIT = "visit"        # (VISIT, mode, url) -> bundle, see capture_bundle
+SIMULATE = "simulate"  # (SIMULATE, js, flags) -> console lines, see simulate_console_with_js
+
+
+def try_capture_steps(
+    url: str,
+    parts: Iterable[str] = DEFAULT_PARTS,
+    cache: Optional[capture_cache.CaptureCache] = None,
+    dbg: Optional[str] = None,
+    race: bool = False,
+    virtual_time: bool = False,
+    dialogs: Optional[dialog_script.Answers] = None,
+    simulate: bool = True,
+    planner: Optional[capture_planner.Planner] = None,
+):
+    """Generator behind batch_grade.try_capture: direct -> Debug View -> simulated (or a race).
+
+    Yields RACE / VISIT / SIMULATE actions and returns the merged bundle. Cache lookups
+    and stores (complete bundles, non-blocked simulations) and the planner's order and
+    bookkeeping happen here, so both engines make the same decisions.
+    """
+    parts = normalize_parts(parts)
+    out = new_bundle(parts)
+    dbg = dbg or ch1.derive_debug_url(url)
+    tag = dialog_script.with_answers(parts_tag(parts), dialogs)
+    tried: List[str] = []
+
+    cached = cache is not None and (cache.contains(url, 'direct', tag) or (dbg and cache.contains(dbg, 'debug', tag)))
+    if race and dbg and 'console' in parts and not cached:
+        try:
+            winner, b = yield (RACE, [('direct', url), ('debug', dbg)])
+            out['steps'].append(f"race:{winner or 'none'}")
+            merge_bundle(out, b)
+            if winner and is_complete(b):
+                capture_cache.put_bundle(cache, url if winner == 'direct' else dbg, winner, b, tag)
+            tried = [winner] if winner else ['direct', 'debug']
+        except Exception as e:
+            add_error(out, f"race: {e}")
+
+    order, plan_step = capture_planner.ordered(planner, url, {'direct': url, 'debug': dbg})
+    if plan_step and not tried:
+        out['steps'].append(plan_step)
+    for mode, target in order:
+        if not target or mode in tried:
+            continue
+        if tried and is_complete(out):
+            break
+        tried.append(mode)
+        try:
+            b = capture_cache.get_bundle(cache, target, mode, tag)
+            if b is not None:
+                b['parts'] = list(parts)
+            else:
+                started = time.time()
+                b = yield (VISIT, mode, target)
+                if planner is not None:
+                    planner.record(url, mode, b, time.time() - started)
+                if is_complete(b):
+                    capture_cache.put_bundle(cache, target, mode, b, tag)
+            out['steps'].append(mode)
+            merge_bundle(out, b)
+        except Exception as e:
+            add_error(out, f"{mode}: {e}")
+
+    code_js = out['js']
+    if simulate and needs_simulation(parts, out['lines'], code_js):
+        flags: Dict[str, Any] = {}
+        try:
+            extra = simulation_tag(code_js, virtual_time, dialogs)
+            hit = capture_cache.get_console(cache, url, 'simulated', extra)
+            if hit is not None:
+                sim = hit[0]
+            else:
+                sim = yield (SIMULATE, code_js, flags)
+                # Empty or blocked simulations are not stored so the next run tries again.
+                if sim and not ch1.looks_blocked(sim):
+                    capture_cache.put_console(cache, url, 'simulated', sim, code_js, extra)
+            if sim:
+                out['lines'] = sim
+                out['truncated'] = flags.get('truncated') or 0
+            out['killed'] = out['killed'] or flags.get('killed')
+            out['steps'].append('simulated:vt' if virtual_time else 'simulated')
+        except Exception as e3:
+            add_error(out, f"simulate: {e3}")
+
+    return out
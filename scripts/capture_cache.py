@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Persistent on-disk cache of CodePen captures for the batch graders.
+
+Entries are keyed by (capture mode, normalized pen URL[, extra]), not by
+their content: the file name is the SHA-256 of that key. Mode is one of
+direct / debug / simulated, and `extra` distinguishes inputs that change the
+result for the same URL (the capture parts requested, or the JS source fed to
+a simulation). Each entry is a small JSON document holding whatever the
+capture produced: a capture_bundle (console lines, extracted JS, ch12 DOM
+metrics/HTML/CSS) or simulated console lines.
+
+- TTL: entries whose recorded "created" time is older than `ttl` seconds
+  are treated as misses and removed; hits do not extend their life.
+- LRU: a hit refreshes the file's mtime (used only for LRU order); when the
+  cache grows past `max_bytes`, the least recently used entries are deleted
+  first.
+- Writes go through a temp file + os.replace, so concurrent workers never
+  observe half-written entries. One instance may be shared by threads
+  (grade_server's workers): its counters and eviction run under a lock.
+
+Usage (from batch_grade.py):
+  --cache / --no-cache      enable or disable the cache (default: disabled, so a student's
+                            fixed pen is never graded from a stale capture by surprise)
+  --refresh                 ignore existing entries but store fresh captures
+  --cache-dir DIR           location (default: scripts/.capture-cache, whatever the working directory)
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".capture-cache")
+DEFAULT_TTL_HOURS = 12.0
+DEFAULT_MAX_MB = 500.0
+CAPTURE_MODES = ("direct", "debug", "simulated")
+# put() writes "created" ahead of "data", so it is found without parsing the whole entry.
+_CREATED_RE = re.compile(rb'"created":\s*([0-9.eE+-]+)')
+HEAD_BYTES = 1024
+
+
+def normalize_pen_url(url: str) -> str:
+    """Lower-case scheme/host and drop query, fragment and trailing slash."""
+    parsed = urlparse((url or "").strip())
+    path = parsed.path.rstrip("/")
+    return f"{(parsed.scheme or 'https').lower()}://{parsed.netloc.lower()}{path}"
+
+
+def cache_key(url: str, mode: str, extra: str = "") -> str:
+    h = hashlib.sha256()
+    for part in (mode, normalize_pen_url(url), extra):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def text_digest(text: Optional[str]) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+class CaptureCache:
+    """Directory-backed capture cache with TTL expiry and size-bounded LRU eviction."""
+
+    def __init__(
+        self,
+        root: str = DEFAULT_CACHE_DIR,
+        ttl: float = DEFAULT_TTL_HOURS * 3600,
+        max_bytes: int = int(DEFAULT_MAX_MB * 1024 * 1024),
+        refresh: bool = False,
+    ) -> None:
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._approx_bytes: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, url: str, mode: str, extra: str = "") -> Optional[Dict[str, Any]]:
+        """Return the cached data for (url, mode, extra), or None on miss/expiry/refresh."""
+        if self.refresh:
+            self._count(False)
+            return None
+        path = self._path(cache_key(url, mode, extra))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except Exception:
+            self._count(False)
+            return None
+        if self._expired(float(entry.get("created", 0)), time.time()):
+            self._remove(path)
+            self._count(False)
+            return None
+        try:
+            os.utime(path, None)  # LRU bookkeeping
+        except OSError:
+            pass
+        self._count(True)
+        return entry.get("data")
+
+    def contains(self, url: str, mode: str, extra: str = "") -> bool:
+        """True if a fresh entry exists (no hit/miss accounting, no LRU touch)."""
+        if self.refresh:
+            return False
+        created = self._created(self._path(cache_key(url, mode, extra)))
+        return created is not None and not self._expired(created, time.time())
+
+    def _expired(self, created: Optional[float], now: float) -> bool:
+        return self.ttl > 0 and (created is None or now - created > self.ttl)
+
+    def _created(self, path: str) -> Optional[float]:
+        """The entry's "created" time, or None if it is missing or unreadable."""
+        try:
+            with open(path, "rb") as f:
+                head = f.read(HEAD_BYTES)
+                m = _CREATED_RE.search(head)
+                if m:
+                    return float(m.group(1))
+                f.seek(0)
+                return float(json.loads(f.read().decode("utf-8")).get("created", 0))
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def put(self, url: str, mode: str, data: Dict[str, Any], extra: str = "") -> None:
+        key = cache_key(url, mode, extra)
+        path = self._path(key)
+        entry = {
+            "key": key,
+            "url": normalize_pen_url(url),
+            "mode": mode,
+            "created": time.time(),
+            "data": data,
+        }
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp, path)
+        except Exception:
+            return
+        with self._lock:
+            self.writes += 1
+            if self._approx_bytes is None:
+                self._approx_bytes = self._scan_total()
+            else:
+                try:
+                    self._approx_bytes += os.path.getsize(path)
+                except OSError:
+                    pass
+            over = self.max_bytes > 0 and self._approx_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        out: List[Tuple[float, int, str]] = []
+        if not os.path.isdir(self.root):
+            return out
+        for dirpath, _dirs, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                out.append((st.st_mtime, st.st_size, path))
+        return out
+
+    def _scan_total(self) -> int:
+        return sum(size for _m, size, _p in self._entries())
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self) -> int:
+        """Drop expired entries, then least-recently-used ones until under max_bytes."""
+        with self._lock:
+            now = time.time()
+            entries = sorted(self._entries())
+            total = sum(size for _m, size, _p in entries)
+            removed = 0
+            for _mtime, size, path in entries:
+                expired = self.ttl > 0 and self._expired(self._created(path), now)
+                if not expired and (self.max_bytes <= 0 or total <= self.max_bytes):
+                    continue
+                self._remove(path)
+                total -= size
+                removed += 1
+            self._approx_bytes = total
+            return removed
+
+    def summary(self) -> str:
+        return f"capture cache: {self.hits} hits, {self.misses} misses, {self.writes} writes ({self.root})"
+
+
+def get_console(cache: Optional[CaptureCache], url: str, mode: str, extra: str = "") -> Optional[Tuple[List[str], Optional[str]]]:
+    """Cached (console_lines, js_code) for a direct/debug/simulated capture, or None."""
+    data = cache.get(url, mode, extra) if cache else None
+    if data is None:
+        return None
+    return list(data.get("lines") or []), data.get("js")
+
+
+def put_console(cache: Optional[CaptureCache], url: str, mode: str, lines: List[str], js_code: Optional[str], extra: str = "") -> None:
+    if cache:
+        cache.put(url, mode, {"lines": lines, "js": js_code}, extra)
+
+
+def get_bundle(cache: Optional[CaptureCache], url: str, mode: str, extra: str = "") -> Optional[Dict[str, Any]]:
+    """Cached capture_bundle for a direct/debug visit, or None."""
+    data = cache.get(url, mode, extra) if cache else None
+    if data is None:
+        return None
+    bundle = {"lines": [], "js": None, "metrics": None, "html": None, "css": None, "steps": [], "error": None,
+              "truncated": 0, "killed": None}
+    bundle.update(data)
+    return bundle
+
+
+def put_bundle(cache: Optional[CaptureCache], url: str, mode: str, bundle: Dict[str, Any], extra: str = "") -> None:
+    if cache:
+        cache.put(url, mode, bundle, extra)
+
+
+def add_cache_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument('--cache', action=argparse.BooleanOptionalAction, default=False,
+                    help='Reuse captures stored on disk, up to --cache-ttl hours old (default: off)')
+    ap.add_argument('--refresh', action='store_true',
+                    help='Ignore cached captures but store fresh ones')
+    ap.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Capture cache directory')
+    ap.add_argument('--cache-ttl', type=float, default=DEFAULT_TTL_HOURS,
+                    help='Hours before a cached capture expires (0 = never)')
+    ap.add_argument('--cache-max-mb', type=float, default=DEFAULT_MAX_MB,
+                    help='Evict least recently used captures beyond this size')
+
+
+def from_args(args: argparse.Namespace) -> Optional[CaptureCache]:
+    if not getattr(args, 'cache', False):
+        return None
+    return CaptureCache(
+        root=args.cache_dir,
+        ttl=args.cache_ttl * 3600,
+        max_bytes=int(args.cache_max_mb * 1024 * 1024),
+        refresh=args.refresh,
+    )
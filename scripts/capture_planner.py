@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Adaptive ordering of the direct / Debug View capture attempts.
+
+try_capture always loads the pen directly first and falls back to Debug View,
+yet for a given CodePen author (or URL shape, e.g. codepen.io/*/full/*) the
+same path tends to win every time. A Planner keeps a small JSON file of
+outcomes per author and per URL pattern -- for each capture mode: tries,
+successes, blocks, total milliseconds and console lines -- and orders the
+attempts of the next capture by smoothed success rate (then mean latency).
+
+- The author's own history is used once it has MIN_TRIES fresh visits; until
+  then the URL pattern's, and with neither the default order.
+- An untried mode scores 0.5, so an author whose direct pages keep getting
+  blocked is sent to Debug View first without further direct attempts.
+- Every planned capture adds a 'plan:<first>><second>:<basis>' step to the
+  attempt log (basis: author / pattern).
+- Only fresh (uncached) visits are recorded. Each record is merged into the
+  file under an exclusive lock and swapped in with os.replace, so --workers
+  processes can share one file.
+
+Usage (from batch_grade.py):
+  --planner FILE    learn and apply capture ordering from FILE (default: off)
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+try:
+    import fcntl
+except ImportError:  # no advisory locks on Windows; os.replace still keeps the file whole
+    fcntl = None  # type: ignore
+
+
+MODES = ("direct", "debug")
+# Fresh visits an author/pattern needs before its history reorders attempts.
+MIN_TRIES = 3
+SCOPES = ("author", "pattern")
+
+_FIELDS = ("tries", "ok", "blocked", "ms", "lines")
+
+
+def author_key(url: str) -> Optional[str]:
+    """CodePen user of a pen URL (first path segment), lower-cased."""
+    parsed = urlparse((url or "").strip())
+    segments = [s for s in parsed.path.split("/") if s]
+    if not segments or not (parsed.hostname or "").endswith(("codepen.io", "cdpn.io")):
+        return None
+    return segments[0].lower()
+
+
+def pattern_key(url: str) -> Optional[str]:
+    """URL shape with the user and slug masked, e.g. 'codepen.io/*/pen/*'."""
+    parsed = urlparse((url or "").strip())
+    host = (parsed.hostname or "").lower()
+    segments = [s for s in parsed.path.split("/") if s]
+    if not host:
+        return None
+    shape = ["*" if i != 1 else s.lower() for i, s in enumerate(segments[:3])]
+    return "/".join([host] + shape)
+
+
+def outcome(bundle: Dict[str, Any]) -> Dict[str, int]:
+    """Counter deltas for one visit's bundle (ms is filled in by the caller)."""
+    import capture_bundle  # imports this module at load time
+    import grade_ch1_codepen as ch1
+
+    lines = bundle.get("lines") or []
+    blocked = bool(bundle.get("blocked")) or ch1.looks_blocked(lines)
+    ok = not blocked and capture_bundle.is_complete(bundle)
+    return {"tries": 1, "ok": int(ok), "blocked": int(blocked), "ms": 0, "lines": len(lines)}
+
+
+def _score(row: Optional[Dict[str, int]]) -> Tuple[float, float]:
+    """(smoothed success rate, mean ms) for a mode's counters."""
+    if not row or not row.get("tries"):
+        return 0.5, 0.0
+    tries = row["tries"]
+    return (row.get("ok", 0) + 1) / (tries + 2), row.get("ms", 0) / tries
+
+
+class Planner:
+    """Per-author / per-URL-pattern capture outcomes backed by a JSON file."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.data: Dict[str, Dict[str, Dict[str, Dict[str, int]]]] = self._read()
+        self.records = 0
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            data = {}
+        return {scope: dict(data.get(scope) or {}) for scope in SCOPES}
+
+    def plan(self, url: str) -> Tuple[List[str], Optional[str]]:
+        """Mode order for `url` and the step to log ('plan:...'), or the default order and None."""
+        for scope, key in (("author", author_key(url)), ("pattern", pattern_key(url))):
+            rows = self.data[scope].get(key or "") or {}
+            if sum(r.get("tries", 0) for r in rows.values()) < MIN_TRIES:
+                continue
+            order = sorted(MODES, key=lambda m: (-_score(rows.get(m))[0], _score(rows.get(m))[1]))
+            return order, f"plan:{'>'.join(order)}:{scope}"
+        return list(MODES), None
+
+    def record(self, url: str, mode: str, bundle: Dict[str, Any], seconds: float) -> None:
+        """Add one fresh visit of `url` in `mode` and merge it into the file."""
+        delta = outcome(bundle)
+        delta["ms"] = int(seconds * 1000)
+        keys = [(scope, key) for scope, key in (("author", author_key(url)), ("pattern", pattern_key(url))) if key]
+        self.records += 1
+        try:
+            self._merge(keys, mode, delta)
+        except Exception:
+            # Keep learning in memory when the file cannot be written.
+            for scope, key in keys:
+                self._add(self.data, scope, key, mode, delta)
+
+    @staticmethod
+    def _add(data: Dict[str, Any], scope: str, key: str, mode: str, delta: Dict[str, int]) -> None:
+        row = data[scope].setdefault(key, {}).setdefault(mode, {f: 0 for f in _FIELDS})
+        for f in _FIELDS:
+            row[f] = row.get(f, 0) + delta[f]
+
+    def _merge(self, keys: List[Tuple[str, str]], mode: str, delta: Dict[str, int]) -> None:
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        with open(self.path + ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                data = self._read()
+                for scope, key in keys:
+                    self._add(data, scope, key, mode, delta)
+                fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=1, sort_keys=True)
+                os.replace(tmp, self.path)
+                self.data = data
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+
+def ordered(planner: Optional[Planner], url: str, targets: Dict[str, Optional[str]]) -> Tuple[List[Tuple[str, Optional[str]]], Optional[str]]:
+    """(mode, target) pairs in planned order plus the step to log; default order without a planner."""
+    order, step = planner.plan(url) if planner is not None else (list(MODES), None)
+    return [(mode, targets.get(mode)) for mode in order], step
+
+
+# One Planner per file per process, shared by every capture in it.
+_planners: Dict[str, Planner] = {}
+
+
+def add_planner_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument('--planner', metavar='FILE',
+                    help='Order direct/Debug View attempts from per-author outcome stats kept in FILE')
+
+
+def from_args(args: argparse.Namespace) -> Optional[Planner]:
+    path = getattr(args, 'planner', None)
+    if not path:
+        return None
+    if path not in _planners:
+        _planners[path] = Planner(path)
+    return _planners[path]
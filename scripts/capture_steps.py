@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+One capture algorithm for both Playwright APIs.
+
+The capture logic (which frames to probe, what to evaluate, when to stop waiting,
+how fallbacks merge) is written once, as generators that yield actions and get
+the action's result sent back (or its exception thrown in):
+
+    value = yield ("eval", page, script)
+
+drive() performs those actions with playwright.sync_api objects (perform) and
+drive_async() awaits them with playwright.async_api objects (perform_async), so
+grade_ch1_codepen / capture_bundle / batch_grade and async_capture only keep thin
+shells that open contexts and pick a driver.
+
+Actions, as (kind, target, *args):
+  new_page(context)                    -> page
+  listen(page, event, handler)         page.on(event, handler)
+  expose(page, name, fn)               page.expose_function
+  goto(page, url, wait_until)
+  eval(page, script[, arg])            -> page.evaluate result
+  text(page, selector)                 -> first match's text_content, or None
+  value(page, selector)                -> first match's input_value, or None
+  scripts(page, all_frames)            -> text of every <script> on the page (or in every frame)
+  check(page, js, timeout_ms, frames)  -> True if `js` is truthy within timeout_ms (in every frame)
+  visible(page, selector)              -> bool
+  click(page, selector)
+  sleep(page, ms)                      sync: page.wait_for_timeout, which also pumps events
+  close(context)
+  terminate(context, page)             -> True if Runtime.terminateExecution was sent over CDP
+                                       to the page or any of its out-of-process frames
+"""
+
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Generator, List, Optional, Tuple
+
+
+Action = Tuple[Any, ...]
+Steps = Generator[Action, Any, Any]
+
+
+def drive(steps: Steps, act: Optional[Callable[..., Any]] = None) -> Any:
+    """Run `steps` to completion, performing each action with `act` (default perform). Returns its value."""
+    act = act or perform
+    result: Any = None
+    error: Optional[BaseException] = None
+    try:
+        while True:
+            action = steps.throw(error) if error is not None else steps.send(result)
+            result, error = None, None
+            try:
+                result = act(*action)
+            except Exception as e:
+                error = e
+    except StopIteration as done:
+        return done.value
+
+
+async def drive_async(steps: Steps, act: Optional[Callable[..., Awaitable[Any]]] = None) -> Any:
+    """drive() for playwright.async_api objects: every action is awaited (default perform_async)."""
+    act = act or perform_async
+    result: Any = None
+    error: Optional[BaseException] = None
+    try:
+        while True:
+            action = steps.throw(error) if error is not None else steps.send(result)
+            result, error = None, None
+            try:
+                result = await act(*action)
+            except Exception as e:
+                error = e
+    except StopIteration as done:
+        return done.value
+
+
+def _script_texts(scope: Any) -> List[str]:
+    texts: List[str] = []
+    try:
+        handles = scope.query_selector_all('script')
+    except Exception:
+        return texts
+    for h in handles:
+        try:
+            texts.append(h.text_content() or "")
+        except Exception:
+            texts.append("")
+    return texts
+
+
+async def _script_texts_async(scope: Any) -> List[str]:
+    texts: List[str] = []
+    try:
+        handles = await scope.query_selector_all('script')
+    except Exception:
+        return texts
+    for h in handles:
+        try:
+            texts.append(await h.text_content() or "")
+        except Exception:
+            texts.append("")
+    return texts
+
+
+def _terminate(context: Any, page: Any) -> bool:
+    sent = False
+    for target in [page] + list(page.frames[1:]):
+        try:
+            # Same-process frames raise here; the page's own session covers them.
+            session = context.new_cdp_session(target)
+        except Exception:
+            continue
+        try:
+            session.send("Runtime.terminateExecution")
+            sent = True
+        except Exception:
+            pass
+        try:
+            session.detach()
+        except Exception:
+            pass
+    return sent
+
+
+async def _terminate_async(context: Any, page: Any) -> bool:
+    sent = False
+    for target in [page] + list(page.frames[1:]):
+        try:
+            session = await context.new_cdp_session(target)
+        except Exception:
+            continue
+        try:
+            await session.send("Runtime.terminateExecution")
+            sent = True
+        except Exception:
+            pass
+        try:
+            await session.detach()
+        except Exception:
+            pass
+    return sent
+
+
+def perform(kind: str, target: Any, *args: Any) -> Any:
+    """Perform one action with playwright.sync_api objects."""
+    if kind == "new_page":
+        return target.new_page()
+    if kind == "listen":
+        return target.on(*args)
+    if kind == "expose":
+        return target.expose_function(*args)
+    if kind == "goto":
+        return target.goto(args[0], wait_until=args[1])
+    if kind == "eval":
+        return target.evaluate(*args)
+    if kind in ("text", "value"):
+        el = target.query_selector(args[0])
+        if not el:
+            return None
+        return el.text_content() if kind == "text" else el.input_value(timeout=500)
+    if kind == "scripts":
+        scopes = target.frames if args[0] else [target]
+        return [t for scope in scopes for t in _script_texts(scope)]
+    if kind == "check":
+        js, timeout_ms, all_frames = args
+        try:
+            for scope in (target.frames if all_frames else [target]):
+                scope.wait_for_function(js, timeout=timeout_ms)
+            return True
+        except Exception:
+            # Detached, navigating, still loading or unresponsive frames count as "not yet".
+            return False
+    if kind == "visible":
+        return target.is_visible(args[0])
+    if kind == "click":
+        return target.click(args[0], timeout=1000)
+    if kind == "sleep":
+        return target.wait_for_timeout(args[0])
+    if kind == "close":
+        return target.close()
+    if kind == "terminate":
+        return _terminate(target, args[0])
+    raise ValueError(f"unknown capture action: {kind}")
+
+
+async def perform_async(kind: str, target: Any, *args: Any) -> Any:
+    """perform() for playwright.async_api objects."""
+    if kind == "new_page":
+        return await target.new_page()
+    if kind == "listen":
+        return target.on(*args)
+    if kind == "expose":
+        return await target.expose_function(*args)
+    if kind == "goto":
+        return await target.goto(args[0], wait_until=args[1])
+    if kind == "eval":
+        return await target.evaluate(*args)
+    if kind in ("text", "value"):
+        el = await target.query_selector(args[0])
+        if not el:
+            return None
+        return await el.text_content() if kind == "text" else await el.input_value(timeout=500)
+    if kind == "scripts":
+        texts: List[str] = []
+        for scope in (target.frames if args[0] else [target]):
+            texts.extend(await _script_texts_async(scope))
+        return texts
+    if kind == "check":
+        js, timeout_ms, all_frames = args
+        try:
+            for scope in (target.frames if all_frames else [target]):
+                await scope.wait_for_function(js, timeout=timeout_ms)
+            return True
+        except Exception:
+            return False
+    if kind == "visible":
+        return await target.is_visible(args[0])
+    if kind == "click":
+        return await target.click(args[0], timeout=1000)
+    if kind == "sleep":
+        import asyncio  # only the async engine pays for it; the chapter CLIs import this module
+
+        return await asyncio.sleep(args[0] / 1000.0)
+    if kind == "close":
+        return await target.close()
+    if kind == "terminate":
+        return await _terminate_async(target, args[0])
+    raise ValueError(f"unknown capture action: {kind}")
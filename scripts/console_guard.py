@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Guardrails for pens that flood the console or never stop running.
+
+ConsoleBuffer replaces the plain list the console handlers used to append to.
+It keeps the first HEAD_LINES lines and a ring of the last TAIL_LINES, within a
+MAX_BYTES budget (single lines are cut at MAX_LINE_CHARS), and counts what it
+dropped. Graders see head + tail in order; the batch CSV reports the dropped
+count in its `truncated` column. Once FLOOD_LINES messages have arrived the
+buffer is `flooded` and captures stop waiting.
+
+Runaway pens are stopped at two levels.
+
+In the page, install() adds WATCHDOG_JS as an init script, so it runs in every
+frame before the pen does. It wraps console.log & co. and the timer functions:
+once the frame has logged FLOOD_LINES lines, or has been running longer than
+the capture timeout, the next console call throws (which breaks a logging
+`while (true)` loop) and timer/animation callbacks stop firing. It reports the
+reason to the host through a WATCHDOG_TAG console line, which ConsoleBuffer
+takes out of the output and keeps as `killed`.
+
+A loop that never logs or yields cannot be interrupted from JS. It blocks its
+renderer, and any later page.evaluate() on that frame would wait forever, so
+the host side covers it: the capture waits stop early once a frame has not
+answered PROBE_JS for BUSY_GRACE_S, and before evaluating a page again
+runaway_steps() probes every frame with a bounded wait_for_function. If a frame
+does not answer within PROBE_TIMEOUT_MS, or the console flooded, it sends
+Chromium's Runtime.terminateExecution over CDP to the page and to each
+out-of-process frame (CodePen's cdpn.io result iframe; capture_steps'
+"terminate" action).
+
+The reason ('flood' / 'busy' / 'timeout') ends up in the `killed` column, and
+annotate() copies it into the grader result so the student sees why their
+output was cut off.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+import json
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+
+HEAD_LINES = 2000
+TAIL_LINES = 500
+MAX_BYTES = 2_000_000
+MAX_LINE_CHARS = 10_000
+FLOOD_LINES = 50_000
+PROBE_TIMEOUT_MS = 500
+PROBE_JS = "() => true"
+BUSY_GRACE_S = 3.0
+WATCHDOG_GRACE_S = 2.0
+WATCHDOG_TAG = "__grader_watchdog__:"
+# Seconds of console silence (after every frame has loaded) that ends a capture early.
+# Here rather than in grade_ch1_codepen so batch_grade can offer --idle without loading a grader.
+DEFAULT_IDLE_SECONDS = 1.0
+
+# Page-side half of the guard (see module docstring); %(budget_ms)d, %(flood)d and
+# %(tag)s are filled in by watchdog_js().
+WATCHDOG_JS = r"""
+(() => {
+  if (window.__graderWatchdog) return;
+  const budgetMs = %(budget_ms)d, floodLines = %(flood)d, tag = %(tag)s;
+  const clock = performance.now.bind(performance);
+  const started = clock();
+  const clearIntervalRaw = window.clearInterval.bind(window);
+  let logged = 0, stopped = null;
+  const rawLog = console.log.bind(console);
+  function halt(reason) {
+    if (!stopped) {
+      stopped = reason;
+      try { rawLog(tag + reason); } catch (e) {}
+    }
+    return true;
+  }
+  function expired() {
+    return stopped !== null || (clock() - started > budgetMs && halt('timeout'));
+  }
+  window.__graderWatchdog = { expired: expired };
+  ['log', 'info', 'warn', 'error', 'debug'].forEach((name) => {
+    const orig = console[name];
+    if (typeof orig !== 'function') return;
+    console[name] = function () {
+      if (++logged > floodLines) halt('flood');
+      if (expired()) {
+        throw new Error(stopped === 'flood'
+          ? 'Stopped by the grader: too much console output'
+          : 'Stopped by the grader: still running at the time limit');
+      }
+      return orig.apply(this, arguments);
+    };
+  });
+  ['setTimeout', 'setInterval', 'requestAnimationFrame'].forEach((name) => {
+    const orig = window[name];
+    if (typeof orig !== 'function') return;
+    window[name] = function (fn, ...rest) {
+      if (typeof fn !== 'function') return orig.call(this, fn, ...rest);
+      let id;
+      id = orig.call(this, function () {
+        if (expired()) {
+          if (name === 'setInterval') clearIntervalRaw(id);
+          return;
+        }
+        return fn.apply(this, arguments);
+      }, ...rest);
+      return id;
+    };
+  });
+})();
+"""
+
+
+class ConsoleBuffer:
+    """Bounded console log: first `head` lines plus a ring of the last `tail` lines."""
+
+    def __init__(
+        self,
+        head: int = HEAD_LINES,
+        tail: int = TAIL_LINES,
+        max_bytes: int = MAX_BYTES,
+        flood: int = FLOOD_LINES,
+    ) -> None:
+        self.head_limit = head
+        self.tail_limit = tail
+        self.head_budget = max_bytes // 2
+        self.tail_budget = max_bytes - self.head_budget
+        self.flood_limit = flood
+        self.head: List[str] = []
+        self.tail: Deque[str] = deque()
+        self.head_bytes = 0
+        self.tail_bytes = 0
+        self.head_full = False
+        self.seen = 0
+        self.dropped = 0
+        self.killed: Optional[str] = None
+
+    def append(self, text: str) -> None:
+        if text.startswith(WATCHDOG_TAG):
+            # The page-side watchdog stopped the pen; keep its reason, not the line.
+            self.killed = self.killed or text[len(WATCHDOG_TAG):] or "timeout"
+            return
+        self.seen += 1
+        text = text if len(text) <= MAX_LINE_CHARS else text[:MAX_LINE_CHARS]
+        size = len(text.encode("utf-8", "replace"))
+        if not self.head_full:
+            if len(self.head) < self.head_limit and self.head_bytes + size <= self.head_budget:
+                self.head.append(text)
+                self.head_bytes += size
+                return
+            self.head_full = True
+        self.tail.append(text)
+        self.tail_bytes += size
+        while self.tail and (len(self.tail) > self.tail_limit or self.tail_bytes > self.tail_budget):
+            self.tail_bytes -= len(self.tail.popleft().encode("utf-8", "replace"))
+            self.dropped += 1
+
+    def lines(self) -> List[str]:
+        return self.head + list(self.tail)
+
+    @property
+    def truncated(self) -> bool:
+        return self.dropped > 0
+
+    @property
+    def flooded(self) -> bool:
+        return self.seen >= self.flood_limit or self.killed == "flood"
+
+    @property
+    def stopped(self) -> bool:
+        """True once the console flooded or the page-side watchdog fired: stop waiting."""
+        return self.flooded or self.killed is not None
+
+    def __len__(self) -> int:
+        return len(self.head) + len(self.tail)
+
+
+def watchdog_js(timeout: float, flood: int = FLOOD_LINES) -> str:
+    """WATCHDOG_JS for a capture that waits at most `timeout` seconds."""
+    budget_ms = int((max(0.0, timeout) + WATCHDOG_GRACE_S) * 1000)
+    return WATCHDOG_JS % {"budget_ms": budget_ms, "flood": int(flood), "tag": json.dumps(WATCHDOG_TAG)}
+
+
+def install(context: Any, timeout: float) -> None:
+    """Add the page-side watchdog to every page and frame `context` opens."""
+    context.add_init_script(script=watchdog_js(timeout))
+
+
+async def install_async(context: Any, timeout: float) -> None:
+    await context.add_init_script(script=watchdog_js(timeout))
+
+
+def describe(killed: Optional[str], truncated: int = 0) -> str:
+    """One sentence for students on why their console output is incomplete ('' if it is not)."""
+    parts = []
+    if killed == "flood":
+        parts.append(f"The pen printed more than {FLOOD_LINES} console lines and was stopped.")
+    elif killed == "busy":
+        parts.append("The pen stopped responding (most likely an endless loop) and was stopped.")
+    elif killed:
+        parts.append("The pen was still running when the time limit ran out "
+                     "(an endless loop or timer?) and was stopped.")
+    if truncated:
+        parts.append(f"{truncated} console lines from the middle of the output were not graded.")
+    return " ".join(parts)
+
+
+def annotate(result: Dict[str, Any], killed: Optional[str], truncated: int = 0) -> Dict[str, Any]:
+    """Record `killed`/`truncated` in the grader result's meta, with describe()'s note."""
+    if killed or truncated:
+        meta = result.setdefault("meta", {})
+        meta["killed"] = killed or None
+        meta["truncated"] = int(truncated or 0)
+        meta["output_note"] = describe(killed, truncated)
+    return result
+
+
+def message_text(msg: Any) -> str:
+    """Text of a Playwright ConsoleMessage (a method in the sync API, a property in the async one)."""
+    try:
+        return msg.text() if callable(msg.text) else msg.text
+    except Exception:
+        return str(msg)
+
+
+def recorder(buffer: ConsoleBuffer, activity: Optional[Dict[str, float]] = None) -> Callable[[Any], None]:
+    """page.on("console") handler appending to `buffer` and stamping `activity["last"]`."""
+    def on_console(msg: Any) -> None:
+        buffer.append(message_text(msg))
+        if activity is not None:
+            activity["last"] = time.time()
+
+    return on_console
+
+
+def runaway_steps(context: Any, page: Any, buffer: Optional[ConsoleBuffer] = None):
+    """capture_steps generator: terminate a flooding or hung page before it is evaluated again.
+
+    Returns the reason ('flood' / 'busy'), the reason the page-side watchdog already
+    stopped it for, or None.
+    """
+    if buffer is not None and buffer.flooded:
+        reason: Optional[str] = "flood"
+    elif not (yield ("check", page, PROBE_JS, PROBE_TIMEOUT_MS, True)):
+        reason = "busy"
+    else:
+        reason = None
+    if reason and (yield ("terminate", context, page)):
+        return reason
+    return buffer.killed if buffer is not None else None
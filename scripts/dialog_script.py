@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Scripted answers for prompt() / confirm() / alert() during captures.
+
+Headless Chromium auto-dismisses native dialogs, so a pen built around
+prompt() sees null and either bails out early or loops until the capture
+timeout. Graders whose assignments read input declare DIALOG_ANSWERS; the
+capture helpers inject them as an init script (every frame, including the
+cdpn.io result iframe) or evaluate them before simulated code runs, replacing
+the native dialogs with functions that answer immediately.
+
+DIALOG_ANSWERS entries:
+  "7"                          plain answer, used in order for unmatched prompts
+  ("radius", "3")              answer for any dialog whose message contains
+                               "radius" (case-insensitive); rules are tried in order
+  ("stop", ("kiwi", "stop"))   several answers for the same dialog, in order
+
+When a queue runs out its last answer repeats. confirm() is OK for answers
+like yes/y/ok/true/1; alert() returns at once. After MAX_DIALOGS dialogs the
+next one throws, which ends a prompt loop that never accepts its input.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, List, Optional, Sequence, Tuple, Union
+
+
+MAX_DIALOGS = 200
+
+Answer = Union[str, Tuple[str, Union[str, Sequence[str]]]]
+Answers = Sequence[Answer]
+
+_INSTALL_JS = """
+(() => {
+    const rules = %(rules)s;
+    const plain = %(plain)s;
+    const maxDialogs = %(max)d;
+    const used = new Map();
+    let count = 0;
+    const take = (key, queue) => {
+        const i = used.get(key) || 0;
+        used.set(key, i + 1);
+        return queue[Math.min(i, queue.length - 1)];
+    };
+    const answerFor = (message) => {
+        if (++count > maxDialogs) throw new Error("too many dialogs (" + maxDialogs + ")");
+        const text = String(message == null ? "" : message).toLowerCase();
+        for (let r = 0; r < rules.length; r++) {
+            if (text.includes(rules[r][0])) return take(r, rules[r][1]);
+        }
+        return plain.length ? take("plain", plain) : null;
+    };
+    window.prompt = (message) => answerFor(message);
+    window.confirm = (message) => /^(y|yes|ok|true|1)$/i.test(String(answerFor(message) || "").trim());
+    window.alert = () => {};
+})();
+"""
+
+
+def normalize_answers(answers: Optional[Answers]) -> Tuple[List[Tuple[str, List[str]]], List[str]]:
+    """Split DIALOG_ANSWERS into (rules, plain answers) with lower-cased needles."""
+    rules: List[Tuple[str, List[str]]] = []
+    plain: List[str] = []
+    for entry in answers or ():
+        if isinstance(entry, str):
+            plain.append(entry)
+            continue
+        needle, reply = entry
+        replies = [reply] if isinstance(reply, str) else [str(r) for r in reply]
+        if not replies:
+            raise ValueError(f"dialog rule {needle!r} has no answers")
+        rules.append((needle.lower(), replies))
+    return rules, plain
+
+
+def install_js(answers: Optional[Answers]) -> str:
+    """Script that replaces the page's dialog functions with scripted answers."""
+    rules, plain = normalize_answers(answers)
+    return _INSTALL_JS % {"rules": json.dumps(rules), "plain": json.dumps(plain), "max": MAX_DIALOGS}
+
+
+def answers_tag(answers: Optional[Answers]) -> str:
+    """Cache discriminator for a set of answers ('' when there are none)."""
+    rules, plain = normalize_answers(answers)
+    if not rules and not plain:
+        return ""
+    digest = hashlib.sha256(json.dumps([rules, plain]).encode("utf-8")).hexdigest()
+    return f"dlg:{digest[:12]}"
+
+
+def install(context: Any, answers: Optional[Answers]) -> None:
+    """Answer dialogs in every page/frame of a sync BrowserContext (no-op without answers)."""
+    if answers:
+        context.add_init_script(script=install_js(answers))
+
+
+async def install_async(context: Any, answers: Optional[Answers]) -> None:
+    """playwright.async_api counterpart of install()."""
+    if answers:
+        await context.add_init_script(script=install_js(answers))
+
+
+def with_answers(key: str, answers: Optional[Answers]) -> str:
+    """Append answers_tag(answers) to a cache key fragment."""
+    tag = answers_tag(answers)
+    if not tag:
+        return key
+    return f"{key}+{tag}" if key else tag
@@ -20,6 +20,11 @@ import sys
 from typing import Any, Dict, List, Optional, Tuple
 
 import grade_ch1_codepen as common
+import console_guard
+import grade_client
+
+
+CAPTURE_PARTS = ("console", "js")
 
 
 def has_functions(code_js: Optional[str], names: List[str]) -> bool:
@@ -105,6 +110,8 @@ def format_text_report(result: Dict[str, Any]) -> str:
     lines.append("")
     lines.append(f"Captured console lines: {result['meta']['captured_lines']}")
     lines.append(f"JS code available: {result['meta']['code_available']}")
+    if result['meta'].get('output_note'):
+        lines.append(f"Output cut off: {result['meta']['output_note']}")
     # Notes section summarizing any misses/partials
     checks = result.get('checks', [])
     misses = [c for c in checks if c.get('score', 0) < c.get('out_of', 0)]
@@ -130,6 +137,7 @@ def main(argv: Optional[List[str]] = None) -> int:
     p.add_argument('--js', dest='js_path', help='Optional path to JS code for checks')
     p.add_argument('--timeout', type=float, default=12.0)
     p.add_argument('--out', choices=['text','json'], default='text')
+    grade_client.add_server_args(p)
     args = p.parse_args(argv)
 
     lines: List[str] = []
@@ -147,23 +155,29 @@ def main(argv: Optional[List[str]] = None) -> int:
             return 2
         code_js = common.load_code_from_file(args.js_path)
 
+    if args.url and not lines:
+        rc = grade_client.grade_on_server(args, 10, format_text_report, url=args.url, js=code_js)
+        if rc is not None:
+            return rc
+
+    guard: Dict[str, Any] = {}
     if args.url and not lines:
         try:
-            l1, js1 = common.capture_console_from_codepen(args.url, timeout=args.timeout)
+            l1, js1 = common.capture_console_from_codepen(args.url, timeout=args.timeout, flags=guard)
             lines = l1
             code_js = code_js or js1
         except Exception:
             dbg = common.derive_debug_url(args.url)
             if dbg:
                 try:
-                    l2, js2 = common.capture_console_from_codepen(dbg, timeout=args.timeout)
+                    l2, js2 = common.capture_console_from_codepen(dbg, timeout=args.timeout, flags=guard)
                     lines = l2
                     code_js = code_js or js2
                 except Exception:
                     pass
 
     if code_js and (not lines or common.looks_blocked(lines)):
-        sim = common.simulate_console_with_js(code_js, timeout=6.0)
+        sim = common.simulate_console_with_js(code_js, timeout=6.0, flags=guard)
         if sim:
             lines = sim
 
@@ -172,6 +186,7 @@ def main(argv: Optional[List[str]] = None) -> int:
         return 2
 
     result = grade_ch10(lines, code_js)
+    console_guard.annotate(result, guard.get('killed'), guard.get('truncated') or 0)
     if args.out == 'json':
         print(json.dumps(result, indent=2))
     else:
@@ -24,7 +24,15 @@ import sys
 from html.parser import HTMLParser
 from typing import Any, Dict, List, Optional, Tuple
 
+import browser_pool
 import grade_ch1_codepen as common
+import grade_client
+import resource_policy
+
+
+# Single-visit capture parts for batch_grade: console + JS plus the DOM metrics,
+# page HTML and stylesheet text the layout checks use.
+CAPTURE_PARTS = ("console", "js", "dom", "html", "css")
 
 
 # Placeholder phrases from the starter template to detect whether the student updated content.
@@ -267,156 +275,110 @@ def analyze_html_structure(html_text: str) -> Dict[str, Any]:
     return finalize_metrics(parser.metrics)
 
 
-def capture_dom_snapshot(url: str, timeout: float = 12.0) -> Tuple[Optional[Dict[str, Any]], Optional[str], Optional[str], List[str], Optional[str]]:
-    """Load the CodePen page with Playwright and extract DOM metrics, HTML, and CSS."""
-    sync_playwright = common.try_import_playwright()
-    if not sync_playwright:
-        return None, None, None, [], "Playwright not available. Install with: pip install playwright"
+# Browser-side mirror of PortfolioHTMLParser + finalize_metrics().
+DOM_METRICS_JS = """
+() => {
+    const normalize = (value) => {
+        if (!value) return "";
+        return value.replace(/\\s+/g, " ").trim();
+    };
+    const header = document.querySelector("header h1");
+    const tagline = document.querySelector("header p");
+    const about = document.querySelector("#about p");
+    const aboutText = normalize(about ? about.textContent : "");
+    const aboutWords = aboutText ? aboutText.split(/\\s+/).filter(Boolean).length : 0;
+    const aboutImg = document.querySelector("#about img");
+    const cards = Array.from(document.querySelectorAll("#projects .card"));
+    const footerLinks = Array.from(document.querySelectorAll("footer a")).map((a) => ({
+        href: a.getAttribute("href") || "",
+        text: normalize(a.textContent || "")
+    }));
+    const cardTitles = cards.map((card) => {
+        const t = card.querySelector("h3");
+        return normalize(t ? t.textContent : "");
+    });
+    const cardDescriptions = cards.map((card) => {
+        const p = card.querySelector("p");
+        return normalize(p ? p.textContent : "");
+    });
+    const placeholderTitles = cardTitles.filter((title) =>
+        ["highlight one","highlight two","highlight three"].includes(title.toLowerCase())
+    ).length;
+    const placeholderBodies = cardDescriptions.filter((body) => {
+        const lower = body.toLowerCase();
+        return lower.includes("describe a project") ||
+               lower.includes("use consistent formatting") ||
+               lower.includes("add more cards if you have additional items to showcase");
+    }).length;
+    return {
+        header_text: normalize(header ? header.textContent : ""),
+        tagline: normalize(tagline ? tagline.textContent : ""),
+        header_placeholder: header ? header.textContent.toLowerCase().includes("your name") : false,
+        tagline_placeholder: tagline ? tagline.textContent.toLowerCase().includes("your title or tagline") : false,
+        about_text: aboutText,
+        about_words: aboutWords,
+        about_placeholder: aboutWords === 0 ? false : aboutText.toLowerCase().includes("introduce yourself with a brief bio"),
+        about_img_src: aboutImg ? aboutImg.getAttribute("src") || "" : "",
+        about_img_alt: aboutImg ? aboutImg.getAttribute("alt") || "" : "",
+        about_img_placeholder: aboutImg ? (aboutImg.getAttribute("src") || "").toLowerCase().includes("placeholder.com") : false,
+        has_grid_class: !!document.querySelector("#projects .grid"),
+        card_titles: cardTitles,
+        card_descriptions: cardDescriptions,
+        card_count: cards.length,
+        card_placeholder_count: placeholderTitles,
+        card_placeholder_descriptions: placeholderBodies,
+        footer_links: footerLinks,
+    };
+}
+"""
+
+# Concatenate readable stylesheet rules (inline <style> text for cross-origin sheets).
+STYLESHEET_TEXT_JS = """
+() => {
+    const chunks = [];
+    const sheets = Array.from(document.styleSheets || []);
+    for (const sheet of sheets) {
+        try {
+            const rules = sheet.cssRules || [];
+            for (const rule of Array.from(rules)) {
+                chunks.push(rule.cssText);
+            }
+        } catch (err) {
+            if (sheet.ownerNode && sheet.ownerNode.tagName === "STYLE") {
+                chunks.push(sheet.ownerNode.textContent || "");
+            }
+        }
+    }
+    return chunks.join("\\n");
+}
+"""
+
+OUTER_HTML_JS = "() => document.documentElement.outerHTML || ''"
 
-    steps: List[str] = []
-    error: Optional[str] = None
+
+def capture_dom_snapshot(
+    url: str,
+    timeout: float = 12.0,
+    pool: Optional[browser_pool.BrowserPool] = None,
+    policy: Optional[resource_policy.ResourcePolicy] = None,
+    stats: Optional[Dict[str, Any]] = None,
+) -> Tuple[Optional[Dict[str, Any]], Optional[str], Optional[str], List[str], Optional[str]]:
+    """Load the CodePen page once and return (metrics, html, css, steps, error).
+
+    Kept for callers of the old API; the capture itself is capture_bundle's dom/html/css visit.
+    `policy` defaults to the Ch. 12 resource policy, looked up per call.
+    """
+    # Imported here: capture_bundle itself imports this module.
+    import capture_bundle
+
+    if policy is None:
+        policy = resource_policy.policy_for_chapter(12)
 
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context()
-            page = context.new_page()
-
-            try:
-                page.goto(url, wait_until="domcontentloaded", timeout=timeout * 1000)
-            except Exception as nav_exc:  # pragma: no cover - navigation errors captured for diagnostics
-                error = f"navigate: {nav_exc}"
-                context.close()
-                browser.close()
-                return None, None, None, steps, error
-
-            page.wait_for_timeout(500)
-            try:
-                page.evaluate(
-                    """
-                    () => {
-                        const runButtons = [
-                            'button[title="Run"]',
-                            'button[aria-label="Run"]',
-                            'button:has-text("Run")',
-                            'button.run-button'
-                        ];
-                        for (const sel of runButtons) {
-                            const btn = document.querySelector(sel);
-                            if (btn) {
-                                btn.click();
-                                break;
-                            }
-                        }
-                    }
-                    """
-                )
-            except Exception:
-                pass
-
-            page.wait_for_timeout(400)
-
-            metrics: Optional[Dict[str, Any]] = None
-            try:
-                metrics = page.evaluate(
-                    """
-                    () => {
-                        const normalize = (value) => {
-                            if (!value) return "";
-                            return value.replace(/\\s+/g, " ").trim();
-                        };
-                        const header = document.querySelector("header h1");
-                        const tagline = document.querySelector("header p");
-                        const about = document.querySelector("#about p");
-                        const aboutText = normalize(about ? about.textContent : "");
-                        const aboutWords = aboutText ? aboutText.split(/\\s+/).filter(Boolean).length : 0;
-                        const aboutImg = document.querySelector("#about img");
-                        const cards = Array.from(document.querySelectorAll("#projects .card"));
-                        const footerLinks = Array.from(document.querySelectorAll("footer a")).map((a) => ({
-                            href: a.getAttribute("href") || "",
-                            text: normalize(a.textContent || "")
-                        }));
-                        const cardTitles = cards.map((card) => {
-                            const t = card.querySelector("h3");
-                            return normalize(t ? t.textContent : "");
-                        });
-                        const cardDescriptions = cards.map((card) => {
-                            const p = card.querySelector("p");
-                            return normalize(p ? p.textContent : "");
-                        });
-                        const placeholderTitles = cardTitles.filter((title) =>
-                            ["highlight one","highlight two","highlight three"].includes(title.toLowerCase())
-                        ).length;
-                        const placeholderBodies = cardDescriptions.filter((body) => {
-                            const lower = body.toLowerCase();
-                            return lower.includes("describe a project") ||
-                                   lower.includes("use consistent formatting") ||
-                                   lower.includes("add more cards if you have additional items to showcase");
-                        }).length;
-                        return {
-                            header_text: normalize(header ? header.textContent : ""),
-                            tagline: normalize(tagline ? tagline.textContent : ""),
-                            header_placeholder: header ? header.textContent.toLowerCase().includes("your name") : false,
-                            tagline_placeholder: tagline ? tagline.textContent.toLowerCase().includes("your title or tagline") : false,
-                            about_text: aboutText,
-                            about_words: aboutWords,
-                            about_placeholder: aboutWords === 0 ? false : aboutText.toLowerCase().includes("introduce yourself with a brief bio"),
-                            about_img_src: aboutImg ? aboutImg.getAttribute("src") || "" : "",
-                            about_img_alt: aboutImg ? aboutImg.getAttribute("alt") || "" : "",
-                            about_img_placeholder: aboutImg ? (aboutImg.getAttribute("src") || "").toLowerCase().includes("placeholder.com") : false,
-                            has_grid_class: !!document.querySelector("#projects .grid"),
-                            card_titles: cardTitles,
-                            card_descriptions: cardDescriptions,
-                            card_count: cards.length,
-                            card_placeholder_count: placeholderTitles,
-                            card_placeholder_descriptions: placeholderBodies,
-                            footer_links: footerLinks,
-                        };
-                    }
-                    """
-                )
-                steps.append("dom")
-            except Exception as e:  # pragma: no cover - evaluation failures captured for diagnostics
-                error = f"metrics: {e}"
-
-            html_text = ""
-            css_text = ""
-
-            try:
-                html_text = page.evaluate("() => document.documentElement.outerHTML || ''")
-            except Exception:
-                pass
-
-            try:
-                css_text = page.evaluate(
-                    """
-                    () => {
-                        const chunks = [];
-                        const sheets = Array.from(document.styleSheets || []);
-                        for (const sheet of sheets) {
-                            try {
-                                const rules = sheet.cssRules || [];
-                                for (const rule of Array.from(rules)) {
-                                    chunks.push(rule.cssText);
-                                }
-                            } catch (err) {
-                                if (sheet.ownerNode && sheet.ownerNode.tagName === "STYLE") {
-                                    chunks.push(sheet.ownerNode.textContent || "");
-                                }
-                            }
-                        }
-                        return chunks.join("\\n");
-                    }
-                    """
-                )
-            except Exception:
-                pass
-
-            context.close()
-            browser.close()
-            return metrics, html_text, css_text, steps, error
-    except Exception as outer_exc:  # pragma: no cover - top-level Playwright failures
-        return None, None, None, steps, str(outer_exc)
+        bundle = capture_bundle.capture_bundle(url, ("dom", "html", "css"), timeout=timeout, pool=pool, policy=policy, stats=stats)
+    except Exception as exc:
+        return None, None, None, [], str(exc)
+    return bundle["metrics"], bundle["html"], bundle["css"], bundle["steps"], bundle["error"]
 
 
 def detect_css_customization(css_text: Optional[str]) -> Tuple[bool, List[str]]:
@@ -619,6 +581,7 @@ def main(argv: Optional[List[str]] = None) -> int:
     parser.add_argument("--js", help="Path to JS file used in the pen")
     parser.add_argument("--timeout", type=float, default=12.0, help="Seconds to wait when loading a URL")
     parser.add_argument("--out", choices=["text", "json"], default="text")
+    grade_client.add_server_args(parser)
     args = parser.parse_args(argv)
 
     metrics: Optional[Dict[str, Any]] = None
@@ -648,41 +611,52 @@ def main(argv: Optional[List[str]] = None) -> int:
             return 2
         js_code = load_text_file(args.js)
 
+    if args.url and not (args.html or args.css or args.js):
+        rc = grade_client.grade_on_server(args, 12, format_text_report, url=args.url)
+        if rc is not None:
+            return rc
+
     if args.url:
+        # Imported here: capture_bundle itself imports this module.
+        import capture_bundle
+
+        policy = resource_policy.policy_for_chapter(12)
+        parts = ["console", "js"]
+        if metrics is None:
+            parts.append("dom")
+        if html_text is None:
+            parts.append("html")
+        if css_text is None:
+            parts.append("css")
         try:
-            lines, js_from_url = common.capture_console_from_codepen(args.url, timeout=args.timeout)
-            console_lines = lines
-            if js_from_url:
-                js_code = js_code or js_from_url
+            bundle = capture_bundle.capture_bundle(args.url, parts, timeout=args.timeout, policy=policy)
+            console_lines = bundle["lines"]
+            js_code = js_code or bundle["js"]
             attempts.append("console")
+            attempts.extend(bundle["steps"])
+            metrics = metrics or bundle["metrics"]
+            html_text = html_text or bundle["html"]
+            css_text = css_text or bundle["css"]
+            if bundle["error"]:
+                errors.append(bundle["error"])
         except Exception as exc:
             errors.append(f"console: {exc}")
 
-        if metrics is None or css_text is None or html_text is None:
-            snap_metrics, html_snap, css_snap, steps, snap_error = capture_dom_snapshot(args.url, timeout=args.timeout)
-            attempts.extend(steps)
-            if snap_metrics:
-                metrics = metrics or snap_metrics
-            if html_snap:
-                html_text = html_text or html_snap
-            if css_snap:
-                css_text = css_text or css_snap
-            if snap_error:
-                errors.append(snap_error)
-
-        if (metrics is None or css_text is None) and args.url:
+        if metrics is None or css_text is None:
             debug_url = common.derive_debug_url(args.url)
             if debug_url:
-                snap_metrics, html_snap, css_snap, steps, snap_error = capture_dom_snapshot(debug_url, timeout=args.timeout)
-                attempts.extend(steps)
-                if snap_metrics:
-                    metrics = metrics or snap_metrics
-                if html_snap:
-                    html_text = html_text or html_snap
-                if css_snap:
-                    css_text = css_text or css_snap
-                if snap_error:
-                    errors.append(f"debug: {snap_error}")
+                try:
+                    bundle = capture_bundle.capture_bundle(
+                        debug_url, ("dom", "html", "css"), timeout=args.timeout, policy=policy
+                    )
+                    attempts.extend(bundle["steps"])
+                    metrics = metrics or bundle["metrics"]
+                    html_text = html_text or bundle["html"]
+                    css_text = css_text or bundle["css"]
+                    if bundle["error"]:
+                        errors.append(f"debug: {bundle['error']}")
+                except Exception as exc:
+                    errors.append(f"debug: {exc}")
 
     if metrics is None:
         print("Error: Could not gather HTML structure metrics. Provide --html or ensure Playwright can load the CodePen URL.", file=sys.stderr)
@@ -21,14 +21,30 @@ Notes:
 from __future__ import annotations
 
 import argparse
+import calendar
 import json
 import os
 import re
 import sys
 import time
-from typing import List, Optional, Tuple, Dict, Any
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
+import block_detector
+import browser_pool
+import capture_steps
+import console_guard
+import dialog_script
+import grade_client
+import parse_canvas_submissions
+import rate_limit
+import resource_policy
+import storage_state
+
+
+# Parts of a single-visit capture (capture_bundle.PARTS) batch_grade collects for this grader.
+CAPTURE_PARTS = ("console", "js")
+
 
 def try_import_playwright():
     try:
@@ -47,10 +63,226 @@ def normalize_line(s: str) -> str:
     return s.strip()
 
 
-def capture_console_from_codepen(url: str, timeout: float = 10.0) -> Tuple[List[str], Optional[str]]:
+DEFAULT_IDLE_SECONDS = console_guard.DEFAULT_IDLE_SECONDS
+POLL_INTERVAL_MS = 100
+
+
+# Bounded readyState probes (capture_steps "check" actions), so a frame busy in an endless
+# loop counts as not ready instead of hanging the capture.
+FRAME_COMPLETE_JS = "() => document.readyState === 'complete'"
+DOM_READY_JS = "() => document.readyState !== 'loading'"
+
+
+def idle_steps(
+    page,
+    activity: Dict[str, float],
+    timeout: float,
+    idle: float = DEFAULT_IDLE_SECONDS,
+    stop: Optional[Callable[[], bool]] = None,
+):
+    """capture_steps generator behind wait_for_console_idle (and its async twin)."""
+    start = time.time()
+    end = start + timeout
+    loaded_at: Optional[float] = None
+    busy_since: Optional[float] = None
+    while True:
+        now = time.time()
+        if now >= end or (stop is not None and stop()):
+            break
+        if loaded_at is None and (yield ("check", page, FRAME_COMPLETE_JS, POLL_INTERVAL_MS, True)):
+            loaded_at = time.time()
+        if loaded_at is None or idle <= 0:
+            # A frame that stays unresponsive is stuck in a loop that never logs.
+            answered = yield ("check", page, console_guard.PROBE_JS, POLL_INTERVAL_MS, True)
+            busy_since = None if answered else (busy_since or time.time())
+            if busy_since is not None and time.time() - busy_since >= console_guard.BUSY_GRACE_S:
+                break
+        elif time.time() - max(loaded_at, activity.get("last", start)) >= idle:
+            break
+        yield ("sleep", page, min(POLL_INTERVAL_MS, max(1, int((end - time.time()) * 1000))))
+    return time.time() - start
+
+
+def wait_for_console_idle(
+    page,
+    activity: Dict[str, float],
+    timeout: float,
+    idle: float = DEFAULT_IDLE_SECONDS,
+    stop: Optional[Callable[[], bool]] = None,
+) -> float:
+    """
+    Pump Playwright events until the console has been quiet for `idle` seconds after all
+    frames finished loading, or until `timeout` seconds have passed (hard ceiling).
+    `activity["last"]` must be refreshed by the caller's console handler. `stop` (e.g. a
+    tripped BlockDetector) ends the wait immediately when it returns True, and so does a
+    frame that has not answered for console_guard.BUSY_GRACE_S (a silent endless loop).
+    Returns the number of seconds spent waiting.
+    """
+    return capture_steps.drive(idle_steps(page, activity, timeout, idle, stop))
+
+
+# Selectors tried (in order) to start a pen that does not auto-run.
+RUN_SELECTORS = [
+    'button[title="Run"]',
+    'button[aria-label="Run"]',
+    'button:has-text("Run")',
+    'button.run-button',
+]
+
+# Editor textareas that may mirror the pen's JS (Strategy 2).
+JS_TEXTAREA_SELECTORS = [
+    'textarea#box-js',
+    'textarea[name="js"]',
+    'textarea[data-type="js"]',
+    'div[data-test-id="editor-javascript"] textarea',
+    'div.js textarea',
+    '.CodeMirror textarea',
+]
+
+# Strategy 3: probe the Next.js global for the pen's JS.
+NEXT_DATA_PEN_JS = """
+() => {
+    try {
+        // Some CodePen pages may expose store-like globals; probe carefully
+        if (window.__NEXT_DATA__ && window.__NEXT_DATA__.props && window.__NEXT_DATA__.props.pageProps && window.__NEXT_DATA__.props.pageProps.pen) {
+            const pen = window.__NEXT_DATA__.props.pageProps.pen;
+            if (pen && pen.js) return pen.js;
+        }
+    } catch (e) {}
+    return null;
+}
+"""
+
+
+def pen_js_from_next_data(data_text: str) -> Optional[str]:
+    """Pull props.pageProps.pen.js out of a #__NEXT_DATA__ JSON blob (Strategy 1)."""
+    if not data_text or not data_text.strip():
+        return None
+    try:
+        next_data = json.loads(data_text)
+        # Probe common shapes for embedded code
+        return (
+            next_data.get("props", {})
+            .get("pageProps", {})
+            .get("pen", {})
+            .get("js", None)
+        )
+    except Exception:
+        return None
+
+
+def score_script_text(txt: str) -> int:
+    """Heuristic: prefer scripts with console.log and assignment markers."""
+    score = 0
+    score += txt.count('console.log')
+    if 'Starting Chapter 1 assignment' in txt:
+        score += 5
+    if "//" in txt:
+        score += 1
+    if "/*" in txt and "*/" in txt:
+        score += 1
+    return score
+
+
+def best_script_text(texts: List[str]) -> Optional[str]:
+    """Return the highest-scoring inline script (first wins ties), or None if none scores >= 1."""
+    best_code = None
+    best_score = -1
+    for txt in texts:
+        if not txt or not txt.strip():
+            continue
+        score = score_script_text(txt)
+        if score > best_score:
+            best_score = score
+            best_code = txt
+    if best_code and best_score >= 1:
+        return best_code
+    return None
+
+
+def run_button_steps(page):
+    """capture_steps generator: click the first visible Run button, if any."""
+    for sel in RUN_SELECTORS:
+        try:
+            if (yield ("visible", page, sel)):
+                yield ("click", page, sel)
+                break
+        except Exception:
+            pass
+
+
+def click_run_button(page) -> None:
+    """Best-effort: Click a Run button if present to ensure execution."""
+    capture_steps.drive(run_button_steps(page))
+
+
+def pen_js_steps(page):
+    """capture_steps generator: the pen's JS from the editor page (best effort), or None."""
+    js_code: Optional[str] = None
+
+    # Strategy 1: Next.js data blob
+    try:
+        js_code = pen_js_from_next_data((yield ("text", page, '#__NEXT_DATA__')) or "")
+    except Exception:
+        pass
+
+    # Strategy 2: Look for CodeMirror textareas that may mirror JS content
+    if not js_code:
+        try:
+            for sel in JS_TEXTAREA_SELECTORS:
+                val = yield ("value", page, sel)
+                if val and len(val.strip()) > 0:
+                    js_code = val
+                    break
+        except Exception:
+            pass
+
+    # Strategy 3: Execute code in page to try common global stores
+    if not js_code:
+        try:
+            js_code = yield ("eval", page, NEXT_DATA_PEN_JS)
+        except Exception:
+            pass
+
+    # Strategy 4: Inline <script> tags on the page (e.g., debug or full views)
+    if not js_code:
+        js_code = best_script_text((yield ("scripts", page, False)))
+
+    # Strategy 5: Scan all frames for inline <script> tags (some debug views render in frames)
+    if not js_code:
+        js_code = best_script_text((yield ("scripts", page, True)))
+
+    return js_code
+
+
+def extract_pen_js(page) -> Optional[str]:
+    """Attempt to extract JS code from the editor page (best effort, may fail)."""
+    return capture_steps.drive(pen_js_steps(page))
+
+
+def capture_console_from_codepen(
+    url: str,
+    timeout: float = 10.0,
+    pool: Optional[browser_pool.BrowserPool] = None,
+    idle: float = DEFAULT_IDLE_SECONDS,
+    policy: Optional[resource_policy.ResourcePolicy] = resource_policy.DEFAULT_POLICY,
+    stats: Optional[Dict[str, Any]] = None,
+    dialogs: Optional[dialog_script.Answers] = None,
+    flags: Optional[Dict[str, Any]] = None,
+) -> Tuple[List[str], Optional[str]]:
     """
     Navigate to the CodePen URL with Playwright, capture console output, and attempt to
     fetch the JS code from the editor page (best effort). Returns (console_lines, js_code or None).
+    The page runs in a fresh context borrowed from `pool` (defaults to the shared pool).
+    Capture stops once the console has been idle for `idle` seconds after load; `timeout`
+    is only a ceiling. Pass idle=0 to always wait the full timeout.
+    Requests matching `policy` (images, fonts, trackers by default; None = load everything)
+    are aborted; pass a resource_policy.new_stats() dict as `stats` to meter the page load.
+    The load waits for the host's rate_limit token and backs the host off if blocked.
+    prompt()/confirm() calls are answered from `dialogs` (a grader's DIALOG_ANSWERS).
+    Console output is kept in a bounded console_guard.ConsoleBuffer and a flooding or hung
+    pen is terminated before the JS is extracted; pass a dict as `flags` to receive
+    {"truncated": dropped line count, "killed": reason or None}.
     """
     sync_playwright = try_import_playwright()
     if not sync_playwright:
@@ -58,177 +290,37 @@ def capture_console_from_codepen(url: str, timeout: float = 10.0) -> Tuple[List[
             "Playwright not available. Install with: pip install playwright && python -m playwright install chromium"
         )
 
-    console_lines: List[str] = []
+    console_lines = console_guard.ConsoleBuffer()
+    killed: Optional[str] = None
     js_code: Optional[str] = None
-
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context()
+    activity: Dict[str, float] = {"last": time.time()}
+
+    pool = pool or browser_pool.get_pool()
+    with rate_limit.navigation(url, stats) as nav, pool.context() as context:
+        resource_policy.install(context, policy, stats)
+        storage_state.note(stats, pool, context)
+        dialog_script.install(context, dialogs)
+        console_guard.install(context, timeout)
         page = context.new_page()
-
-        def on_console(msg):
-            # Collect page-level console messages (includes iframes)
-            try:
-                text = msg.text()
-            except Exception:
-                text = str(msg)
-            console_lines.append(text)
-
-        page.on("console", on_console)
+        # Collect page-level console messages (includes iframes)
+        page.on("console", console_guard.recorder(console_lines, activity))
+        resource_policy.watch_page(page, stats)
+        detector = block_detector.BlockDetector().attach(page)
 
         page.goto(url, wait_until="domcontentloaded")
+        click_run_button(page)
 
-        # Best-effort: Click a Run button if present to ensure execution
-        run_selectors = [
-            'button[title="Run"]',
-            'button[aria-label="Run"]',
-            'button:has-text("Run")',
-            'button.run-button',
-        ]
-        for sel in run_selectors:
-            try:
-                if page.is_visible(sel):
-                    page.click(sel, timeout=1000)
-                    break
-            except Exception:
-                pass
-
-        # Wait a bit to collect console logs
-        end = time.time() + timeout
-        while time.time() < end:
-            time.sleep(0.2)
+        # Collect console logs until the pen goes quiet (timeout is the ceiling) or a
+        # block signal shows up, in which case the caller moves on to its fallback.
+        wait_for_console_idle(page, activity, timeout, idle, stop=lambda: detector.tripped or console_lines.stopped)
+        nav.blocked = detector.tripped
+        killed = capture_steps.drive(console_guard.runaway_steps(context, page, console_lines))
 
-        # Attempt to extract JS code from the editor page (best effort, may fail)
-        # Strategy 1: Next.js data blob
-        try:
-            handle = page.query_selector('#__NEXT_DATA__')
-            if handle:
-                data_text = handle.text_content() or ""
-                if data_text.strip():
-                    try:
-                        next_data = json.loads(data_text)
-                        # Probe common shapes for embedded code
-                        js_code = (
-                            next_data.get("props", {})
-                            .get("pageProps", {})
-                            .get("pen", {})
-                            .get("js", None)
-                        )
-                    except Exception:
-                        pass
-        except Exception:
-            pass
+        js_code = extract_pen_js(page)
 
-        # Strategy 2: Look for CodeMirror textareas that may mirror JS content
-        if not js_code:
-            try:
-                # A few possible selectors
-                candidates = [
-                    'textarea#box-js',
-                    'textarea[name="js"]',
-                    'textarea[data-type="js"]',
-                    'div[data-test-id="editor-javascript"] textarea',
-                    'div.js textarea',
-                    '.CodeMirror textarea',
-                ]
-                for sel in candidates:
-                    el = page.query_selector(sel)
-                    if not el:
-                        continue
-                    val = el.input_value(timeout=500)
-                    if val and len(val.strip()) > 0:
-                        js_code = val
-                        break
-            except Exception:
-                pass
-
-        # Strategy 3: Execute code in page to try common global stores
-        if not js_code:
-            try:
-                js_code = page.evaluate(
-                    """
-                    () => {
-                        try {
-                            // Some CodePen pages may expose store-like globals; probe carefully
-                            if (window.__NEXT_DATA__ && window.__NEXT_DATA__.props && window.__NEXT_DATA__.props.pageProps && window.__NEXT_DATA__.props.pageProps.pen) {
-                                const pen = window.__NEXT_DATA__.props.pageProps.pen;
-                                if (pen && pen.js) return pen.js;
-                            }
-                        } catch (e) {}
-                        return null;
-                    }
-                    """
-                )
-            except Exception:
-                pass
-
-        # Strategy 4: Inline <script> tags on the page (e.g., debug or full views)
-        if not js_code:
-            try:
-                handles = page.query_selector_all('script')
-                best_code = None
-                best_score = -1
-                for h in handles:
-                    try:
-                        txt = h.text_content() or ""
-                    except Exception:
-                        txt = ""
-                    if not txt or not txt.strip():
-                        continue
-                    # Heuristic: prefer scripts with console.log and assignment markers
-                    score = 0
-                    score += txt.count('console.log')
-                    if 'Starting Chapter 1 assignment' in txt:
-                        score += 5
-                    if "//" in txt:
-                        score += 1
-                    if "/*" in txt and "*/" in txt:
-                        score += 1
-                    if score > best_score:
-                        best_score = score
-                        best_code = txt
-                if best_code and best_score >= 1:
-                    js_code = best_code
-            except Exception:
-                pass
-
-        # Strategy 5: Scan all frames for inline <script> tags (some debug views render in frames)
-        if not js_code:
-            try:
-                best_code = None
-                best_score = -1
-                for frame in page.frames:
-                    try:
-                        scripts = frame.query_selector_all('script')
-                    except Exception:
-                        scripts = []
-                    for h in scripts:
-                        try:
-                            txt = h.text_content() or ""
-                        except Exception:
-                            txt = ""
-                        if not txt or not txt.strip():
-                            continue
-                        score = 0
-                        score += txt.count('console.log')
-                        if 'Starting Chapter 1 assignment' in txt:
-                            score += 5
-                        if "//" in txt:
-                            score += 1
-                        if "/*" in txt and "*/" in txt:
-                            score += 1
-                        if score > best_score:
-                            best_score = score
-                            best_code = txt
-                if best_code and best_score >= 1:
-                    js_code = best_code
-            except Exception:
-                pass
-
-        context.close()
-        browser.close()
-
-    return [normalize_line(l) for l in console_lines if normalize_line(l)], js_code
+    if flags is not None:
+        flags.update(truncated=console_lines.dropped, killed=killed)
+    return [normalize_line(l) for l in console_lines.lines() if normalize_line(l)], js_code
 
 
 def derive_debug_url(url: str) -> Optional[str]:
@@ -236,80 +328,235 @@ def derive_debug_url(url: str) -> Optional[str]:
     Examples:
       https://codepen.io/user/pen/slug -> https://cdpn.io/user/debug/slug
       https://codepen.io/user/full/slug -> https://cdpn.io/user/debug/slug
-    Returns None if it can't parse.
+    Returns None if it can't parse. Same rule as parse_canvas_submissions.derive_debug_url.
     """
-    try:
-        m = re.match(r"^https?://codepen\.io/([^/]+)/(?:(?:pen)|(?:full))/([^/?#]+)", url.strip())
-        if m:
-            user, slug = m.group(1), m.group(2)
-            return f"https://cdpn.io/{user}/debug/{slug}"
-    except Exception:
-        pass
-    return None
+    return parse_canvas_submissions.derive_debug_url(url)
 
 
 def looks_blocked(console_lines: List[str]) -> bool:
-    """Heuristic to detect when headless access is blocked by CF or COEP."""
-    text = "\n".join(console_lines).lower()
-    signals = [
-        "cloudflare",
-        "private access token",
-        "status of 401",
-        "status of 403",
-        "net::err_blocked_by_response",
-        "not same origin",
-    ]
-    return any(s in text for s in signals)
-
-
-def simulate_console_with_js(js_code: str, timeout: float = 5.0) -> List[str]:
+    """Heuristic to detect when headless access is blocked by CF or COEP (see block_detector)."""
+    return block_detector.match("\n".join(console_lines)) is not None
+
+
+# Max timer callbacks a virtual-time simulation runs (stops runaway setInterval loops).
+DEFAULT_VIRTUAL_STEPS = 10000
+
+# Virtual-time runner: replaces setTimeout/setInterval/requestAnimationFrame, Date and
+# performance.now with a virtual clock, runs the code, then fires pending timers in
+# (due time, scheduling order) without waiting, advancing the clock to each timer's due
+# time. A MessageChannel hop after every callback lets promise reactions settle. Stops
+# when no timers remain, after `maxSteps` callbacks, or after `budgetMs` of real time.
+VIRTUAL_TIME_RUN_JS = """
+async ({ code, maxSteps, budgetMs, epochMs }) => {
+    const RealDate = Date;
+    const realNow = performance.now.bind(performance);
+    const startedReal = realNow();
+    const report = (e) => console.error(String(e && e.message ? e.message : e));
+    let now = epochMs;
+    let order = 0;
+    let nextId = 0;
+    let steps = 0;
+    const timers = new Map();
+
+    const schedule = (fn, delay, args, repeat) => {
+        const id = ++nextId;
+        const ms = Math.max(0, Number(delay) || 0);
+        timers.set(id, { id, at: now + ms, order: ++order, fn, args, every: repeat ? Math.max(1, ms) : 0 });
+        return id;
+    };
+    const clear = (id) => { timers.delete(id); };
+    window.setTimeout = (fn, delay, ...args) => schedule(fn, delay, args, false);
+    window.setInterval = (fn, delay, ...args) => schedule(fn, delay, args, true);
+    window.clearTimeout = clear;
+    window.clearInterval = clear;
+    window.requestAnimationFrame = (fn) => schedule(() => fn(now - epochMs), 16, [], false);
+    window.cancelAnimationFrame = clear;
+
+    function VirtualDate(...args) {
+        if (!new.target) return new RealDate(now).toString();
+        return args.length ? new RealDate(...args) : new RealDate(now);
+    }
+    VirtualDate.prototype = RealDate.prototype;
+    VirtualDate.now = () => now;
+    VirtualDate.parse = RealDate.parse;
+    VirtualDate.UTC = RealDate.UTC;
+    window.Date = VirtualDate;
+    try { performance.now = () => now - epochMs; } catch (e) {}
+
+    const settle = () => new Promise((resolve) => {
+        const ch = new MessageChannel();
+        ch.port1.onmessage = () => {
+            ch.port1.close();
+            resolve();
+        };
+        ch.port2.postMessage(null);
+    });
+
+    try {
+        (0, eval)(code);
+    } catch (e) {
+        report(e);
+    }
+    await settle();
+
+    while (timers.size && steps < maxSteps && realNow() - startedReal < budgetMs) {
+        let next = null;
+        for (const t of timers.values()) {
+            if (!next || t.at < next.at || (t.at === next.at && t.order < next.order)) next = t;
+        }
+        now = Math.max(now, next.at);
+        if (next.every) {
+            next.at = now + next.every;
+            next.order = ++order;
+        } else {
+            timers.delete(next.id);
+        }
+        steps++;
+        try {
+            if (typeof next.fn === "function") next.fn(...next.args);
+            else (0, eval)(String(next.fn));
+        } catch (e) {
+            report(e);
+        }
+        await settle();
+    }
+    return { steps, pending: timers.size, virtualMs: now - epochMs };
+}
+"""
+
+# Real seconds a virtual-time run may take beyond its own budget before it counts as hung.
+VIRTUAL_GRACE_S = 1.0
+
+# Simulation entry point. The student's code runs from a timer, so page.evaluate() returns
+# at once even if the code never finishes, via indirect eval (global scope; errors become
+# console lines) or VIRTUAL_TIME_RUN_JS. The exposed binding window.__graderDone is called
+# once the code has run (with virtual time: once the timer queue has drained).
+RUN_USER_CODE_JS = """
+(job) => {
+    const report = (e) => console.error(String(e && e.message ? e.message : e));
+    const finish = () => {
+        try {
+            window.__graderDone();
+        } catch (e) {}
+    };
+    const runVirtual = %s;
+    window.setTimeout(() => {
+        if (job.virtual) {
+            runVirtual(job.args).then(finish, (e) => {
+                report(e);
+                finish();
+            });
+            return;
+        }
+        try {
+            (0, eval)(job.code);
+        } catch (e) {
+            report(e);
+        }
+        finish();
+    }, 0);
+}
+""" % VIRTUAL_TIME_RUN_JS.strip()
+
+
+def virtual_epoch_ms() -> int:
+    """Virtual clock start: 00:00 UTC on Jan 1 of the current year (stable across runs, realistic year)."""
+    year = time.gmtime().tm_year
+    return int(calendar.timegm((year, 1, 1, 0, 0, 0, 0, 0, 0)) * 1000)
+
+
+def virtual_time_args(js_code: str, timeout: float, max_steps: int = DEFAULT_VIRTUAL_STEPS) -> Dict[str, Any]:
+    return {"code": js_code, "maxSteps": max_steps, "budgetMs": int(timeout * 1000), "epochMs": virtual_epoch_ms()}
+
+
+def simulation_job(js_code: str, timeout: float, virtual_time: bool = False, max_steps: int = DEFAULT_VIRTUAL_STEPS) -> Dict[str, Any]:
+    """Argument for RUN_USER_CODE_JS."""
+    return {
+        "code": js_code,
+        "virtual": virtual_time,
+        "args": virtual_time_args(js_code, timeout, max_steps) if virtual_time else None,
+    }
+
+
+def simulation_steps(
+    context,
+    lines: console_guard.ConsoleBuffer,
+    outcome: Dict[str, Any],
+    js_code: str,
+    timeout: float,
+    virtual_time: bool = False,
+    max_steps: int = DEFAULT_VIRTUAL_STEPS,
+    dialogs: Optional[dialog_script.Answers] = None,
+):
+    """capture_steps generator behind simulate_console_with_js (and its async twin).
+    Console lines go to `lines`; outcome["killed"] is set when the run had to be stopped."""
+    state = {"done": False}
+    page = yield ("new_page", context)
+    yield ("listen", page, "console", console_guard.recorder(lines))
+    yield ("expose", page, "__graderDone", lambda *_: state.update(done=True))
+    yield ("goto", page, "about:blank", "load")
+    if dialogs:
+        yield ("eval", page, dialog_script.install_js(dialogs))
+    # Virtual time ends when the timer queue drains; real time keeps collecting
+    # delayed output for the whole `timeout`.
+    budget = timeout + (VIRTUAL_GRACE_S if virtual_time else 0.0)
+    yield ("eval", page, console_guard.watchdog_js(budget))
+    yield ("eval", page, RUN_USER_CODE_JS, simulation_job(js_code, timeout, virtual_time, max_steps))
+
+    end = time.time() + budget
+    while time.time() < end and not lines.stopped and not (virtual_time and state["done"]):
+        yield ("sleep", page, POLL_INTERVAL_MS)
+    if lines.flooded or not state["done"]:
+        if (yield ("terminate", context, page)):
+            outcome["killed"] = "flood" if lines.flooded else "timeout"
+    outcome["killed"] = outcome["killed"] or lines.killed
+
+
+def simulation_lines(
+    lines: console_guard.ConsoleBuffer,
+    outcome: Dict[str, Any],
+    flags: Optional[Dict[str, Any]] = None,
+) -> List[str]:
+    """Normalized lines of a simulation; `flags` (if given) receives truncated/killed."""
+    if flags is not None:
+        flags.update(truncated=lines.dropped, killed=outcome.get("killed"))
+    return [normalize_line(l) for l in lines.lines() if normalize_line(l)]
+
+
+def simulate_console_with_js(
+    js_code: str,
+    timeout: float = 5.0,
+    pool: Optional[browser_pool.BrowserPool] = None,
+    virtual_time: bool = False,
+    max_steps: int = DEFAULT_VIRTUAL_STEPS,
+    dialogs: Optional[dialog_script.Answers] = None,
+    flags: Optional[Dict[str, Any]] = None,
+) -> List[str]:
     """Run the provided JS code in a fresh headless page and capture console lines.
     This provides a fallback when CodePen blocks direct console capture.
+    With `virtual_time`, timers are fast-forwarded on a virtual clock (VIRTUAL_TIME_RUN_JS)
+    and the call returns once the timer queue is empty instead of sleeping `timeout`
+    seconds, which then only bounds the real time spent firing timers.
+    `dialogs` scripts prompt()/confirm() answers (see dialog_script).
+    The code starts from a timer (RUN_USER_CODE_JS), so an endless loop cannot block this
+    call: code still running at the deadline, or flooding the console, is terminated via
+    console_guard and `flags` (if given) receives {"truncated": n, "killed": reason}.
     """
     sync_playwright = try_import_playwright()
     if not sync_playwright:
         return []
 
-    lines: List[str] = []
+    lines = console_guard.ConsoleBuffer()
+    outcome: Dict[str, Any] = {"killed": None}
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context()
-            page = context.new_page()
-
-            def on_console(msg):
-                try:
-                    text = msg.text()
-                except Exception:
-                    text = str(msg)
-                lines.append(normalize_line(text))
-
-            page.on("console", on_console)
-            page.goto("about:blank")
-
-            # Evaluate the user's JS code in the page context.
-            page.evaluate(
-                """
-                (code) => {
-                    try {
-                        (0, eval)(code);
-                    } catch (e) {
-                        console.error(String(e && e.message ? e.message : e));
-                    }
-                }
-                """,
-                js_code,
-            )
-
-            end = time.time() + timeout
-            while time.time() < end:
-                time.sleep(0.1)
-
-            context.close()
-            browser.close()
+        pool = pool or browser_pool.get_pool()
+        with pool.context() as context:
+            capture_steps.drive(simulation_steps(
+                context, lines, outcome, js_code, timeout, virtual_time, max_steps, dialogs,
+            ))
     except Exception:
         pass
-    return [l for l in lines if l]
+    return simulation_lines(lines, outcome, flags)
 
 
 def load_lines_from_file(path: str) -> List[str]:
@@ -576,6 +823,8 @@ def format_text_report(result: Dict[str, Any]) -> str:
     lines.append("")
     lines.append(f"Captured console lines: {result['meta']['captured_lines']}")
     lines.append(f"JS code available: {result['meta']['code_available']}")
+    if result['meta'].get('output_note'):
+        lines.append(f"Output cut off: {result['meta']['output_note']}")
     # Notes section summarizing any misses/partials
     checks = result.get('checks', [])
     misses = [c for c in checks if c.get('score', 0) < c.get('out_of', 0)]
@@ -607,11 +856,14 @@ def summarize_notes(checks: List[Dict[str, Any]]) -> str:
 def main(argv: Optional[List[str]] = None) -> int:
     p = argparse.ArgumentParser(description="Grade Ch. 1 CodePen submission")
     p.add_argument("--url", help="CodePen URL", default=None)
-    p.add_argument("--timeout", type=float, default=10.0, help="Seconds to capture console output")
+    p.add_argument("--timeout", type=float, default=10.0, help="Max seconds to capture console output")
+    p.add_argument("--idle", type=float, default=DEFAULT_IDLE_SECONDS, help="Stop after this many quiet seconds once loaded (0 = full timeout)")
+    p.add_argument("--virtual-time", action="store_true", help="Simulated fallback: fast-forward timers on a virtual clock")
     p.add_argument("--from-logs", dest="logs", help="Path to a newline-delimited console log file")
     p.add_argument("--js", dest="js_path", help="Optional path to local JS code for comment/quote checks")
     p.add_argument("--out", choices=["text", "json"], default="text", help="Output format")
     p.add_argument("--assume-comments-ok", action="store_true", help="If JS code is unavailable, award full comment points.")
+    grade_client.add_server_args(p)
     args = p.parse_args(argv)
 
     console_lines: List[str] = []
@@ -629,10 +881,16 @@ def main(argv: Optional[List[str]] = None) -> int:
             return 2
         code_js = load_code_from_file(args.js_path)
 
+    if args.url and not console_lines and not args.assume_comments_ok and not args.virtual_time:
+        rc = grade_client.grade_on_server(args, 1, format_text_report, url=args.url, js=code_js)
+        if rc is not None:
+            return rc
+
+    guard: Dict[str, Any] = {}
     if args.url and not console_lines:
         # First attempt: given URL
         try:
-            console_lines, js_from_web = capture_console_from_codepen(args.url, timeout=args.timeout)
+            console_lines, js_from_web = capture_console_from_codepen(args.url, timeout=args.timeout, idle=args.idle, flags=guard)
             if js_from_web:
                 code_js = js_from_web
         except Exception as e:
@@ -642,7 +900,7 @@ def main(argv: Optional[List[str]] = None) -> int:
             if dbg:
                 print(f"Info: retrying with Debug View: {dbg}", file=sys.stderr)
                 try:
-                    console_lines, js_from_web = capture_console_from_codepen(dbg, timeout=args.timeout)
+                    console_lines, js_from_web = capture_console_from_codepen(dbg, timeout=args.timeout, idle=args.idle, flags=guard)
                     if js_from_web:
                         code_js = js_from_web
                 except Exception as e2:
@@ -658,7 +916,7 @@ def main(argv: Optional[List[str]] = None) -> int:
                 if dbg:
                     print(f"Info: attempting Debug View due to blocked signals: {dbg}", file=sys.stderr)
                     try:
-                        lines2, js2 = capture_console_from_codepen(dbg, timeout=args.timeout)
+                        lines2, js2 = capture_console_from_codepen(dbg, timeout=args.timeout, idle=args.idle, flags=guard)
                         # Prefer the debug capture if it produced more meaningful lines
                         if lines2:
                             console_lines = lines2
@@ -669,7 +927,7 @@ def main(argv: Optional[List[str]] = None) -> int:
 
     if code_js and (not console_lines or looks_blocked(console_lines)):
         # Fallback: simulate console output by executing JS code in a blank page
-        simulated = simulate_console_with_js(code_js)
+        simulated = simulate_console_with_js(code_js, virtual_time=args.virtual_time, flags=guard)
         if simulated:
             console_lines = simulated
 
@@ -678,6 +936,7 @@ def main(argv: Optional[List[str]] = None) -> int:
         return 2
 
     result = grade_ch1(console_lines, code_js, assume_comments_ok=args.assume_comments_ok)
+    console_guard.annotate(result, guard.get("killed"), guard.get("truncated") or 0)
     if args.out == "json":
         print(json.dumps(result, indent=2))
     else:
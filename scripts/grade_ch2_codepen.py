@@ -30,6 +30,18 @@ try:
 except Exception as e:
     print(f"Error: cannot import grade_ch1_codepen helpers: {e}", file=sys.stderr)
     raise
+import console_guard
+import grade_client
+
+
+CAPTURE_PARTS = ("console", "js")
+
+# Answers for prompt() during captures (dialog_script): the Prompt+Number swap reads two numbers.
+DIALOG_ANSWERS = (
+    ("first number", "7"),
+    ("second number", "3"),
+    "5",
+)
 
 
 def normalize_line(s: str) -> str:
@@ -143,6 +155,8 @@ def format_text_report(result: Dict[str, Any]) -> str:
     lines.append("")
     lines.append(f"Captured console lines: {result['meta']['captured_lines']}")
     lines.append(f"JS code available: {result['meta']['code_available']}")
+    if result['meta'].get('output_note'):
+        lines.append(f"Output cut off: {result['meta']['output_note']}")
     # Notes section summarizing any misses/partials
     checks = result.get('checks', [])
     misses = [c for c in checks if c.get('score', 0) < c.get('out_of', 0)]
@@ -168,6 +182,7 @@ def main(argv: Optional[List[str]] = None) -> int:
     p.add_argument("--js", dest="js_path", help="Optional path to JS code for checks")
     p.add_argument("--timeout", type=float, default=12.0, help="Seconds to capture console output")
     p.add_argument("--out", choices=["text","json"], default="text")
+    grade_client.add_server_args(p)
     args = p.parse_args(argv)
 
     console_lines: List[str] = []
@@ -185,9 +200,15 @@ def main(argv: Optional[List[str]] = None) -> int:
             return 2
         code_js = common.load_code_from_file(args.js_path)
 
+    if args.url and not console_lines:
+        rc = grade_client.grade_on_server(args, 2, format_text_report, url=args.url, js=code_js)
+        if rc is not None:
+            return rc
+
+    guard: Dict[str, Any] = {}
     if args.url and not console_lines:
         try:
-            lines, js = common.capture_console_from_codepen(args.url, timeout=args.timeout)
+            lines, js = common.capture_console_from_codepen(args.url, timeout=args.timeout, dialogs=DIALOG_ANSWERS, flags=guard)
             console_lines = lines
             code_js = code_js or js
         except Exception as e:
@@ -195,7 +216,7 @@ def main(argv: Optional[List[str]] = None) -> int:
             if dbg:
                 print(f"Info: retrying with Debug View: {dbg}", file=sys.stderr)
                 try:
-                    lines, js = common.capture_console_from_codepen(dbg, timeout=args.timeout)
+                    lines, js = common.capture_console_from_codepen(dbg, timeout=args.timeout, dialogs=DIALOG_ANSWERS, flags=guard)
                     console_lines = lines
                     code_js = code_js or js
                 except Exception as e2:
@@ -203,7 +224,7 @@ def main(argv: Optional[List[str]] = None) -> int:
 
     # If blocked, try simulating console from code
     if code_js and (not console_lines or common.looks_blocked(console_lines)):
-        sim = common.simulate_console_with_js(code_js, timeout=6.0)
+        sim = common.simulate_console_with_js(code_js, timeout=6.0, dialogs=DIALOG_ANSWERS, flags=guard)
         if sim:
             console_lines = sim
 
@@ -212,6 +233,7 @@ def main(argv: Optional[List[str]] = None) -> int:
         return 2
 
     result = grade_ch2(console_lines, code_js)
+    console_guard.annotate(result, guard.get('killed'), guard.get('truncated') or 0)
     if args.out == 'json':
         print(json.dumps(result, indent=2))
     else:
@@ -25,6 +25,23 @@ import sys
 from typing import Any, Dict, List, Optional, Tuple
 
 import grade_ch1_codepen as common
+import console_guard
+import grade_client
+
+
+CAPTURE_PARTS = ("console", "js")
+
+# Answers for prompt() during captures (dialog_script). Validation loops get one rejected
+# value first so the reprompt path runs; the yes/no loop ends on the second answer.
+DIALOG_ANSWERS = (
+    ("how many turns", "3"),
+    ("starting number", "4"),
+    ("<= 100", ("150", "42")),
+    ("between 50 and 100", ("20", "75")),
+    ("2..9", ("12", "7")),
+    ('"yes" or "no"', ("maybe", "yes")),
+    "5",
+)
 
 
 def check_carousel(lines: List[str], code_js: Optional[str]) -> Tuple[int, int, str]:
@@ -130,6 +147,8 @@ def format_text_report(result: Dict[str, Any]) -> str:
     lines.append("")
     lines.append(f"Captured console lines: {result['meta']['captured_lines']}")
     lines.append(f"JS code available: {result['meta']['code_available']}")
+    if result['meta'].get('output_note'):
+        lines.append(f"Output cut off: {result['meta']['output_note']}")
     # Notes section summarizing any misses/partials
     checks = result.get('checks', [])
     misses = [c for c in checks if c.get('score', 0) < c.get('out_of', 0)]
@@ -155,6 +174,7 @@ def main(argv: Optional[List[str]] = None) -> int:
     p.add_argument('--js', dest='js_path', help='Optional path to JS code for checks')
     p.add_argument('--timeout', type=float, default=12.0)
     p.add_argument('--out', choices=['text','json'], default='text')
+    grade_client.add_server_args(p)
     args = p.parse_args(argv)
 
     lines: List[str] = []
@@ -172,23 +192,29 @@ def main(argv: Optional[List[str]] = None) -> int:
             return 2
         code_js = common.load_code_from_file(args.js_path)
 
+    if args.url and not lines:
+        rc = grade_client.grade_on_server(args, 4, format_text_report, url=args.url, js=code_js)
+        if rc is not None:
+            return rc
+
+    guard: Dict[str, Any] = {}
     if args.url and not lines:
         try:
-            l1, js1 = common.capture_console_from_codepen(args.url, timeout=args.timeout)
+            l1, js1 = common.capture_console_from_codepen(args.url, timeout=args.timeout, dialogs=DIALOG_ANSWERS, flags=guard)
             lines = l1
             code_js = code_js or js1
         except Exception:
             dbg = common.derive_debug_url(args.url)
             if dbg:
                 try:
-                    l2, js2 = common.capture_console_from_codepen(dbg, timeout=args.timeout)
+                    l2, js2 = common.capture_console_from_codepen(dbg, timeout=args.timeout, dialogs=DIALOG_ANSWERS, flags=guard)
                     lines = l2
                     code_js = code_js or js2
                 except Exception:
                     pass
 
     if code_js and (not lines or common.looks_blocked(lines)):
-        sim = common.simulate_console_with_js(code_js, timeout=6.0)
+        sim = common.simulate_console_with_js(code_js, timeout=6.0, dialogs=DIALOG_ANSWERS, flags=guard)
         if sim:
             lines = sim
 
@@ -197,6 +223,7 @@ def main(argv: Optional[List[str]] = None) -> int:
         return 2
 
     result = grade_ch4(lines, code_js)
+    console_guard.annotate(result, guard.get('killed'), guard.get('truncated') or 0)
     if args.out == 'json':
         print(json.dumps(result, indent=2))
     else:
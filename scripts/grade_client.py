@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Thin client for the local grading daemon (grade_server.py).
+
+The server is opt-in: a chapter CLI hands its --url job to a daemon only when
+given `--server [URL]` (default DEFAULT_SERVER) or when GRADER_SERVER is set
+in the environment; otherwise it never touches the network before grading
+locally. `--server off` / GRADER_SERVER=off turn it off again.
+
+A job the server never accepted (nothing listening within HEALTH_TIMEOUT_S,
+a full queue, a rejected request) is graded locally with a warning. Once the
+server has accepted the job, a failure there is an error (exit 1): the page
+was already loaded once, and grading again locally would double the wait
+for the same outcome. `--server-fallback` grades locally in that case too.
+
+urllib is imported on first use so offline CLI runs do not pay for it.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from typing import Any, Callable, Dict, Optional
+
+
+DEFAULT_SERVER = "http://127.0.0.1:8765"
+HEALTH_TIMEOUT_S = 0.3
+SUBMIT_TIMEOUT_S = 3.0
+OFF = ("off", "0", "no", "none")
+
+
+def server_url(flag: Optional[str] = None) -> Optional[str]:
+    """The server to use: `flag` ('' for bare --server), else GRADER_SERVER; None for local grading."""
+    env = os.environ.get("GRADER_SERVER", "").strip()
+    if flag is None:
+        url = env
+    else:
+        url = flag.strip() or env or DEFAULT_SERVER
+    if not url or url.lower() in OFF:
+        return None
+    return url.rstrip("/")
+
+
+def add_server_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument('--server', nargs='?', const='', metavar='URL',
+                    help=f'Grade --url on a running grade_server.py (default {DEFAULT_SERVER}, or GRADER_SERVER; '
+                         'setting GRADER_SERVER also turns this on)')
+    ap.add_argument('--server-fallback', action='store_true',
+                    help='Grade locally when the server accepted the job but failed it')
+
+
+def _request(url: str, body: Optional[Dict[str, Any]], timeout: float) -> Dict[str, Any]:
+    import urllib.request
+
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read().decode("utf-8"))
+
+
+def available(base: Optional[str] = None) -> bool:
+    base = base or server_url()
+    if not base:
+        return False
+    try:
+        return _request(base + "/health", None, HEALTH_TIMEOUT_S).get("status") == "ok"
+    except Exception:
+        return False
+
+
+class ServerError(RuntimeError):
+    """The server accepted a job and then failed it (or stopped answering)."""
+
+
+def remote_grade(chapter: int, base: Optional[str], timeout: float = 12.0, **job: Any) -> Optional[Dict[str, Any]]:
+    """Grade `job` (url/logs/js/html/css) on the server at `base` and return the grader's result.
+
+    None when there is no server or it did not accept the job (grade locally);
+    raises ServerError when it accepted the job and then failed it.
+    """
+    if not base:
+        return None
+    if not available(base):
+        print(f"Warning: no grading server at {base}; grading locally", file=sys.stderr)
+        return None
+    body = {k: v for k, v in job.items() if v is not None}
+    body.update(chapter=chapter, timeout=timeout)
+    try:
+        job_id = _request(base + "/grade", body, SUBMIT_TIMEOUT_S)["id"]
+    except Exception as e:
+        print(f"Warning: grading server at {base} did not take the job ({e}); grading locally", file=sys.stderr)
+        return None
+    try:
+        # Queue wait plus direct, Debug View and simulated attempts; longer than the server's
+        # own ?wait=1 limit (grade_server.wait_limit), so its 504 arrives first.
+        reply = _request(f"{base}/jobs/{job_id}?wait=1", None, timeout * 4 + 60)
+    except Exception as e:
+        raise ServerError(f"grading server at {base}, job {job_id}: {e}")
+    if reply.get("status") != "done":
+        raise ServerError(f"grading server at {base}, job {job_id}: {reply.get('error') or reply.get('status')}")
+    print(f"Info: graded by server at {base}", file=sys.stderr)
+    return reply.get("result")
+
+
+def grade_on_server(
+    args: argparse.Namespace,
+    chapter: int,
+    report: Callable[[Dict[str, Any]], str],
+    **job: Any,
+) -> Optional[int]:
+    """Run a chapter CLI's --url job on the server (--server / GRADER_SERVER) and print its result.
+
+    Returns the CLI's exit code when the server settled the job (0, or 1 when it
+    failed it), or None to grade locally.
+    """
+    try:
+        result = remote_grade(chapter, server_url(args.server), timeout=args.timeout, **job)
+    except ServerError as e:
+        if not args.server_fallback:
+            print(f"Error: {e} (pass --server-fallback to grade locally instead)", file=sys.stderr)
+            return 1
+        print(f"Warning: {e}; grading locally", file=sys.stderr)
+        return None
+    if result is None:
+        return None
+    print(json.dumps(result, indent=2) if args.out == "json" else report(result))
+    return 0
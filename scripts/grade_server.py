@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Local grading daemon: warm browsers behind a small HTTP job queue.
+
+Every chapter CLI run pays for Python startup, imports and a Chromium launch.
+During office hours that dominates ad-hoc grading, so this server keeps
+`--workers` threads, each with its own warm browser_pool.BrowserPool, and
+takes jobs over HTTP (stdlib http.server, bound to 127.0.0.1 by default):
+
+  POST /grade          {"chapter": 5, "url": "..."} or {"chapter": 5, "logs": "...", "js": "..."}
+                       (ch12: "html"/"css" instead of logs; optional "timeout")
+                       -> 202 {"id", "status": "queued"}; add ?wait=1 to block until done
+  GET  /jobs/<id>      -> {"id", "status": queued|running|done|error, "result", "steps", "error"}
+                       (?wait=1 blocks until the job is done or failed)
+  GET  /health         -> {"status": "ok", "workers", "queued", "running", "done", "max_queue"}
+
+"result" is exactly the dict the chapter's grader returns (what `--out json`
+prints). At most --max-queue jobs wait; beyond that POST /grade answers 503.
+A ?wait=1 request gives up after wait_limit() (derived from the job's timeout)
+and answers 504, so a stuck worker cannot hold HTTP threads forever.
+Finished jobs are kept for the last KEEP_JOBS submissions.
+
+Captures take the same options as batch_grade.py's (--idle, --race,
+--virtual-time, --block-resources, the capture cache, --planner and the
+per-host throttle with --per-host), shared by every worker. The chapter CLIs hand --url grading to the server when run
+with --server or with GRADER_SERVER set (see grade_client.py).
+
+Usage:
+  python scripts/grade_server.py --port 8765 --workers 2
+  curl -s localhost:8765/grade?wait=1 -d '{"chapter": 5, "url": "https://codepen.io/<user>/pen/<slug>"}'
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, SCRIPT_DIR)
+
+import batch_grade
+import browser_pool
+import capture_cache
+import capture_planner
+import console_guard
+import grade_ch1_codepen as ch1
+import grade_client
+import grader_registry
+import rate_limit
+import resource_policy
+import storage_state
+
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_QUEUE = 32
+KEEP_JOBS = 500
+MAX_BODY_BYTES = 2 * 1024 * 1024
+DEFAULT_JOB_TIMEOUT_S = 12.0
+# Added to four job timeouts (direct, Debug View, simulated, queue) for ?wait=1.
+WAIT_SLACK_S = 30.0
+
+
+def job_timeout(spec: Dict[str, Any]) -> float:
+    try:
+        return float(spec.get("timeout") or DEFAULT_JOB_TIMEOUT_S)
+    except (TypeError, ValueError):
+        return DEFAULT_JOB_TIMEOUT_S
+
+
+def wait_limit(spec: Dict[str, Any]) -> float:
+    """Seconds a ?wait=1 request waits for the job before answering 504."""
+    return job_timeout(spec) * 4 + WAIT_SLACK_S
+
+
+def _lines(logs: Any) -> List[str]:
+    raw = logs.splitlines() if isinstance(logs, str) else [str(l) for l in logs or []]
+    return [ch1.normalize_line(l) for l in raw if ch1.normalize_line(l)]
+
+
+def validate(spec: Dict[str, Any]) -> Tuple[grader_registry.Grader, Optional[str]]:
+    """The job's grader, or raise ValueError for a job the server cannot run."""
+    try:
+        chapter = int(spec.get("chapter"))
+    except (TypeError, ValueError):
+        raise ValueError("'chapter' must be a chapter number")
+    grader = grader_registry.lookup(chapter)
+    if grader is None:
+        raise ValueError(f"no grader for chapter {chapter}")
+    url = spec.get("url")
+    if url is not None and urlparse(str(url)).scheme not in ("http", "https"):
+        raise ValueError("'url' must be an http(s) URL")
+    if not any(spec.get(k) for k in ("url", "logs", "js", "html")):
+        raise ValueError("give one of 'url', 'logs', 'js' or (ch12) 'html'")
+    return grader, url
+
+
+def capture_options(args: argparse.Namespace) -> Dict[str, Any]:
+    """try_capture options from the server's flags, as batch_grade.capture_file passes them."""
+    return {
+        "idle": args.idle,
+        "cache": capture_cache.from_args(args),
+        "race": args.race,
+        "virtual_time": args.virtual_time,
+        "planner": capture_planner.from_args(args),
+        "block_resources": args.block_resources,
+    }
+
+
+def run_job(
+    spec: Dict[str, Any],
+    state_store: Optional[storage_state.StateStore] = None,
+    capture: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Grade one job on this thread's warm pool with `capture` options. Returns {"result", "steps", "errors"}."""
+    grader, url = validate(spec)
+    capture = dict(capture or {})
+    block_resources = capture.pop("block_resources", True)
+    chapter = int(spec["chapter"])
+    timeout = job_timeout(spec)
+    lines = _lines(spec.get("logs"))
+    code_js: Optional[str] = spec.get("js") or None
+    css_text: Optional[str] = spec.get("css") or None
+    metrics: Optional[Dict[str, Any]] = None
+    steps: List[str] = []
+    errors: Optional[str] = None
+    guard: Dict[str, Any] = {}
+    if grader.inputs == "dom" and spec.get("html"):
+        metrics = grader.module.analyze_html_structure(spec["html"])
+
+    needs_capture = metrics is None if grader.inputs == "dom" else not lines
+    if url and needs_capture:
+        pool = browser_pool.get_pool(state_store=state_store)
+        bundle = batch_grade.try_capture(
+            url, timeout=timeout, pool=pool, policy=resource_policy.policy_for_chapter(chapter, block_resources),
+            parts=grader.parts, dialogs=grader.dialogs, **capture,
+        )
+        lines = bundle["lines"]
+        code_js = code_js or bundle["js"]
+        metrics = metrics or bundle["metrics"]
+        css_text = css_text or bundle["css"]
+        steps = bundle["steps"]
+        errors = bundle["error"]
+        guard.update(truncated=bundle.get("truncated") or 0, killed=bundle.get("killed"))
+    elif grader.inputs == "console" and code_js and (not lines or ch1.looks_blocked(lines)):
+        simulated = ch1.simulate_console_with_js(
+            code_js, timeout=6.0, virtual_time=capture.get("virtual_time", False), dialogs=grader.dialogs, flags=guard,
+        )
+        if simulated:
+            lines = simulated
+            steps.append("simulated")
+
+    # Nothing to grade: fail the job (the CLI that sent it exits 1, or grades locally with --server-fallback).
+    if grader.inputs == "dom" and metrics is None:
+        raise ValueError(f"could not gather HTML structure metrics ({errors or 'no capture'})")
+    if grader.inputs == "console" and not lines:
+        raise ValueError(f"no console lines captured ({errors or 'no capture'})")
+
+    result = grader.grade(lines, code_js, metrics=metrics, css_text=css_text)
+    console_guard.annotate(result, guard.get("killed"), guard.get("truncated") or 0)
+    if grader.inputs == "dom":
+        # Same meta the ch12 CLI adds after its own capture.
+        if steps:
+            result.setdefault("meta", {})["attempt_steps"] = ";".join(steps)
+        if errors:
+            result.setdefault("meta", {})["errors"] = errors
+    return {"result": result, "steps": steps, "errors": errors}
+
+
+class JobQueue:
+    """Bounded queue of grading jobs drained by worker threads with their own browsers."""
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        state_store: Optional[storage_state.StateStore] = None,
+        capture: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.workers = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.state_store = state_store
+        self.capture = capture or {}
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=self.max_queue)
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.running = 0
+        self.done = 0
+        for n in range(self.workers):
+            threading.Thread(target=self._work, name=f"grade-worker-{n}", daemon=True).start()
+
+    def submit(self, spec: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Queue a validated job; None when the queue is full."""
+        job = {"id": f"{next(self._ids)}", "status": "queued", "spec": spec, "result": None,
+               "steps": [], "error": None, "submitted": time.time(), "finished": None,
+               "event": threading.Event()}
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            return None
+        with self._lock:
+            self._jobs[job["id"]] = job
+            while len(self._jobs) > KEEP_JOBS:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _work(self) -> None:
+        try:
+            while True:
+                job = self._queue.get()
+                with self._lock:
+                    self.running += 1
+                job["status"] = "running"
+                try:
+                    out = run_job(job["spec"], self.state_store, self.capture)
+                    job.update(result=out["result"], steps=out["steps"], error=out["errors"], status="done")
+                except Exception as e:
+                    job.update(status="error", error=str(e))
+                finally:
+                    job["finished"] = time.time()
+                    with self._lock:
+                        self.running -= 1
+                        self.done += 1
+                    job["event"].set()
+        finally:
+            browser_pool.close_pool()
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            running, done = self.running, self.done
+        return {"status": "ok", "workers": self.workers, "queued": self._queue.qsize(),
+                "running": running, "done": done, "max_queue": self.max_queue}
+
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: job[k] for k in ("id", "status", "result", "steps", "error", "submitted", "finished")}
+
+
+def wants_wait(query: str) -> bool:
+    return parse_qs(query).get("wait", ["0"])[0] not in ("0", "", "false")
+
+
+class GradeHandler(BaseHTTPRequestHandler):
+    server_version = "grade_server/1"
+    jobs: JobQueue  # set by make_server()
+
+    def _send(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_job(self, job: Dict[str, Any], wait: bool, created: bool = False) -> None:
+        """The job's state; with `wait`, once it has finished or wait_limit() has passed (504)."""
+        if wait and not job["event"].wait(wait_limit(job["spec"])):
+            body = public_job(job)
+            body["error"] = f"job still {job['status']} after {wait_limit(job['spec']):g} s"
+            self._send(504, body)
+            return
+        self._send(200 if wait or not created else 202, public_job(job))
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        print(f"{self.address_string()} {fmt % args}", file=sys.stderr)
+
+    def do_GET(self) -> None:
+        parsed = urlparse(self.path)
+        path = parsed.path.rstrip("/")
+        if path == "/health":
+            self._send(200, self.jobs.health())
+        elif path.startswith("/jobs/"):
+            job = self.jobs.get(path[len("/jobs/"):])
+            if job is None:
+                self._send(404, {"error": "unknown job"})
+                return
+            self._send_job(job, wants_wait(parsed.query))
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        parsed = urlparse(self.path)
+        if parsed.path.rstrip("/") != "/grade":
+            self._send(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > MAX_BODY_BYTES:
+            self._send(400 if length <= 0 else 413, {"error": "expected a JSON body"})
+            return
+        try:
+            spec = json.loads(self.rfile.read(length).decode("utf-8"))
+            if not isinstance(spec, dict):
+                raise ValueError("expected a JSON object")
+            validate(spec)
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+            return
+        job = self.jobs.submit(spec)
+        if job is None:
+            self._send(503, {"error": f"queue full ({self.jobs.max_queue} jobs waiting)"})
+            return
+        self._send_job(job, wants_wait(parsed.query), created=True)
+
+
+def make_server(host: str, port: int, jobs: JobQueue) -> ThreadingHTTPServer:
+    handler = type("BoundGradeHandler", (GradeHandler,), {"jobs": jobs})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    default = urlparse(grade_client.DEFAULT_SERVER)
+    ap = argparse.ArgumentParser(description='Local grading daemon with warm browsers and a bounded job queue')
+    ap.add_argument('--host', default=default.hostname, help='Address to bind (default: localhost only)')
+    ap.add_argument('--port', type=int, default=default.port)
+    ap.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                    help='Jobs graded at once, each worker with its own warm browser')
+    ap.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE,
+                    help='Jobs allowed to wait; further submissions get HTTP 503')
+    ap.add_argument('--idle', type=float, default=console_guard.DEFAULT_IDLE_SECONDS,
+                    help='Stop capturing after this many quiet console seconds once loaded (0 = full timeout)')
+    ap.add_argument('--race', action='store_true',
+                    help='Load the direct and Debug View pages at once; keep the first with usable console output')
+    ap.add_argument('--virtual-time', action='store_true',
+                    help='Simulated fallback: fire setTimeout/setInterval on a virtual clock instead of waiting in real time')
+    ap.add_argument('--block-resources', action=argparse.BooleanOptionalAction, default=True,
+                    help='Abort image/font/media/tracker requests during captures (ch12 keeps images and fonts)')
+    ap.add_argument('--per-host', type=int, default=rate_limit.DEFAULT_CONCURRENT,
+                    help='Max simultaneous page loads per host (codepen.io, cdpn.io) across all workers')
+    capture_cache.add_cache_args(ap)
+    capture_planner.add_planner_args(ap)
+    rate_limit.add_throttle_args(ap)
+    storage_state.add_state_args(ap)
+    args = ap.parse_args(argv)
+    # One process-wide throttle: every worker thread's page loads share the per-host rates.
+    rate_limit.configure_from_args(args)
+
+    jobs = JobQueue(args.workers, args.max_queue, state_store=storage_state.from_args(args),
+                    capture=capture_options(args))
+    server = make_server(args.host, args.port, jobs)
+    print(f"grading server on http://{args.host}:{args.port} ({jobs.workers} workers, queue {jobs.max_queue})",
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
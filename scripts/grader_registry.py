@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Registry of chapter graders, imported on first use.
+
+Each entry names a grader module, the chapters it grades, its entry function
+and what that function scores:
+
+- 'console': entry(lines, code_js) -- the console-log graders (ch1-ch10);
+- 'dom':     entry(metrics, css_text, code_js, lines) -- ch12's page checks.
+
+Capture parts (CAPTURE_PARTS) and dialog answers (DIALOG_ANSWERS) stay
+declared in the grader module and are read from it when a capture first asks
+for them, so the batch drivers only import the graders a run actually needs.
+Grader.capture_tag names "what this chapter's capture contains" for the
+cache and dedup keys.
+
+A new chapter needs no driver change: register() it here (or from any module
+imported before grading), or just add scripts/grade_chN_codepen.py with a
+grade_chN(lines, code_js) function, which lookup() finds by name.
+"""
+
+from __future__ import annotations
+
+import importlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import dialog_script
+
+
+INPUTS = ("console", "dom")
+POSSIBLE = 25
+
+
+class Grader:
+    """One grader module, resolved lazily."""
+
+    def __init__(self, chapters: Iterable[int], module: str, entry: str, inputs: str = "console") -> None:
+        if inputs not in INPUTS:
+            raise ValueError(f"unknown grader inputs {inputs!r} (expected one of {', '.join(INPUTS)})")
+        self.chapters = tuple(chapters)
+        self.module_name = module
+        self.entry_name = entry
+        self.inputs = inputs
+        self._module: Any = None
+
+    @property
+    def module(self) -> Any:
+        if self._module is None:
+            self._module = importlib.import_module(self.module_name)
+        return self._module
+
+    @property
+    def entry(self) -> Callable[..., Dict[str, Any]]:
+        return getattr(self.module, self.entry_name)
+
+    @property
+    def parts(self) -> Tuple[str, ...]:
+        import capture_bundle  # the capture code; --from-archive and --help never need it
+
+        return capture_bundle.normalize_parts(getattr(self.module, "CAPTURE_PARTS", capture_bundle.DEFAULT_PARTS))
+
+    @property
+    def dialogs(self) -> Tuple[dialog_script.Answer, ...]:
+        return tuple(getattr(self.module, "DIALOG_ANSWERS", ()))
+
+    @property
+    def capture_tag(self) -> str:
+        """Capture parts plus dialog answers, as used in cache and dedup keys."""
+        import capture_bundle
+
+        return dialog_script.with_answers(capture_bundle.parts_tag(self.parts), self.dialogs)
+
+    def grade(
+        self,
+        lines: List[str],
+        code_js: Optional[str],
+        metrics: Optional[Dict[str, Any]] = None,
+        css_text: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Score one capture; a capture with nothing to score gets 0 points."""
+        if self.inputs == "dom":
+            if not metrics:
+                meta = {"captured_lines": len(lines), "code_available": bool(code_js), "errors": f"ch{self.chapters[0]} metrics unavailable"}
+                return {"total": 0, "possible": POSSIBLE, "meta": meta}
+            return self.entry(metrics, css_text, code_js, lines)
+        if not lines:
+            return {"total": 0, "possible": POSSIBLE, "meta": {"captured_lines": 0, "code_available": bool(code_js)}}
+        return self.entry(lines, code_js)
+
+
+_graders: Dict[int, Grader] = {}
+# Chapters lookup() already failed to find by module name.
+_missing: set = set()
+
+
+def register(chapters: Iterable[int], module: str, entry: str, inputs: str = "console") -> Grader:
+    """Add (or replace) the grader for `chapters`; the module is not imported yet."""
+    grader = Grader(chapters, module, entry, inputs)
+    for chapter in grader.chapters:
+        _graders[chapter] = grader
+        _missing.discard(chapter)
+    return grader
+
+
+register((1,), "grade_ch1_codepen", "grade_ch1")
+register((2,), "grade_ch2_codepen", "grade_ch2")
+register((3,), "grade_ch3_codepen", "grade_ch3")
+register((4,), "grade_ch4_codepen", "grade_ch4")
+register((5,), "grade_ch5_codepen", "grade_ch5")
+register((6,), "grade_ch6_codepen", "grade_ch6")
+register((7, 8), "grade_ch7_8_codepen", "grade_ch7_8")
+register((9,), "grade_ch9_codepen", "grade_ch9")
+register((10,), "grade_ch10_codepen", "grade_ch10")
+register((12,), "grade_ch12_codepen", "grade_ch12", inputs="dom")
+
+
+def lookup(chapter: Optional[int]) -> Optional[Grader]:
+    """The grader for `chapter`: registered, or found as grade_ch<N>_codepen.grade_ch<N>; else None."""
+    if chapter is None:
+        return None
+    if chapter in _graders:
+        return _graders[chapter]
+    if chapter in _missing:
+        return None
+    name = f"grade_ch{chapter}_codepen"
+    try:
+        module = importlib.import_module(name)
+    except ModuleNotFoundError as e:
+        if e.name != name:
+            raise
+        module = None
+    if module is None or not callable(getattr(module, f"grade_ch{chapter}", None)):
+        _missing.add(chapter)
+        return None
+    return register((chapter,), name, f"grade_ch{chapter}")
+
+
+def chapters() -> List[int]:
+    """Registered chapter numbers, in order."""
+    return sorted(_graders)
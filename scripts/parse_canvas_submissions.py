@@ -10,7 +10,11 @@ Each file typically includes:
   - Filename pattern: <username>[_LATE]_<_studentId_>_link.html
 
 Outputs: CSV (default) or JSON with fields per file:
-  username, late, student_id, assignment, student_name, best_url, meta_url, anchor_url, debug_url, file
+  username, late, student_id, assignment, student_name, best_url, meta_url, anchor_url, debug_url,
+  pen_url, file
+
+pen_url is the canonical https://codepen.io/<user>/pen/<slug> form of best_url, so
+/full/, /details/, /debug/ and cdpn.io links to the same pen compare equal.
 
 Usage:
   python scripts/parse_canvas_submissions.py --dir Submissions --out submissions.csv
@@ -119,13 +123,42 @@ def best_url(meta_url: Optional[str], anchor_url: Optional[str]) -> Optional[str
     return meta_url or anchor_url
 
 
-def derive_debug_url(url: Optional[str]) -> Optional[str]:
+# Every CodePen view of a pen: editor, full page, details, Debug View, embeds.
+PEN_URL_RE = re.compile(
+    r"^https?://(?:www\.)?(?:codepen\.io|cdpn\.io)/([^/?#]+)/"
+    r"(?:pen|full|details|debug|live|embed|fullpage|fullembedgrid)/([^/?#]+)",
+    re.IGNORECASE,
+)
+
+
+def parse_pen_url(url: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(user, slug) of a CodePen pen URL in any of its views, or None."""
     if not url:
         return None
-    m = re.match(r"^https?://codepen\.io/([^/]+)/(?:(?:pen)|(?:full))/([^/?#]+)", url.strip())
-    if m:
-        user, slug = m.group(1), m.group(2)
-        return f"https://cdpn.io/{user}/debug/{slug}"
+    m = PEN_URL_RE.match(url.strip())
+    if not m:
+        return None
+    return m.group(1), m.group(2)
+
+
+def canonical_pen_url(url: Optional[str]) -> Optional[str]:
+    """https://codepen.io/<user>/pen/<slug> for any view of a pen, or None."""
+    pen = parse_pen_url(url)
+    return f"https://codepen.io/{pen[0]}/pen/{pen[1]}" if pen else None
+
+
+def pen_key(url: Optional[str]) -> Optional[str]:
+    """Identity of a pen for deduplication: user (case-insensitive) and slug."""
+    pen = parse_pen_url(url)
+    return f"{pen[0].lower()}/{pen[1]}" if pen else None
+
+
+def derive_debug_url(url: Optional[str]) -> Optional[str]:
+    if not url or not re.match(r"^https?://codepen\.io/", url.strip()):
+        return None
+    pen = parse_pen_url(url)
+    if pen:
+        return f"https://cdpn.io/{pen[0]}/debug/{pen[1]}"
     return None
 
 
@@ -154,6 +187,7 @@ def parse_submission_file(path: str) -> Dict[str, Optional[str]]:
         'anchor_url': a_url,
         'best_url': best,
         'debug_url': dbg,
+        'pen_url': canonical_pen_url(best),
     }
 
 
@@ -186,7 +220,7 @@ def main(argv=None) -> int:
     # CSV
     fieldnames = [
         'file', 'username', 'late', 'student_id', 'assignment', 'student_name',
-        'best_url', 'meta_url', 'anchor_url', 'debug_url'
+        'best_url', 'meta_url', 'anchor_url', 'debug_url', 'pen_url'
     ]
     if args.out == '-':
         w = csv.DictWriter(sys.stdout, fieldnames=fieldnames)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Per-host throttling of CodePen page loads.
+
+Every capture that navigates to codepen.io or cdpn.io goes through a
+HostThrottle (the process-wide one from get_throttle() unless told
+otherwise):
+
+- token bucket per host: page loads start at most `rate` per second after an
+  initial burst of DEFAULT_BURST (batch_grade --workers N gives each process
+  1/N of both);
+- navigation cap: at most `max_concurrent` loads per host at once (sync
+  callers; the asyncio engine keeps its own cap in async_capture.HostLimiter);
+- backoff: a load that ends in a block signal halves the host's rate and
+  pauses the host for BACKOFF_S, doubling with every further block (up to
+  MAX_BACKOFF_S); unblocked loads raise the rate again by RATE_STEP up to
+  MAX_RATE_FACTOR times its configured value.
+
+Hosts not listed in DEFAULT_RATES are not throttled. Time spent waiting is
+added to the page load's resource_policy stats ("throttle_ms") and per host
+to the throttle's own totals (summary()).
+
+Usage:
+  with rate_limit.navigation(url, stats) as nav:
+      page.goto(url)
+      ...
+      nav.blocked = detector.tripped
+"""
+
+from __future__ import annotations
+
+import argparse
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+
+# Page loads per second per host (after the burst).
+DEFAULT_RATES = {"codepen.io": 1.0, "cdpn.io": 2.0}
+DEFAULT_BURST = 3
+DEFAULT_CONCURRENT = 4
+MIN_RATE = 0.1
+RATE_STEP = 0.05
+MAX_RATE_FACTOR = 2.0
+BACKOFF_S = 2.0
+MAX_BACKOFF_S = 60.0
+
+
+class TokenBucket:
+    """Token bucket handing out reservations; callers sleep for the returned delay."""
+
+    def __init__(self, rate: float, burst: float = DEFAULT_BURST) -> None:
+        self.rate = rate
+        self.base_rate = rate
+        # A fractional burst (a worker's share of DEFAULT_BURST) is fine: loads then wait for the rest.
+        self.burst = float(burst) if burst > 0 else float(DEFAULT_BURST)
+        self.tokens = float(self.burst)
+        self.stamp = time.monotonic()
+        self.paused_until = 0.0
+        self.strikes = 0
+
+    def reserve(self, now: float) -> float:
+        """Take a token (possibly ahead of time) and return seconds until it may be used."""
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        self.tokens -= 1
+        delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(delay, self.paused_until - now)
+
+    def penalize(self, now: float) -> float:
+        """Block seen: halve the rate and pause; returns the pause in seconds."""
+        self.strikes += 1
+        self.rate = max(MIN_RATE, self.rate / 2)
+        pause = min(MAX_BACKOFF_S, BACKOFF_S * 2 ** (self.strikes - 1))
+        self.paused_until = max(self.paused_until, now + pause)
+        return pause
+
+    def reward(self) -> None:
+        self.strikes = 0
+        self.rate = min(self.base_rate * MAX_RATE_FACTOR, self.rate + RATE_STEP)
+
+
+class Navigation:
+    """One throttled page load; set `blocked` before leaving the block to trigger backoff."""
+
+    def __init__(self, host: Optional[str] = None, waited: float = 0.0) -> None:
+        self.host = host
+        self.waited = waited
+        self.blocked = False
+
+
+def host_for(url: str, hosts: Any) -> Optional[str]:
+    host = (urlparse(url or "").hostname or "").lower()
+    for name in hosts:
+        if host == name or host.endswith("." + name):
+            return name
+    return None
+
+
+class HostThrottle:
+    """Token buckets, navigation caps and block backoff for the CodePen hosts."""
+
+    def __init__(
+        self,
+        rates: Optional[Dict[str, float]] = None,
+        burst: float = DEFAULT_BURST,
+        max_concurrent: int = DEFAULT_CONCURRENT,
+    ) -> None:
+        rates = dict(DEFAULT_RATES if rates is None else rates)
+        self.buckets = {host: TokenBucket(rate, burst) for host, rate in rates.items()}
+        self.max_concurrent = max(1, int(max_concurrent))
+        self._sems = {host: threading.BoundedSemaphore(self.max_concurrent) for host in rates}
+        self._lock = threading.Lock()
+        self.waits: Dict[str, List[float]] = {host: [0, 0.0] for host in rates}
+        self.backoffs: Dict[str, int] = {host: 0 for host in rates}
+
+    def _reserve(self, host: str) -> float:
+        with self._lock:
+            return self.buckets[host].reserve(time.monotonic())
+
+    def _waited(self, nav: Navigation, stats: Optional[Dict[str, Any]]) -> None:
+        with self._lock:
+            if nav.waited >= 0.001:
+                self.waits[nav.host][0] += 1
+                self.waits[nav.host][1] += nav.waited
+        if stats is not None:
+            stats["throttle_ms"] = stats.get("throttle_ms", 0) + round(nav.waited * 1000)
+
+    def _done(self, nav: Navigation, failed: bool) -> None:
+        with self._lock:
+            bucket = self.buckets[nav.host]
+            if nav.blocked:
+                bucket.penalize(time.monotonic())
+                self.backoffs[nav.host] += 1
+            elif not failed:
+                bucket.reward()
+
+    @contextmanager
+    def navigation(self, url: str, stats: Optional[Dict[str, Any]] = None) -> Iterator[Navigation]:
+        """Hold a navigation slot for `url`'s host and wait for its token (sync API)."""
+        host = host_for(url, self.buckets)
+        if host is None:
+            yield Navigation()
+            return
+        started = time.monotonic()
+        sem = self._sems[host]
+        sem.acquire()
+        try:
+            delay = self._reserve(host)
+            if delay > 0:
+                time.sleep(delay)
+            nav = Navigation(host, time.monotonic() - started)
+            self._waited(nav, stats)
+            try:
+                yield nav
+            except BaseException:
+                self._done(nav, failed=True)
+                raise
+            self._done(nav, failed=False)
+        finally:
+            sem.release()
+
+    @asynccontextmanager
+    async def navigation_async(self, url: str, stats: Optional[Dict[str, Any]] = None) -> AsyncIterator[Navigation]:
+        """Wait for `url`'s host token without blocking the event loop (no navigation cap)."""
+        host = host_for(url, self.buckets)
+        if host is None:
+            yield Navigation()
+            return
+        started = time.monotonic()
+        delay = self._reserve(host)
+        if delay > 0:
+            import asyncio
+            await asyncio.sleep(delay)
+        nav = Navigation(host, time.monotonic() - started)
+        self._waited(nav, stats)
+        try:
+            yield nav
+        except BaseException:
+            self._done(nav, failed=True)
+            raise
+        self._done(nav, failed=False)
+
+    def summary(self) -> str:
+        parts = []
+        for host, bucket in self.buckets.items():
+            count, seconds = self.waits[host]
+            parts.append(
+                f"{host} {int(count)} waits / {seconds:.1f} s, {self.backoffs[host]} backoffs, now {bucket.rate:.2f}/s"
+            )
+        return "throttle: " + "; ".join(parts)
+
+
+_throttle: Optional[HostThrottle] = HostThrottle()
+# Marks "use the process-wide throttle" in navigation()/navigation_async().
+_DEFAULT: Any = object()
+
+
+def get_throttle() -> Optional[HostThrottle]:
+    """The process-wide throttle, or None when throttling is disabled."""
+    return _throttle
+
+
+def configure(throttle: Optional[HostThrottle]) -> None:
+    global _throttle
+    _throttle = throttle
+
+
+@contextmanager
+def navigation(url: str, stats: Optional[Dict[str, Any]] = None, throttle: Any = _DEFAULT) -> Iterator[Navigation]:
+    """HostThrottle.navigation on `throttle` (the process-wide one by default; None = unthrottled)."""
+    throttle = get_throttle() if throttle is _DEFAULT else throttle
+    if throttle is None:
+        yield Navigation()
+        return
+    with throttle.navigation(url, stats) as nav:
+        yield nav
+
+
+@asynccontextmanager
+async def navigation_async(url: str, stats: Optional[Dict[str, Any]] = None, throttle: Any = _DEFAULT) -> AsyncIterator[Navigation]:
+    throttle = get_throttle() if throttle is _DEFAULT else throttle
+    if throttle is None:
+        yield Navigation()
+        return
+    async with throttle.navigation_async(url, stats) as nav:
+        yield nav
+
+
+def parse_rate(text: str) -> Dict[str, float]:
+    host, _, rate = text.partition("=")
+    if not host or not rate:
+        raise argparse.ArgumentTypeError(f"expected HOST=PER_SECOND, got {text!r}")
+    try:
+        value = float(rate)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a number of page loads per second, got {rate!r}")
+    if not value > 0:
+        raise argparse.ArgumentTypeError(f"page loads per second must be > 0, got {rate!r} (use --no-throttle to disable)")
+    return {host.strip().lower(): value}
+
+
+def add_throttle_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument('--throttle', action=argparse.BooleanOptionalAction, default=True,
+                    help='Rate-limit page loads per host with backoff on block signals (default: on)')
+    ap.add_argument('--host-rate', type=parse_rate, action='append', default=[], metavar='HOST=PER_SEC',
+                    help='Override a host\'s page loads per second (repeatable; defaults: codepen.io=1, cdpn.io=2)')
+
+
+def configure_from_args(args: argparse.Namespace, share: int = 1) -> Optional[HostThrottle]:
+    """Install the process-wide throttle for a batch run.
+
+    `share` divides the rates, the burst and the --per-host concurrency cap among
+    worker processes (at least one load at a time each), so N processes together
+    stay within the configured per-host limits.
+    """
+    if not getattr(args, 'throttle', True):
+        configure(None)
+        return None
+    rates = dict(DEFAULT_RATES)
+    for override in getattr(args, 'host_rate', None) or []:
+        rates.update(override)
+    share = max(1, int(share))
+    throttle = HostThrottle(
+        {host: rate / share for host, rate in rates.items()},
+        burst=DEFAULT_BURST / share,
+        max_concurrent=max(1, int(getattr(args, 'per_host', DEFAULT_CONCURRENT)) // share),
+    )
+    configure(throttle)
+    return throttle
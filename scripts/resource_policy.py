@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Network resource policy for CodePen captures.
+
+A full CodePen editor page pulls editor bundles, fonts, avatars, ads and
+analytics that the graders never look at. A ResourcePolicy is installed on each
+capture's BrowserContext with Playwright routing (`context.route`) and aborts
+requests by resource type (image / media / font by default) or by host
+(known third-party trackers). Routing on the context covers the result iframe
+on cdpn.io as well as the editor page.
+
+Chapters may override the default: ch12 grades layout and styling, so its
+policy keeps images and fonts and only drops media and trackers. Stylesheets
+and scripts are never blocked.
+
+Each capture can also be metered: pass a stats dict (see new_stats) and the
+capture helpers fill in request / blocked counts, bytes transferred (encoded
+body plus headers from Playwright's Request.sizes(), so chunked and
+compressed responses count too), time to the page's load event and time to
+the first console line. Blocked requests are counted but have no size.
+
+What blocking saves is measured, not assumed: measure_savings() loads sample
+pages twice in fresh contexts, once under the policy and once unfiltered,
+and reports the load time and bytes saved per page (batch_grade.py
+--measure-savings N).
+"""
+
+from __future__ import annotations
+
+import inspect
+import time
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+
+DEFAULT_BLOCK_TYPES = frozenset({"image", "media", "font"})
+
+# Third-party hosts CodePen pages load that never affect a pen's output.
+TRACKER_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+    "carbonads.com",
+    "carbonads.net",
+    "buysellads.com",
+    "buysellads.net",
+    "srv.buysellads.com",
+    "stripe.com",
+    "segment.io",
+    "segment.com",
+    "hotjar.com",
+    "sentry.io",
+    "facebook.net",
+    "twitter.com",
+    "ads-twitter.com",
+    "quantserve.com",
+    "scorecardresearch.com",
+)
+
+
+class ResourcePolicy:
+    """Which requests a capture aborts: by resource type and by host suffix."""
+
+    def __init__(
+        self,
+        block_types: Iterable[str] = DEFAULT_BLOCK_TYPES,
+        block_hosts: Iterable[str] = TRACKER_HOSTS,
+        name: str = "default",
+    ) -> None:
+        self.block_types: FrozenSet[str] = frozenset(block_types)
+        self.block_hosts: Tuple[str, ...] = tuple(h.lower() for h in block_hosts)
+        self.name = name
+
+    def blocks(self, resource_type: str, url: str) -> bool:
+        if resource_type in self.block_types:
+            return True
+        host = (urlparse(url).hostname or "").lower()
+        return any(host == h or host.endswith("." + h) for h in self.block_hosts)
+
+    def __repr__(self) -> str:
+        return f"ResourcePolicy({self.name!r}, types={sorted(self.block_types)})"
+
+
+DEFAULT_POLICY = ResourcePolicy()
+
+# Per-chapter overrides; chapters not listed use DEFAULT_POLICY.
+CHAPTER_POLICIES: Dict[int, ResourcePolicy] = {
+    12: ResourcePolicy(block_types={"media"}, name="ch12"),
+}
+
+
+def policy_for_chapter(chapter: Optional[int], enabled: bool = True) -> Optional[ResourcePolicy]:
+    if not enabled:
+        return None
+    if chapter is not None and chapter in CHAPTER_POLICIES:
+        return CHAPTER_POLICIES[chapter]
+    return DEFAULT_POLICY
+
+
+def new_stats() -> Dict[str, Any]:
+    return {
+        "policy": None,
+        "requests": 0,
+        "blocked": 0,
+        "bytes": 0,
+        "load_ms": None,
+        "first_console_ms": None,
+        "aborted": None,
+        "saved_s": 0.0,
+        "state": None,
+        "throttle_ms": 0,
+    }
+
+
+def meter(net: Optional[Dict[str, Dict[str, Any]]], mode: str) -> Optional[Dict[str, Any]]:
+    """Register and return a fresh stats dict for `mode` in `net` (None when not metering)."""
+    if net is None:
+        return None
+    net[mode] = new_stats()
+    return net[mode]
+
+
+def _transfer_bytes(sizes: Dict[str, Any]) -> int:
+    return max(0, int(sizes.get("responseBodySize") or 0)) + max(0, int(sizes.get("responseHeadersSize") or 0))
+
+
+def install(context: Any, policy: Optional[ResourcePolicy], stats: Optional[Dict[str, Any]] = None) -> None:
+    """Route every request of a sync BrowserContext through `policy`."""
+    if stats is not None:
+        stats["policy"] = policy.name if policy else "off"
+    if policy is None:
+        return
+
+    def handle(route: Any) -> None:
+        req = route.request
+        if policy.blocks(req.resource_type, req.url):
+            if stats is not None:
+                stats["blocked"] += 1
+            route.abort()
+        else:
+            route.continue_()
+
+    context.route("**/*", handle)
+
+
+async def install_async(context: Any, policy: Optional[ResourcePolicy], stats: Optional[Dict[str, Any]] = None) -> None:
+    """playwright.async_api counterpart of install()."""
+    if stats is not None:
+        stats["policy"] = policy.name if policy else "off"
+    if policy is None:
+        return
+
+    async def handle(route: Any) -> None:
+        req = route.request
+        if policy.blocks(req.resource_type, req.url):
+            if stats is not None:
+                stats["blocked"] += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await context.route("**/*", handle)
+
+
+def watch_page(page: Any, stats: Optional[Dict[str, Any]]) -> None:
+    """Meter a page: count requests/bytes and time the load event and first console line.
+
+    Call right before navigating; timings are measured from this call. Works with
+    both the sync and async APIs: with the async API, Request.sizes() returns an
+    awaitable and its bytes are added when it resolves.
+    """
+    if stats is None:
+        return
+    started = time.time()
+
+    def on_request(_req: Any) -> None:
+        stats["requests"] += 1
+
+    def add_bytes(sizes: Any) -> None:
+        stats["bytes"] += _transfer_bytes(sizes or {})
+
+    def on_finished(request: Any) -> None:
+        try:
+            sizes = request.sizes()
+        except Exception:
+            return
+        if inspect.isawaitable(sizes):
+            import asyncio
+
+            task = asyncio.ensure_future(sizes)
+            task.add_done_callback(lambda t: add_bytes(t.result()) if not t.cancelled() and not t.exception() else None)
+        else:
+            add_bytes(sizes)
+
+    def on_load(*_: Any) -> None:
+        if stats["load_ms"] is None:
+            stats["load_ms"] = round((time.time() - started) * 1000)
+
+    def on_console(*_: Any) -> None:
+        if stats["first_console_ms"] is None:
+            stats["first_console_ms"] = round((time.time() - started) * 1000)
+
+    page.on("request", on_request)
+    page.on("requestfinished", on_finished)
+    page.on("load", on_load)
+    page.on("console", on_console)
+
+
+def format_stats(net: Optional[Dict[str, Dict[str, Any]]]) -> str:
+    """One-line summary of per-mode stats, e.g. 'direct: 41 req, 17 blocked, 1230 kB, load 850 ms'."""
+    parts = []
+    for mode, s in (net or {}).items():
+        text = f"{mode}: {s.get('requests', 0)} req, {s.get('blocked', 0)} blocked, {s.get('bytes', 0) / 1024:.0f} kB"
+        if s.get("load_ms") is not None:
+            text += f", load {s['load_ms']} ms"
+        if s.get("first_console_ms") is not None:
+            text += f", first log {s['first_console_ms']} ms"
+        if s.get("throttle_ms"):
+            text += f", throttled {s['throttle_ms']} ms"
+        if s.get("aborted"):
+            text += f", aborted on {s['aborted']!r} (saved {s.get('saved_s', 0.0):.1f} s)"
+        parts.append(text)
+    return "; ".join(parts)
+
+
+def summarize(nets: Iterable[Optional[Dict[str, Dict[str, Any]]]]) -> str:
+    """Run-level totals across many captures' stats (for the stderr summary)."""
+    captures = requests = blocked = size = aborted = throttled = 0
+    saved = 0.0
+    loads = []
+    for net in nets:
+        for s in (net or {}).values():
+            captures += 1
+            requests += s.get("requests", 0)
+            blocked += s.get("blocked", 0)
+            size += s.get("bytes", 0)
+            throttled += s.get("throttle_ms", 0)
+            if s.get("load_ms") is not None:
+                loads.append(s["load_ms"])
+            if s.get("aborted"):
+                aborted += 1
+                saved += s.get("saved_s", 0.0)
+    avg = f"{sum(loads) / len(loads):.0f} ms" if loads else "n/a"
+    text = (
+        f"network: {captures} page loads, {requests} requests, {blocked} blocked, "
+        f"{size / 1e6:.1f} MB transferred, mean load {avg}"
+    )
+    if aborted:
+        text += f"; {aborted} early block aborts saved up to {saved:.1f} s"
+    if throttled:
+        text += f"; {throttled / 1000:.1f} s waiting on the rate limiter"
+    return text
+
+
+def measure_load(pool: Any, url: str, policy: Optional[ResourcePolicy], timeout: float = 20.0) -> Dict[str, Any]:
+    """Load `url` in a fresh context of a sync BrowserPool under `policy` (None = unfiltered); return its stats."""
+    import rate_limit
+
+    stats = new_stats()
+    with rate_limit.navigation(url, stats), pool.context() as context:
+        install(context, policy, stats)
+        page = context.new_page()
+        watch_page(page, stats)
+        page.goto(url, wait_until="load", timeout=timeout * 1000)
+        # Let requestfinished events for the last responses arrive.
+        page.wait_for_timeout(250)
+    return stats
+
+
+def measure_savings(
+    pool: Any,
+    samples: Iterable[Tuple[str, Optional[ResourcePolicy]]],
+    timeout: float = 20.0,
+) -> List[Dict[str, Any]]:
+    """Load each (url, policy) sample with and without the policy; per page: load ms and bytes both ways.
+
+    The unfiltered load goes first in every other sample so warm-up effects do not all fall on one side.
+    """
+    out: List[Dict[str, Any]] = []
+    for n, (url, policy) in enumerate(samples):
+        row: Dict[str, Any] = {"url": url, "policy": policy.name if policy else "off"}
+        try:
+            order = [("baseline", None), ("filtered", policy)]
+            for label, pol in order if n % 2 == 0 else order[::-1]:
+                s = measure_load(pool, url, pol, timeout)
+                row[f"{label}_load_ms"] = s["load_ms"]
+                row[f"{label}_bytes"] = s["bytes"]
+                row[f"{label}_requests"] = s["requests"]
+                if label == "filtered":
+                    row["blocked"] = s["blocked"]
+        except Exception as e:
+            row["error"] = str(e)
+        out.append(row)
+    return out
+
+
+def format_savings(results: List[Dict[str, Any]]) -> str:
+    """Per-page and mean load time / bytes saved by the policy, from measure_savings()."""
+    lines = []
+    saved_ms: List[int] = []
+    saved_bytes: List[int] = []
+    for r in results:
+        if r.get("error") or r.get("baseline_load_ms") is None or r.get("filtered_load_ms") is None:
+            lines.append(f"  {r['url']}: not measured ({r.get('error') or 'no load event'})")
+            continue
+        ms = r["baseline_load_ms"] - r["filtered_load_ms"]
+        kb = r["baseline_bytes"] - r["filtered_bytes"]
+        saved_ms.append(ms)
+        saved_bytes.append(kb)
+        lines.append(
+            f"  {r['url']} ({r['policy']}): load {r['baseline_load_ms']} -> {r['filtered_load_ms']} ms, "
+            f"{r['baseline_bytes'] / 1024:.0f} -> {r['filtered_bytes'] / 1024:.0f} kB, {r.get('blocked', 0)} blocked"
+        )
+    if saved_ms:
+        head = (
+            f"resource policy savings over {len(saved_ms)} measured page(s): mean {sum(saved_ms) / len(saved_ms):.0f} ms "
+            f"and {sum(saved_bytes) / len(saved_bytes) / 1024:.0f} kB per load"
+        )
+    else:
+        head = "resource policy savings: no page measured"
+    return "\n".join([head] + lines)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Deferred retries for captures that failed or were blocked.
+
+A transient navigation error or a Cloudflare challenge used to cost a
+submission its real capture for good. The batch drivers now finish their main
+pass first and push each failed submission onto a RetryQueue; retries run at
+the end in rounds, one per attempt number, after an exponential backoff
+(base_delay, doubling per attempt, capped at max_delay) and never beyond
+max_attempts in total. The
+main pass keeps its throughput and a flaky pen gets a second look once the
+remote has calmed down.
+
+The queue only orders and times the work; batch_grade.retry_reason names
+each failure (REASONS), --retry-on picks which of them are worth retrying
+(by default only blocks and timeouts: a bad URL or a pen that prints nothing
+fails the same way again), and batch_grade.retry_failed runs each round of
+retries through the main pass's driver and merges attempts into the row (each
+retry adds 'retry<n>:<reason>' plus that attempt's steps to attempt_steps).
+"""
+
+from __future__ import annotations
+
+import argparse
+import heapq
+import itertools
+import time
+from typing import Any, Callable, List, Tuple
+
+
+DEFAULT_RETRIES = 2
+DEFAULT_DELAY_S = 5.0
+MAX_DELAY_S = 60.0
+# Failure kinds batch_grade.retry_reason reports; only DEFAULT_RETRY_ON are retried unless --retry-on says so.
+REASONS = ("blocked", "timeout", "error", "incomplete")
+DEFAULT_RETRY_ON = ("blocked", "timeout")
+
+
+class RetryQueue:
+    """Min-heap of (due time, item) with exponential backoff and an attempt budget."""
+
+    def __init__(
+        self,
+        max_attempts: int = DEFAULT_RETRIES + 1,
+        base_delay: float = DEFAULT_DELAY_S,
+        max_delay: float = MAX_DELAY_S,
+    ) -> None:
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = max(0.0, base_delay)
+        self.max_delay = max_delay
+        self._heap: List[Tuple[float, int, Any, int, str]] = []
+        self._seq = itertools.count()
+        self.pushed = 0
+        self.gave_up = 0
+
+    def delay(self, attempt: int) -> float:
+        """Backoff before attempt `attempt + 1`, given `attempt` attempts so far."""
+        return min(self.max_delay, self.base_delay * 2 ** max(0, attempt - 1))
+
+    def push(self, item: Any, attempt: int, reason: str) -> bool:
+        """Queue `item` after its `attempt`-th failed attempt; False once the budget is spent."""
+        if attempt >= self.max_attempts:
+            self.gave_up += 1
+            return False
+        due = time.monotonic() + self.delay(attempt)
+        heapq.heappush(self._heap, (due, next(self._seq), item, attempt + 1, reason))
+        self.pushed += 1
+        return True
+
+    def pop_round(self, sleep: Callable[[float], None] = time.sleep) -> List[Tuple[Any, int, str]]:
+        """Every item queued for the earliest item's attempt number, once all of them are due."""
+        if not self._heap:
+            return []
+        attempt = self._heap[0][3]
+        batch = sorted(entry for entry in self._heap if entry[3] == attempt)
+        self._heap = [entry for entry in self._heap if entry[3] != attempt]
+        heapq.heapify(self._heap)
+        wait = batch[-1][0] - time.monotonic()
+        if wait > 0:
+            sleep(wait)
+        return [(item, n, reason) for _due, _seq, item, n, reason in batch]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def summary(self) -> str:
+        return f"retry queue: {self.pushed} retries scheduled, {self.gave_up} submissions still failing"
+
+
+def parse_reasons(text: str) -> Tuple[str, ...]:
+    reasons = tuple(r.strip() for r in text.split(",") if r.strip())
+    unknown = [r for r in reasons if r not in REASONS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown retry reason(s) {', '.join(unknown)}; choose from {', '.join(REASONS)}")
+    return reasons
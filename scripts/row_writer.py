@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Streaming output writers for batch_grade.py.
+
+Rows used to be collected for the whole run and written at the end (for
+--format json as one json.dumps(rows, indent=2) string). A RowWriter is
+opened before grading starts and writes each row as soon as it is final,
+flushing after every row so another process can tail the output:
+
+- csv:   header first, one row per line (CsvWriter);
+- jsonl: one compact JSON object per line (JsonlWriter);
+- json:  a JSON array written element by element (JsonArrayWriter); the
+         finished file is byte-for-byte what json.dumps(rows, indent=2) gave.
+
+OrderedStream keeps the serial row order whatever order the drivers finish
+in: rows are held until every earlier row has been written. A row still
+waiting for a deferred retry ('_retry' set to one of the retried reasons) is
+written right away with its first-attempt result, so one blocked pen does not
+hold up the rows after it; once its retries are over the final result is
+appended as a replacement row (the last row for a file wins). A JSON array
+cannot take replacements, so --format json still holds such a row back and
+writes only its retried version. Keys starting with '_' are internal and never
+written.
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import sys
+from typing import Any, Callable, Collection, Dict, IO, List, Optional, Set
+
+
+FORMATS = ("csv", "json", "jsonl")
+
+
+def public(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in row.items() if not k.startswith("_")}
+
+
+class RowWriter:
+    """Writes rows to `f` one at a time; close() finishes the document."""
+
+    # A later row for the same file reads as a replacement (line-based formats).
+    replaceable = True
+
+    def __init__(self, f: IO[str], owns: bool = False) -> None:
+        self.f = f
+        self.owns = owns
+        self.written = 0
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self._write(public(row))
+        self.written += 1
+        self.f.flush()
+
+    def _write(self, row: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def _finish(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self._finish()
+        self.f.flush()
+        if self.owns:
+            self.f.close()
+
+
+class CsvWriter(RowWriter):
+    def __init__(
+        self,
+        f: IO[str],
+        fieldnames: List[str],
+        convert: Optional[Callable[[Dict[str, Any], List[str]], Dict[str, Any]]] = None,
+        owns: bool = False,
+    ) -> None:
+        super().__init__(f, owns)
+        self.fieldnames = fieldnames
+        self.convert = convert
+        self.w = csv.DictWriter(f, fieldnames=fieldnames)
+        self.w.writeheader()
+        f.flush()
+
+    def _write(self, row: Dict[str, Any]) -> None:
+        self.w.writerow(self.convert(row, self.fieldnames) if self.convert else row)
+
+
+class JsonlWriter(RowWriter):
+    def _write(self, row: Dict[str, Any]) -> None:
+        self.f.write(json.dumps(row) + "\n")
+
+
+class JsonArrayWriter(RowWriter):
+    """Streams a JSON array formatted like json.dumps(rows, indent=2)."""
+
+    replaceable = False
+
+    def _write(self, row: Dict[str, Any]) -> None:
+        body = json.dumps(row, indent=2).replace("\n", "\n  ")
+        self.f.write(("[\n  " if not self.written else ",\n  ") + body)
+
+    def _finish(self) -> None:
+        self.f.write("\n]" if self.written else "[]")
+        # print(json.dumps(...)) used to end stdout output with a newline.
+        if self.f is sys.stdout:
+            self.f.write("\n")
+
+
+def open_writer(
+    fmt: str,
+    out: str,
+    fieldnames: List[str],
+    convert: Optional[Callable[[Dict[str, Any], List[str]], Dict[str, Any]]] = None,
+) -> RowWriter:
+    """Writer for `fmt` on `out` ('-' = stdout)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown output format {fmt!r}")
+    owns = out != "-"
+    f: IO[str] = open(out, "w", newline="" if fmt == "csv" else None, encoding="utf-8") if owns else sys.stdout
+    if fmt == "csv":
+        return CsvWriter(f, fieldnames, convert, owns=owns)
+    if fmt == "jsonl":
+        return JsonlWriter(f, owns=owns)
+    return JsonArrayWriter(f, owns=owns)
+
+
+class OrderedStream:
+    """Feeds a RowWriter in input order from rows that finish in any order."""
+
+    def __init__(self, writer: RowWriter, total: int, retry_on: Collection[str] = ()) -> None:
+        self.writer = writer
+        self.total = total
+        self.retry_on = retry_on
+        self.next = 0
+        self.replaced = 0
+        self._ready: Dict[int, Dict[str, Any]] = {}
+        # Rows written with a first attempt that is still to be retried.
+        self._retrying: Set[int] = set()
+
+    def put(self, index: int, row: Dict[str, Any]) -> None:
+        """Row `index` was graded; written once all rows before it are.
+
+        A row waiting for a retry is written as is (or, for writers that cannot take
+        replacements, held back); its final version, put again later, is appended.
+        """
+        retrying = row.get("_retry") in self.retry_on
+        if index < self.next:
+            if index in self._retrying and not retrying:
+                self._retrying.discard(index)
+                self.writer.write(row)
+                self.replaced += 1
+            return
+        if retrying:
+            if not self.writer.replaceable:
+                self._ready.pop(index, None)
+                return
+            self._retrying.add(index)
+        self._ready[index] = row
+        while self.next in self._ready:
+            self.writer.write(self._ready.pop(self.next))
+            self.next += 1
+
+    def finish(self, rows: List[Dict[str, Any]]) -> None:
+        """Write whatever is left from `rows` (the final rows); the writer stays open."""
+        for i in sorted(self._retrying):
+            if i < len(rows):
+                self.writer.write(rows[i])
+                self.replaced += 1
+        for i in range(self.next, len(rows)):
+            self.writer.write(rows[i])
+        self.next = len(rows)
+        self._ready.clear()
+        self._retrying.clear()
+
+    def close(self, rows: Optional[List[Dict[str, Any]]] = None) -> None:
+        """finish(rows) if given, then finish the file."""
+        if rows is not None:
+            self.finish(rows)
+        self.writer.close()
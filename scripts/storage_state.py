@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Persistent per-origin storage state (cookies + localStorage) for captures.
+
+Pooled contexts are normally throwaway, so a Cloudflare clearance cookie
+earned on one pen is lost and the next pen is challenged again. A StateStore
+keeps Playwright storage state on disk, one JSON file per site in
+STORE_HOSTS (codepen.io, cdpn.io):
+
+- every context a BrowserPool / AsyncBrowserPool opens starts from the merged
+  state of all files (expired cookies dropped);
+- when the context closes, its state is split by site and merged back into
+  each file under an exclusive lock (fcntl.flock where available), written to
+  a temp file and swapped in with os.replace, so several workers or processes
+  can share one directory. A cookie only replaces a stored one with the same
+  name/domain/path if it expires later.
+
+Challenge rates: the capture helpers tag each page load's resource_policy
+stats with "state" -- 'seeded' (the store held a clearance cookie), 'empty'
+(store enabled, no clearance yet) or 'off' -- and summarize() reports how many
+loads in each group hit a block signal.
+
+Usage (from batch_grade.py):
+  --state-store DIR   load/save storage state in DIR (default: off)
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from urllib.parse import urlparse
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to os.replace atomicity alone
+    fcntl = None  # type: ignore
+
+
+STORE_HOSTS = ("codepen.io", "cdpn.io")
+
+# Cookies that show a Cloudflare challenge was passed.
+CLEARANCE_COOKIES = ("cf_clearance",)
+
+
+def site_for(host: str, hosts: Iterable[str] = STORE_HOSTS) -> Optional[str]:
+    """The STORE_HOSTS entry `host` belongs to ('.codepen.io' -> 'codepen.io'), or None."""
+    host = (host or "").lstrip(".").lower()
+    for site in hosts:
+        if host == site or host.endswith("." + site):
+            return site
+    return None
+
+
+def empty_state() -> Dict[str, Any]:
+    return {"cookies": [], "origins": []}
+
+
+def _live(cookie: Dict[str, Any], now: float) -> bool:
+    expires = cookie.get("expires", -1)
+    return expires is None or expires < 0 or expires > now
+
+
+def _cookie_key(cookie: Dict[str, Any]) -> tuple:
+    return (cookie.get("name"), cookie.get("domain"), cookie.get("path", "/"))
+
+
+def merge_state(stored: Dict[str, Any], fresh: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Any]:
+    """Merge `fresh` into `stored`: later-expiring cookies win, fresh localStorage wins per origin."""
+    now = time.time() if now is None else now
+    cookies: Dict[tuple, Dict[str, Any]] = {}
+    for cookie in stored.get("cookies") or []:
+        if _live(cookie, now):
+            cookies[_cookie_key(cookie)] = cookie
+    for cookie in fresh.get("cookies") or []:
+        if not _live(cookie, now):
+            continue
+        key = _cookie_key(cookie)
+        old = cookies.get(key)
+        # Another worker may have stored a newer copy meanwhile; keep it.
+        if old is not None and 0 <= cookie.get("expires", -1) < old.get("expires", -1):
+            continue
+        cookies[key] = cookie
+    origins = {o.get("origin"): o for o in stored.get("origins") or []}
+    for origin in fresh.get("origins") or []:
+        if origin.get("localStorage"):
+            origins[origin.get("origin")] = origin
+    return {"cookies": list(cookies.values()), "origins": list(origins.values())}
+
+
+def split_by_site(state: Dict[str, Any], hosts: Iterable[str] = STORE_HOSTS) -> Dict[str, Dict[str, Any]]:
+    """Group a context's storage state by STORE_HOSTS site; other hosts are dropped."""
+    out: Dict[str, Dict[str, Any]] = {}
+    for cookie in state.get("cookies") or []:
+        site = site_for(cookie.get("domain", ""), hosts)
+        if site:
+            out.setdefault(site, empty_state())["cookies"].append(cookie)
+    for origin in state.get("origins") or []:
+        site = site_for(urlparse(origin.get("origin", "")).hostname or "", hosts)
+        if site:
+            out.setdefault(site, empty_state())["origins"].append(origin)
+    return out
+
+
+def has_clearance(state: Dict[str, Any]) -> bool:
+    return any(c.get("name") in CLEARANCE_COOKIES for c in state.get("cookies") or [])
+
+
+class StateStore:
+    """Directory of per-site storage-state files shared by every pooled context."""
+
+    def __init__(self, root: str, hosts: Iterable[str] = STORE_HOSTS) -> None:
+        self.root = root
+        self.hosts = tuple(hosts)
+        self.loads = 0
+        self.saves = 0
+
+    def _path(self, site: str) -> str:
+        return os.path.join(self.root, site + ".json")
+
+    def _read(self, site: str) -> Dict[str, Any]:
+        try:
+            with open(self._path(site), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return empty_state()
+        return {"cookies": data.get("cookies") or [], "origins": data.get("origins") or []}
+
+    @contextmanager
+    def _locked(self, site: str) -> Iterator[None]:
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._path(site) + ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def load(self) -> Dict[str, Any]:
+        """Merged storage state of every site, ready for new_context(storage_state=...)."""
+        state = empty_state()
+        for site in self.hosts:
+            state = merge_state(state, self._read(site))
+        self.loads += 1
+        return state
+
+    @staticmethod
+    def label(state: Dict[str, Any]) -> str:
+        """How a context loaded with `state` starts: 'seeded' (clearance cookie) or 'empty'."""
+        return "seeded" if has_clearance(state) else "empty"
+
+    def save(self, state: Dict[str, Any]) -> None:
+        """Merge a closing context's storage state into the per-site files."""
+        for site, fresh in split_by_site(state, self.hosts).items():
+            try:
+                with self._locked(site):
+                    stored = self._read(site)
+                    merged = merge_state(stored, fresh)
+                    if merged == merge_state(stored, empty_state()):
+                        continue
+                    merged["updated"] = time.time()
+                    fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+                    with os.fdopen(fd, "w", encoding="utf-8") as f:
+                        json.dump(merged, f)
+                    os.replace(tmp, self._path(site))
+            except Exception:
+                continue
+            self.saves += 1
+
+
+def note(stats: Optional[Dict[str, Any]], pool: Any, context: Any) -> None:
+    """Tag a page load's resource_policy stats with the state its own `context` was seeded with.
+
+    The label is the one the pool recorded for this context when it loaded the store
+    (pool.state_labels), so concurrent captures never report each other's state.
+    """
+    if stats is None:
+        return
+    if getattr(pool, "state_store", None) is None:
+        stats["state"] = "off"
+        return
+    stats["state"] = getattr(pool, "state_labels", {}).get(id(context), "off")
+
+
+def summarize(nets: Iterable[Optional[Dict[str, Dict[str, Any]]]]) -> str:
+    """Challenge rate per store state across many captures' stats, or '' if none were tagged."""
+    loads: Dict[str, List[int]] = {}
+    for net in nets:
+        for s in (net or {}).values():
+            label = s.get("state")
+            if not label:
+                continue
+            counts = loads.setdefault(label, [0, 0])
+            counts[0] += 1
+            if s.get("aborted"):
+                counts[1] += 1
+    if not loads:
+        return ""
+    names = {"seeded": "with clearance", "empty": "store without clearance", "off": "no store"}
+    parts = [
+        f"{names.get(label, label)} {hit}/{total} ({100.0 * hit / total:.0f}%)"
+        for label, (total, hit) in sorted(loads.items())
+    ]
+    return "challenge rate: " + ", ".join(parts)
+
+
+def add_state_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument('--state-store', metavar='DIR',
+                    help='Keep cookies/localStorage for codepen.io and cdpn.io in DIR across captures and workers')
+
+
+def from_args(args: argparse.Namespace) -> Optional[StateStore]:
+    root = getattr(args, 'state_store', None)
+    return StateStore(root) if root else None
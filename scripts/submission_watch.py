@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Detect new or changed Canvas submission files for `batch_grade.py --watch`.
+
+A Watcher remembers a (size, mtime) signature for every file matching the
+glob in the submissions directory and reports files that are new or whose
+signature changed. It waits on inotify (the optional `inotify_simple`
+package, Linux) for close-write/moved-in events and otherwise polls every
+`interval` seconds; either way the directory scan decides what changed, so
+both modes report the same files. A file must have been left alone for
+`settle` seconds before it is reported, so a download still being written is
+picked up once it is complete.
+
+Install (optional): pip install inotify_simple
+"""
+
+from __future__ import annotations
+
+import glob
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+DEFAULT_INTERVAL_S = 2.0
+DEFAULT_SETTLE_S = 1.0
+
+
+def try_import_inotify():
+    try:
+        import inotify_simple  # type: ignore
+        return inotify_simple
+    except Exception:
+        return None
+
+
+def signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class Watcher:
+    """New/changed files matching `pattern` in `root`, via inotify or polling."""
+
+    def __init__(
+        self,
+        root: str,
+        pattern: str = "*.html",
+        interval: float = DEFAULT_INTERVAL_S,
+        settle: float = DEFAULT_SETTLE_S,
+        use_inotify: bool = True,
+    ) -> None:
+        self.root = root
+        self.pattern = pattern
+        self.interval = max(0.05, interval)
+        self.settle = max(0.0, settle)
+        self.seen: Dict[str, Tuple[int, int]] = {}
+        self._inotify: Any = None
+        mod = try_import_inotify() if use_inotify else None
+        if mod is not None:
+            try:
+                self._inotify = mod.INotify()
+                mask = mod.flags.CLOSE_WRITE | mod.flags.MOVED_TO | mod.flags.CREATE
+                self._inotify.add_watch(root, mask)
+            except OSError:
+                self._inotify = None
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._inotify is not None else f"polling every {self.interval:g} s"
+
+    def mark(self, paths: Iterable[str]) -> None:
+        """Treat `paths` as handled in their current state."""
+        for path in paths:
+            sig = signature(path)
+            if sig is not None:
+                self.seen[path] = sig
+
+    def scan(self) -> Tuple[List[str], bool]:
+        """(settled new/changed files, whether any change is still settling)."""
+        changed: List[str] = []
+        settling = False
+        now = time.time()
+        for path in sorted(glob.glob(os.path.join(self.root, self.pattern))):
+            sig = signature(path)
+            if sig is None or self.seen.get(path) == sig:
+                continue
+            if now - sig[1] / 1e9 < self.settle:
+                settling = True
+                continue
+            self.seen[path] = sig
+            changed.append(path)
+        return changed, settling
+
+    def wait(self, timeout: float) -> None:
+        if self._inotify is not None:
+            self._inotify.read(timeout=int(timeout * 1000))
+        else:
+            time.sleep(timeout)
+
+    def changes(self) -> List[str]:
+        """Block until at least one file is new or changed (and settled); return them."""
+        delay = self.interval
+        while True:
+            changed, settling = self.scan()
+            if changed:
+                return changed
+            self.wait(min(delay, self.settle) if settling else delay)
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
@@ -0,0 +1,73 @@
+"""Tests for batch_grade's retry classification and pen dedup keys (no browser needed)."""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import unittest
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch_grade  # noqa: E402
+
+BLOCK_LINE = "Failed to load resource: the server responded with a status of 403"
+
+
+def cap(chapter: int = 1, url: str = "https://codepen.io/ann/pen/abc", **kw: Any) -> Dict[str, Any]:
+    meta = {"file": "ann_1_link.html", "assignment": f"Ch. {chapter} - Practice", "best_url": url}
+    out: Dict[str, Any] = {"meta": meta, "lines": ["hello", "42"], "steps": ["direct"], "errors": "", "metrics": None}
+    out.update(kw)
+    return out
+
+
+class RetryReasonTest(unittest.TestCase):
+    def test_usable_capture_is_not_retried(self) -> None:
+        self.assertIsNone(batch_grade.retry_reason(cap()))
+
+    def test_navigation_errors(self) -> None:
+        self.assertEqual(batch_grade.retry_reason(cap(lines=[], errors="net::ERR_TIMED_OUT")), "timeout")
+        self.assertEqual(batch_grade.retry_reason(cap(lines=[], errors="Timeout 12000ms exceeded")), "timeout")
+        self.assertEqual(batch_grade.retry_reason(cap(lines=[], errors="net::ERR_NAME_NOT_RESOLVED")), "error")
+
+    def test_blocked_page_without_output(self) -> None:
+        self.assertEqual(batch_grade.retry_reason(cap(lines=[], steps=["direct", "blocked:cloudflare"])), "blocked")
+        self.assertEqual(batch_grade.retry_reason(cap(lines=[BLOCK_LINE])), "blocked")
+
+    def test_block_already_covered_by_fallback_output(self) -> None:
+        steps = ["direct", "blocked:cloudflare", "debug", "simulated"]
+        self.assertIsNone(batch_grade.retry_reason(cap(steps=steps)))
+
+    def test_empty_console_is_incomplete(self) -> None:
+        self.assertEqual(batch_grade.retry_reason(cap(lines=[])), "incomplete")
+
+    def test_unrouted_submissions_are_not_retried(self) -> None:
+        self.assertIsNone(batch_grade.retry_reason(cap(lines=[], url=None, errors="net::ERR_TIMED_OUT")))
+        self.assertIsNone(batch_grade.retry_reason(cap(chapter=99, lines=[], errors="net::ERR_TIMED_OUT")))
+
+    def test_retry_reasons_from_args(self) -> None:
+        ns = argparse.Namespace
+        self.assertEqual(batch_grade.retry_reasons(ns(retries=2, retry_on=None)), ("blocked", "timeout"))
+        self.assertEqual(batch_grade.retry_reasons(ns(retries=2, retry_on=("error",))), ("error",))
+        self.assertEqual(batch_grade.retry_reasons(ns(retries=0, retry_on=None)), ())
+        self.assertEqual(batch_grade.retry_reasons(ns(retries=2, retry_on=None, from_archive="caps")), ())
+
+
+class DedupKeyTest(unittest.TestCase):
+    def test_views_of_one_pen_share_a_key(self) -> None:
+        pen = batch_grade.dedup_key({"best_url": "https://codepen.io/Ann/pen/abc"}, 1)
+        self.assertEqual(batch_grade.dedup_key({"best_url": "https://codepen.io/ann/full/abc?x=1"}, 1), pen)
+
+    def test_capture_parts_and_answers_split_keys(self) -> None:
+        keys = {batch_grade.dedup_key({"best_url": "https://codepen.io/ann/pen/abc"}, ch) for ch in (1, 2, 5, 12)}
+        self.assertEqual(len(keys), 4)
+
+    def test_other_pens_and_non_pen_urls(self) -> None:
+        self.assertNotEqual(batch_grade.dedup_key({"best_url": "https://codepen.io/ann/pen/abc"}, 1),
+                            batch_grade.dedup_key({"best_url": "https://codepen.io/ann/pen/abd"}, 1))
+        self.assertIsNone(batch_grade.dedup_key({"best_url": "https://example.com/abc"}, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+"""Tests for capture_cache: keys, TTL expiry, LRU eviction and thread-safe counters."""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import capture_cache  # noqa: E402
+
+URL = "https://codepen.io/ann/pen/abc"
+
+
+class CaptureCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.root = tempfile.mkdtemp(prefix="capture-cache-")
+        self.addCleanup(shutil.rmtree, self.root, True)
+
+    def cache(self, **kw) -> capture_cache.CaptureCache:
+        return capture_cache.CaptureCache(root=self.root, **kw)
+
+    def entry_path(self, url: str, mode: str = "direct", extra: str = "") -> str:
+        key = capture_cache.cache_key(url, mode, extra)
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def age(self, path: str, seconds: float) -> None:
+        """Move an entry's recorded creation time `seconds` into the past."""
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        entry["created"] -= seconds
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+
+    def test_round_trip_and_key_parts(self) -> None:
+        cache = self.cache()
+        cache.put(URL, "direct", {"lines": ["hi"]}, extra="console")
+        self.assertEqual(cache.get(URL + "/?x=1#top", "direct", extra="console"), {"lines": ["hi"]})
+        self.assertIsNone(cache.get(URL, "debug", extra="console"))
+        self.assertIsNone(cache.get(URL, "direct", extra="dom"))
+        self.assertEqual((cache.hits, cache.misses, cache.writes), (1, 2, 1))
+
+    def test_expired_entry_is_a_miss_and_removed(self) -> None:
+        cache = self.cache(ttl=60)
+        cache.put(URL, "direct", {"lines": ["hi"]})
+        path = self.entry_path(URL)
+        self.age(path, 30)
+        self.assertTrue(cache.contains(URL, "direct"))
+        self.age(path, 60)
+        self.assertFalse(cache.contains(URL, "direct"))
+        self.assertIsNone(cache.get(URL, "direct"))
+        self.assertFalse(os.path.exists(path))
+
+    def test_zero_ttl_never_expires(self) -> None:
+        cache = self.cache(ttl=0)
+        cache.put(URL, "direct", {"lines": ["hi"]})
+        self.age(self.entry_path(URL), 10 * 365 * 86400)
+        self.assertEqual(cache.get(URL, "direct"), {"lines": ["hi"]})
+
+    def test_refresh_ignores_entries_but_stores(self) -> None:
+        cache = self.cache(refresh=True)
+        cache.put(URL, "direct", {"lines": ["hi"]})
+        self.assertIsNone(cache.get(URL, "direct"))
+        self.assertFalse(cache.contains(URL, "direct"))
+        self.assertEqual(self.cache().get(URL, "direct"), {"lines": ["hi"]})
+
+    def test_evict_drops_least_recently_used_first(self) -> None:
+        cache = self.cache(max_bytes=0)
+        urls = [f"https://codepen.io/ann/pen/p{i}" for i in range(3)]
+        now = time.time()
+        for i, url in enumerate(urls):
+            cache.put(url, "direct", {"lines": ["x" * 100]})
+            os.utime(self.entry_path(url), (now - 300 + i * 100, now - 300 + i * 100))
+        # A hit makes the oldest entry the most recently used one.
+        self.assertIsNotNone(cache.get(urls[0], "direct"))
+        size = os.path.getsize(self.entry_path(urls[0]))
+        cache.max_bytes = 2 * size + size // 2
+        self.assertEqual(cache.evict(), 1)
+        self.assertEqual([os.path.exists(self.entry_path(u)) for u in urls], [True, False, True])
+
+    def test_put_evicts_past_max_bytes(self) -> None:
+        cache = self.cache()
+        cache.put("https://codepen.io/ann/pen/p0", "direct", {"lines": ["x" * 100]})
+        size = os.path.getsize(self.entry_path("https://codepen.io/ann/pen/p0"))
+        cache.max_bytes = 2 * size + size // 2
+        old = time.time() - 100
+        os.utime(self.entry_path("https://codepen.io/ann/pen/p0"), (old, old))
+        cache.put("https://codepen.io/ann/pen/p1", "direct", {"lines": ["x" * 100]})
+        cache.put("https://codepen.io/ann/pen/p2", "direct", {"lines": ["x" * 100]})
+        self.assertFalse(os.path.exists(self.entry_path("https://codepen.io/ann/pen/p0")))
+        self.assertTrue(os.path.exists(self.entry_path("https://codepen.io/ann/pen/p2")))
+
+    def test_evict_removes_expired_entries_under_the_size_limit(self) -> None:
+        cache = self.cache(ttl=60)
+        cache.put(URL, "direct", {"lines": ["hi"]})
+        self.age(self.entry_path(URL), 120)
+        self.assertEqual(cache.evict(), 1)
+
+    def test_counters_are_exact_across_threads(self) -> None:
+        cache = self.cache()
+        cache.put(URL, "direct", {"lines": ["hi"]})
+
+        def work() -> None:
+            for _ in range(50):
+                cache.get(URL, "direct")
+                cache.get(URL, "debug")
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual((cache.hits, cache.misses), (400, 400))
+
+
+if __name__ == "__main__":
+    unittest.main()
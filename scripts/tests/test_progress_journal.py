@@ -0,0 +1,60 @@
+"""Tests for progress_journal.Journal: recording, pending rows and resuming."""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import progress_journal  # noqa: E402
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.mkdtemp(prefix="journal-")
+        self.addCleanup(shutil.rmtree, self.dir, True)
+        self.files = []
+        for name in ("a_1_link.html", "b_2_link.html"):
+            path = os.path.join(self.dir, name)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(name)
+            self.files.append(path)
+        self.journal = progress_journal.Journal(os.path.join(self.dir, "out.journal"))
+
+    def lines(self):
+        with open(self.journal.path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_internal_keys_are_not_journaled(self) -> None:
+        self.journal.record(self.files[0], {"file": "a_1_link.html", "total": 5, "_retry": None})
+        self.assertEqual(self.lines()[0]["row"], {"file": "a_1_link.html", "total": 5})
+
+    def test_pending_rows_are_not_resumed(self) -> None:
+        self.journal.record(self.files[0], {"total": 0, "_retry": "blocked"}, pending=True)
+        self.journal.record(self.files[1], {"total": 7})
+        self.assertEqual(self.journal.completed(self.files), {1: {"total": 7}})
+        self.assertEqual(self.journal.recorded, 1)
+
+    def test_changed_file_and_truncated_line_are_skipped(self) -> None:
+        self.journal.record(self.files[0], {"total": 5})
+        self.journal.record(self.files[1], {"total": 7})
+        with open(self.files[0], "a", encoding="utf-8") as f:
+            f.write("resubmitted")
+        with open(self.journal.path, "a", encoding="utf-8") as f:
+            f.write('{"file": "a_1_link.html", "sha2')
+        self.assertEqual(self.journal.completed(self.files), {1: {"total": 7}})
+
+    def test_compact_keeps_one_public_row_per_file(self) -> None:
+        self.journal.record(self.files[0], {"total": 1})
+        self.journal.record(self.files[0], {"total": 5})
+        self.journal.compact(self.files, [{"total": 5, "_retry": None}, {"total": 7}])
+        self.assertEqual([e["row"] for e in self.lines()], [{"total": 5}, {"total": 7}])
+
+
+if __name__ == "__main__":
+    unittest.main()
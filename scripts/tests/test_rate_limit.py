@@ -0,0 +1,61 @@
+"""Tests for rate_limit: token buckets and splitting the limits among worker processes."""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rate_limit  # noqa: E402
+
+
+def args(**kw) -> argparse.Namespace:
+    values = dict(throttle=True, host_rate=[], per_host=rate_limit.DEFAULT_CONCURRENT)
+    values.update(kw)
+    return argparse.Namespace(**values)
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_then_paced(self) -> None:
+        bucket = rate_limit.TokenBucket(rate=2.0, burst=2)
+        now = bucket.stamp
+        self.assertEqual([bucket.reserve(now), bucket.reserve(now)], [0.0, 0.0])
+        self.assertAlmostEqual(bucket.reserve(now), 0.5)
+        self.assertAlmostEqual(bucket.reserve(now), 1.0)
+
+    def test_penalize_halves_rate_and_pauses(self) -> None:
+        bucket = rate_limit.TokenBucket(rate=1.0, burst=3)
+        now = bucket.stamp
+        self.assertEqual(bucket.penalize(now), rate_limit.BACKOFF_S)
+        self.assertEqual(bucket.rate, 0.5)
+        self.assertAlmostEqual(bucket.reserve(now), rate_limit.BACKOFF_S)
+        bucket.reward()
+        self.assertEqual((bucket.strikes, bucket.rate), (0, 0.5 + rate_limit.RATE_STEP))
+
+
+class ConfigureFromArgsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.addCleanup(rate_limit.configure, rate_limit.get_throttle())
+
+    def test_share_divides_rates_burst_and_per_host(self) -> None:
+        throttle = rate_limit.configure_from_args(args(per_host=8, host_rate=[{"codepen.io": 4.0}]), share=4)
+        self.assertIs(rate_limit.get_throttle(), throttle)
+        self.assertEqual(throttle.buckets["codepen.io"].rate, 1.0)
+        self.assertEqual(throttle.buckets["cdpn.io"].rate, rate_limit.DEFAULT_RATES["cdpn.io"] / 4)
+        self.assertEqual(throttle.buckets["codepen.io"].burst, rate_limit.DEFAULT_BURST / 4)
+        self.assertEqual(throttle.max_concurrent, 2)
+
+    def test_each_worker_keeps_one_load(self) -> None:
+        throttle = rate_limit.configure_from_args(args(per_host=2), share=8)
+        self.assertEqual(throttle.max_concurrent, 1)
+
+    def test_no_throttle(self) -> None:
+        self.assertIsNone(rate_limit.configure_from_args(args(throttle=False)))
+        self.assertIsNone(rate_limit.get_throttle())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+"""Tests for retry_queue.RetryQueue: backoff, attempt budget and retry rounds."""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import unittest
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import retry_queue  # noqa: E402
+
+
+class RetryQueueTest(unittest.TestCase):
+    def test_backoff_doubles_up_to_max_delay(self) -> None:
+        queue = retry_queue.RetryQueue(base_delay=5, max_delay=12)
+        self.assertEqual([queue.delay(n) for n in (1, 2, 3, 4)], [5, 10, 12, 12])
+
+    def test_attempt_budget(self) -> None:
+        queue = retry_queue.RetryQueue(max_attempts=2, base_delay=0)
+        self.assertTrue(queue.push("a", 1, "blocked"))
+        self.assertFalse(queue.push("a", 2, "blocked"))
+        self.assertEqual((queue.pushed, queue.gave_up, len(queue)), (1, 1, 1))
+
+    def test_rounds_group_by_attempt_and_wait_for_the_last_due(self) -> None:
+        queue = retry_queue.RetryQueue(max_attempts=4, base_delay=1)
+        queue.push("a", 1, "blocked")
+        queue.push("b", 2, "timeout")
+        queue.push("c", 1, "timeout")
+        slept: List[float] = []
+        first = queue.pop_round(sleep=slept.append)
+        self.assertEqual(first, [("a", 2, "blocked"), ("c", 2, "timeout")])
+        self.assertEqual(len(slept), 1)
+        self.assertTrue(0 < slept[0] <= 1)
+        self.assertEqual(queue.pop_round(sleep=slept.append), [("b", 3, "timeout")])
+        self.assertEqual(queue.pop_round(sleep=slept.append), [])
+
+    def test_parse_reasons(self) -> None:
+        self.assertEqual(retry_queue.parse_reasons("blocked, error"), ("blocked", "error"))
+        with self.assertRaises(argparse.ArgumentTypeError):
+            retry_queue.parse_reasons("blocked,flaky")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+"""Tests for row_writer.OrderedStream: input order, pending retries and replacement rows."""
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import sys
+import unittest
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import row_writer  # noqa: E402
+
+RETRY_ON = ("blocked", "timeout")
+
+
+def row(name: str, retry: Any = None) -> Dict[str, Any]:
+    return {"file": name, "total": 0 if retry else 10, "_retry": retry}
+
+
+class OrderedStreamTest(unittest.TestCase):
+    def stream(self, total: int, writer_cls: Any = row_writer.JsonlWriter) -> row_writer.OrderedStream:
+        self.out = io.StringIO()
+        return row_writer.OrderedStream(writer_cls(self.out), total, retry_on=RETRY_ON)
+
+    def written(self) -> List[Dict[str, Any]]:
+        return [json.loads(line) for line in self.out.getvalue().splitlines()]
+
+    def test_rows_are_written_in_input_order(self) -> None:
+        stream = self.stream(3)
+        stream.put(2, row("c"))
+        stream.put(1, row("b"))
+        self.assertEqual(self.written(), [])
+        stream.put(0, row("a"))
+        self.assertEqual([r["file"] for r in self.written()], ["a", "b", "c"])
+
+    def test_pending_retry_does_not_hold_back_later_rows(self) -> None:
+        stream = self.stream(3)
+        stream.put(0, row("a", retry="blocked"))
+        stream.put(1, row("b"))
+        stream.put(2, row("c"))
+        self.assertEqual([r["file"] for r in self.written()], ["a", "b", "c"])
+        stream.put(0, row("a"))
+        self.assertEqual([(r["file"], r["total"]) for r in self.written()],
+                         [("a", 0), ("b", 10), ("c", 10), ("a", 10)])
+        self.assertEqual(stream.replaced, 1)
+        self.assertTrue(all("_retry" not in r for r in self.written()))
+
+    def test_requeued_row_is_only_appended_once_final(self) -> None:
+        stream = self.stream(1)
+        stream.put(0, row("a", retry="timeout"))
+        stream.put(0, row("a", retry="timeout"))
+        self.assertEqual(len(self.written()), 1)
+        stream.finish([row("a")])
+        self.assertEqual([(r["file"], r["total"]) for r in self.written()], [("a", 0), ("a", 10)])
+        self.assertEqual(stream.replaced, 1)
+
+    def test_reason_not_retried_is_final(self) -> None:
+        stream = self.stream(2)
+        stream.put(0, row("a", retry="incomplete"))
+        stream.put(1, row("b"))
+        stream.finish([row("a", retry="incomplete"), row("b")])
+        self.assertEqual([r["file"] for r in self.written()], ["a", "b"])
+        self.assertEqual(stream.replaced, 0)
+
+    def test_finish_writes_rows_never_put(self) -> None:
+        stream = self.stream(3)
+        stream.put(1, row("b"))
+        stream.finish([row("a"), row("b"), row("c")])
+        self.assertEqual([r["file"] for r in self.written()], ["a", "b", "c"])
+
+    def test_json_array_holds_pending_row_for_its_final_version(self) -> None:
+        stream = self.stream(2, row_writer.JsonArrayWriter)
+        stream.put(0, row("a", retry="blocked"))
+        stream.put(1, row("b"))
+        self.assertEqual(self.out.getvalue(), "")
+        stream.put(0, row("a"))
+        stream.close()
+        final = [row_writer.public(row("a")), row_writer.public(row("b"))]
+        self.assertEqual(self.out.getvalue(), json.dumps(final, indent=2))
+        self.assertEqual(stream.replaced, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()